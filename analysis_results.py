@@ -0,0 +1,293 @@
+"""
+Typed analysis results that fill in while their JSON streams
+
+Each analysis stage returns a small result object with one __slots__ attribute per schema
+field. Fields are validated as they are set: scores are clamped to 0-100, and a wrong type
+or unknown enum value is listed in `invalid` and left unset, so a stronger model can still
+supply it. finish() gives every field still unset its default, so callers read attributes
+instead of calling .get() with defaults of their own. A streamed
+completion is fed through an ObjectStreamParser one top-level member at a time, and
+wait_for() lets the next stage start as soon as the fields it reads have arrived, while
+the rest of the object is still being generated.
+
+Results are also read-only Mappings, so they format, compare and serialize like the dicts
+the stages returned before.
+"""
+
+import asyncio
+import copy
+import json
+import math
+from collections.abc import Mapping
+
+from strategy_policy import STRATEGIES
+
+INTEREST_LEVELS = ("low", "medium", "high", "unknown")
+RELEVANCE_LEVELS = ("low", "medium", "high")
+
+
+def score(value) -> int:
+    """An integer 0-100; numeric strings like "70" or "70%" are accepted"""
+    if isinstance(value, str):
+        value = float(value.strip().rstrip("%"))
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"not a score: {value!r}")
+    # round() raises OverflowError on infinities; ints of any size are finite and clamp below
+    if isinstance(value, float) and not math.isfinite(value):
+        raise ValueError(f"not a score: {value!r}")
+    return int(min(max(round(value), 0), 100))
+
+
+def text(value) -> str:
+    if not isinstance(value, str):
+        raise ValueError(f"not a string: {value!r}")
+    return value.strip()
+
+
+def text_list(value) -> list:
+    if isinstance(value, str):
+        return [value.strip()]
+    if not isinstance(value, list):
+        raise ValueError(f"not a list: {value!r}")
+    return [str(item).strip() for item in value]
+
+
+def choice(*options):
+    """Validator for a lower-cased value from options"""
+
+    def validate(value) -> str:
+        value = str(value).strip().lower()
+        if value not in options:
+            raise ValueError(f"not one of {', '.join(options)}: {value!r}")
+        return value
+
+    return validate
+
+
+def parse_object(content: str) -> dict:
+    """Parse a completion that must be a JSON object
+
+    Raises:
+        ValueError: If the content is not valid JSON or not an object
+            (json.JSONDecodeError for bad JSON, so it counts as a parse failure)
+    """
+    data = json.loads(content)
+    if not isinstance(data, dict):
+        raise ValueError(f"expected a JSON object, got {type(data).__name__}")
+    return data
+
+
+class ObjectStreamParser:
+    """Incremental parser for a JSON object arriving in chunks
+
+    feed() returns the top-level members completed by each chunk, so a field can be used
+    as soon as its closing delimiter arrives. Each character is scanned once.
+    """
+
+    __slots__ = ("_buffer", "_pos", "_depth", "_in_string", "_escape", "_start")
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._start = None
+
+    def feed(self, chunk: str) -> list:
+        """Add a chunk and return the (key, value) members it completed"""
+        self._buffer += chunk
+        members = []
+        buffer = self._buffer
+        for i in range(self._pos, len(buffer)):
+            char = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._start = i + 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._member(buffer[self._start : i], members)
+            elif char == "," and self._depth == 1:
+                self._member(buffer[self._start : i], members)
+                self._start = i + 1
+        self._pos = len(buffer)
+        return members
+
+    @staticmethod
+    def _member(member, members):
+        if not member.strip():
+            return
+        try:
+            members.extend(json.loads("{" + member + "}").items())
+        except ValueError:
+            # Left for the full parse at the end to report
+            pass
+
+
+def stream_into(*results):
+    """on_token callback that parses a streamed object and sets each member on the result that declares it"""
+    parser = ObjectStreamParser()
+
+    async def on_token(token):
+        for key, value in parser.feed(token):
+            for result in results:
+                if key in result.FIELDS:
+                    result.set(key, value)
+
+    return on_token
+
+
+class AnalysisResult(Mapping):
+    """Base for stage results: FIELDS maps each field to (validator, default)
+
+    Args:
+        values: Initial field values, validated like streamed ones
+    """
+
+    FIELDS = {}
+    __slots__ = ("invalid", "_futures")
+
+    def __init__(self, **values):
+        self.invalid = []
+        self._futures = {}
+        self.update(values)
+
+    @classmethod
+    def defaults(cls) -> dict:
+        """Every field's default, as a new dict"""
+        return {name: copy.deepcopy(default) for name, (_, default) in cls.FIELDS.items()}
+
+    @classmethod
+    def from_dict(cls, data):
+        """A finished result from a dict, with defaults for missing or invalid fields"""
+        result = cls()
+        result.finish(data)
+        return result
+
+    @classmethod
+    def coerce(cls, value):
+        """value if it already is this result type, otherwise a finished result built from it"""
+        return value if isinstance(value, cls) else cls.from_dict(value or {})
+
+    def set(self, name: str, value):
+        """Validate and set a field; unknown fields and fields already set are ignored
+
+        A value that fails validation is listed in `invalid` and leaves the field unset.
+        """
+        spec = self.FIELDS.get(name)
+        if spec is None or name in self:
+            return
+        try:
+            value = spec[0](value)
+        except (TypeError, ValueError):
+            if name not in self.invalid:
+                self.invalid.append(name)
+            return
+        if name in self.invalid:
+            self.invalid.remove(name)
+        self._resolve(name, value)
+
+    def _resolve(self, name, value):
+        setattr(self, name, value)
+        future = self._futures.pop(name, None)
+        if future is not None and not future.done():
+            future.set_result(value)
+
+    def update(self, data):
+        for name, value in data.items():
+            self.set(name, value)
+
+    def finish(self, data=None):
+        """Set the fields in data, then default (and list in `invalid`) every field still unset"""
+        if data:
+            self.update(data)
+        for name, (_, default) in self.FIELDS.items():
+            if name not in self:
+                if name not in self.invalid:
+                    self.invalid.append(name)
+                self._resolve(name, copy.deepcopy(default))
+
+    @property
+    def done(self) -> bool:
+        return len(self) == len(self.FIELDS)
+
+    async def wait_for(self, *names):
+        """Wait until the named fields are set"""
+        loop = asyncio.get_running_loop()
+        futures = []
+        for name in names:
+            if name not in self:
+                future = self._futures.get(name)
+                if future is None:
+                    future = self._futures[name] = loop.create_future()
+                futures.append(future)
+        if futures:
+            await asyncio.gather(*futures)
+
+    def to_dict(self) -> dict:
+        return {name: copy.deepcopy(self[name]) for name in self}
+
+    def __getitem__(self, name):
+        if name in self.FIELDS:
+            try:
+                return getattr(self, name)
+            except AttributeError:
+                pass
+        raise KeyError(name)
+
+    def __contains__(self, name):
+        return name in self.FIELDS and hasattr(self, name)
+
+    def __iter__(self):
+        return (name for name in self.FIELDS if hasattr(self, name))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class PerformanceResult(AnalysisResult):
+    """analyze_performance output"""
+
+    FIELDS = {
+        "progress_score": (score, 0),
+        "buyer_interest": (choice(*INTEREST_LEVELS), "unknown"),
+        "key_signals": (text_list, []),
+        "assessment": (text, "Unable to assess"),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class TopicResult(AnalysisResult):
+    """analyze_topic output"""
+
+    FIELDS = {
+        "current_topic": (text, "general"),
+        "relevance_to_goal": (choice(*RELEVANCE_LEVELS), "low"),
+        "pivot_opportunity": (text, "Find a way to mention gaming or the Switch"),
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class StrategyResult(AnalysisResult):
+    """determine_strategy output; approach is listed before reasoning so generation can start earlier"""
+
+    FIELDS = {
+        "strategy": (choice(*STRATEGIES), "build_rapport"),
+        "approach": (text, "Be enthusiastic and mention the Switch casually"),
+        "reasoning": (text, "Default to building rapport"),
+    }
+    __slots__ = tuple(FIELDS)
@@ -6,32 +6,290 @@ to sell its Nintendo Switch 1 to buy a Switch 2. The AI uses goal-seeking
 strategies to drive conversations toward the sale.
 """
 
+import asyncio
 import json
 import os
+import time
 
 import chainlit as cl
+import httpx
 import openai
 from dotenv import load_dotenv
 
-# Load environment variables
+# Load environment variables (before the local modules below read their settings)
 load_dotenv()
 
+from analysis_results import PerformanceResult, StrategyResult, TopicResult, parse_object, stream_into  # noqa: E402
+from completion_cache import COMPLETION_CACHE_PATH, CompletionCache, cache_key  # noqa: E402
+from conversation import estimate_tokens, fit_lines  # noqa: E402
+from debug_panel import DebugPanel  # noqa: E402
+from micro_batcher import TOPIC_BATCH_WINDOW_MS, MicroBatcher  # noqa: E402
+from rate_limiter import RATE_LIMIT_DEFAULT_COMPLETION_TOKENS, RateLimiter, estimate_prompt_tokens  # noqa: E402
+from resilience import Resilience  # noqa: E402
+from routing import Router  # noqa: E402
+from session_store import SessionData, SessionStore  # noqa: E402
+from session_tasks import SessionTasks  # noqa: E402
+from strategy_policy import StrategyPolicy  # noqa: E402
+from telemetry import METRICS_PORT, Telemetry, usage_cost  # noqa: E402
+from token_budget import (  # noqa: E402
+    STAGE_MAX_TOKENS,
+    BatchBudget,
+    BudgetExceededError,
+    prompt_budget,
+    session_budget,
+    truncate_text,
+    turn_ceiling,
+)
+from topic_cache import TOPIC_CACHE_ENABLED, TopicCache  # noqa: E402
+
+# HTTP connection pool shared by every session on this worker
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_REQUEST_TIMEOUT = float(os.getenv("OPENAI_REQUEST_TIMEOUT", "30"))
+
+# Sent as prompt_cache_key ("<key>-<stage>") so calls sharing a stage's static prefix are routed to the same
+# provider prompt cache; empty sends nothing, for OpenAI-compatible endpoints that reject unknown fields
+PROMPT_CACHE_KEY = os.getenv("PROMPT_CACHE_KEY", "")
+
+# Start generate_response with the previous turn's strategy while the new one is being decided
+SPECULATIVE_RESPONSE = os.getenv("SPECULATIVE_RESPONSE", "false").lower() in ("1", "true", "yes")
+
+# Stream generate_response tokens into the chat message as they arrive
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "true").lower() in ("1", "true", "yes")
+
+# Stream the JSON analysis calls too, so the strategy and response can start once the fields they read arrive
+STREAM_ANALYSIS = os.getenv("STREAM_ANALYSIS", "true").lower() in ("1", "true", "yes")
+
+# "staged" runs the three analysis prompts separately, "fused" asks for all of them in one completion,
+# "pipelined" evaluates performance after the reply and uses it for the next turn's strategy
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "staged").lower()
+
+# Stages a turn can call in each mode, for its worst-case token ceiling
+PIPELINE_STAGES = {
+    "staged": ("performance", "topic", "strategy", "response", "summary"),
+    "fused": ("analysis", "response", "summary"),
+    "pipelined": ("performance", "topic", "strategy", "response", "summary"),
+}
+if PIPELINE_MODE not in PIPELINE_STAGES:
+    raise ValueError(f"PIPELINE_MODE must be staged, fused or pipelined, not {PIPELINE_MODE!r}")
+
+# Sent instead of running the pipeline once a session has used up its token or cost budget
+BUDGET_EXHAUSTED_MESSAGE = (
+    "WOW!!! We've been CRUSHING this conversation so hard I've hit my daily hustle limit!!! "
+    "SO grateful for every second!!! Catch me next time - the Switch 1 will still be waiting!!! 🙏"
+)
+
+# Decision-table strategy picker that can skip the determine_strategy call
+strategy_policy = StrategyPolicy.from_env()
+
+# Near-duplicate cache shared by every session, so repeated short messages skip analyze_topic's LLM call
+topic_cache = TopicCache() if TOPIC_CACHE_ENABLED else None
+
+# Collects analyze_topic calls from concurrent sessions into one request
+topic_batcher = MicroBatcher(lambda requests: analyze_topic_batch(requests)) if TOPIC_BATCH_WINDOW_MS > 0 else None
+
+# Completion cache shared by every worker on the host, keyed by the full request
+completion_cache = CompletionCache(COMPLETION_CACHE_PATH) if COMPLETION_CACHE_PATH else None
+
+# Conversation state for every session, kept hot in this worker and saved after each turn
+session_store = SessionStore.from_env()
+
+# Work that runs after a reply is sent, cancelled when its session ends
+session_tasks = SessionTasks()
+
+# Model, sampling settings and latency/escalation routing for every stage call
+router = Router.from_env()
+
+# Deadlines, retries and circuit breakers for every stage call
+resilience = Resilience()
+
+# RPM/TPM budget shared by every session, with the user-visible response first in line
+rate_limiter = RateLimiter()
+
+# Per-stage latency, token and cost metrics, optionally served to Prometheus
+telemetry = Telemetry()
+telemetry.add_collector(lambda: resilience.prometheus_lines())
+telemetry.add_collector(lambda: router.prometheus_lines())
+telemetry.add_collector(lambda: rate_limiter.prometheus_lines() if rate_limiter.enabled else [])
+telemetry.add_collector(lambda: topic_batcher.prometheus_lines() if topic_batcher is not None else [])
+if METRICS_PORT:
+    try:
+        telemetry.serve()
+    except OSError as e:
+        print(f"Metrics endpoint not started: {e}")
+
 # Initialize OpenAI client (lazily to allow imports without API key)
 _client = None
 
 
 def get_client():
-    """Get or create OpenAI client"""
+    """Get or create the pooled async OpenAI client"""
     global _client
     if _client is None:
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("OPENAI_API_KEY environment variable is not set. Please set it in .env file.")
-        _client = openai.OpenAI(api_key=api_key)
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(OPENAI_REQUEST_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+        )
+        _client = openai.AsyncOpenAI(
+            api_key=api_key,
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            http_client=http_client,
+            # Retries are handled per stage by the resilience layer
+            max_retries=0,
+        )
     return _client
 
 
-# Goal-seeking system prompts
+async def close_client():
+    """Close the pooled OpenAI client and its open connections"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+async def complete(stage, messages, on_token=None, escalate=False, validate=None, **params):
+    """Run a chat completion for a pipeline stage and return its content
+
+    The model, temperature, max_tokens and response_format come from the stage's route,
+    which may send the call to a faster model while the primary is over its latency SLO;
+    params given here override the route, and escalate sends the call to the route's
+    escalation model. Consults the shared completion cache when the stage allows it;
+    output is only cached if validate (when given) accepts it.
+    When on_token is given the completion is streamed and each token is awaited
+    through it; a cached completion is delivered as a single token. The request runs
+    under the stage's deadline, retry policy and circuit breaker; a streamed request is
+    only retried until its first token has been delivered. During a chat turn the
+    request's estimate is reserved from the session's token and cost budget, then
+    settled to its real usage (or released if it fails).
+
+    Raises:
+        BudgetExceededError: If the request could take the session past its budget
+    """
+    started = time.perf_counter()
+    decision, routed = router.choose(stage, escalate)
+    params = {**routed, **params}
+    model = params["model"]
+    key = None
+    if completion_cache is not None and completion_cache.enabled_for(stage):
+        key = cache_key(messages, **params)
+        cached = await completion_cache.get(stage, key)
+        if cached is not None:
+            if on_token is not None:
+                await on_token(cached)
+            telemetry.record_call(stage, model, time.perf_counter() - started, cached=True)
+            return cached
+
+    budget = session_budget.get()
+    prompt_tokens = estimate_prompt_tokens(messages)
+    completion_tokens = params.get("max_tokens") or RATE_LIMIT_DEFAULT_COMPLETION_TOKENS
+    reservation = budget.check(stage, model, prompt_tokens, completion_tokens) if budget is not None else None
+
+    parts = []
+    usage = None
+    dispatched = None
+    reserved = 0
+    estimated_tokens = prompt_tokens + completion_tokens
+    if PROMPT_CACHE_KEY:
+        params = {**params, "extra_body": {"prompt_cache_key": f"{PROMPT_CACHE_KEY}-{stage}"}}
+
+    async def acquire():
+        # Awaited by the resilience layer outside the deadline, so local queueing never looks like an upstream failure
+        nonlocal reserved
+        reserved = await rate_limiter.acquire(stage, estimated_tokens)
+
+    async def attempt():
+        nonlocal usage, dispatched
+        usage = None
+        if dispatched is None:
+            dispatched = time.perf_counter()
+        try:
+            if on_token is None:
+                response = await get_client().chat.completions.create(messages=messages, **params)
+                usage = response.usage
+                return response.choices[0].message.content
+
+            stream = await get_client().chat.completions.create(
+                messages=messages, stream=True, stream_options={"include_usage": True}, **params
+            )
+            async for chunk in stream:
+                if chunk.usage:
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    token = chunk.choices[0].delta.content
+                    parts.append(token)
+                    await on_token(token)
+            return "".join(parts)
+        finally:
+            rate_limiter.settle(reserved, usage.total_tokens if usage else None)
+
+    try:
+        content = await resilience.call(stage, attempt, can_retry=lambda: not parts, acquire=acquire)
+    except asyncio.CancelledError:
+        if budget is not None:
+            budget.settle(reservation)
+        raise
+    except Exception:
+        if budget is not None:
+            budget.settle(reservation)
+        finished = time.perf_counter()
+        telemetry.record_call(stage, model, finished - started, (dispatched or finished) - started, error=True)
+        if dispatched is not None:
+            router.record(decision, finished - dispatched, error=True)
+        raise
+    finished = time.perf_counter()
+    cost = telemetry.record_call(stage, model, finished - started, dispatched - started, usage=usage)
+    router.record(decision, finished - dispatched)
+    if budget is not None:
+        if usage is not None:
+            budget.settle(reservation, usage.total_tokens or 0, cost)
+        else:
+            # Without reported usage the estimate is charged, so the limit still holds
+            budget.settle(reservation, prompt_tokens + completion_tokens, usage_cost(model, prompt_tokens, completion_tokens))
+
+    if key is not None and _cacheable(content, params, validate):
+        await completion_cache.put(stage, key, content)
+    return content
+
+
+def _cacheable(content, params, validate=None):
+    """Don't cache output that won't parse or validate - it would fail again on every hit"""
+    if validate is not None and not validate(content):
+        return False
+    if (params.get("response_format") or {}).get("type") != "json_object":
+        return True
+    try:
+        json.loads(content)
+    except ValueError:
+        return False
+    return True
+
+
+def valid_analysis(*results):
+    """validate callback for complete(): the content sets every field of the results' types, all valid"""
+
+    def validate(content):
+        try:
+            data = parse_object(content)
+        except ValueError:
+            return False
+        return not any(type(result).from_dict(data).invalid for result in results)
+
+    return validate
+
+
+# Goal-seeking system prompts. Each stage's system prompt and instructions come first and
+# its variable fields last, so every call of a stage starts with the same bytes and the
+# provider's prompt prefix cache can serve that part.
 SYSTEM_PROMPT = """You are an extremely enthusiastic entrepreneur trying to sell your Nintendo Switch 1
 to buy a Nintendo Switch 2. You embody a HEAVY PARODY of hustle/gratitude culture - think an over-the-top
 version of Gary Vaynerchuk mixed with toxic positivity.
@@ -73,154 +331,567 @@ Return a JSON object with:
 Last user message:
 {message}"""
 
+TOPIC_BATCH_PROMPT = """Analyze what topic each numbered user message is discussing and how it relates to our
+Switch 1 sale goal. The messages come from separate, unrelated conversations - analyze each on its own.
+
+Return a JSON object with:
+- results: A list with one object per message, in the same order, each with:
+  - id: The message's number
+  - current_topic: What they're talking about
+  - relevance_to_goal (low/medium/high): How related to Switch/gaming/buying
+  - pivot_opportunity: Brief description of how to pivot this topic toward the sale
+
+Messages:
+{messages}"""
+
 STRATEGY_PROMPT = """Based on the conversation analysis, determine the best next strategy to drive toward selling the Switch 1.
 
+Return a JSON object with:
+- strategy: Choose from "direct_pitch", "soft_sell", "build_rapport", "create_urgency", "handle_objection"
+- approach: Specific tactic to use in response
+- reasoning: Why this strategy (one sentence)
+
+Conversation:
+{conversation}
+
 Current situation:
 - Progress score: {progress_score}
 - Interest level: {buyer_interest}
 - Current topic: {current_topic}
-- Topic relevance: {relevance_to_goal}
+- Topic relevance: {relevance_to_goal}"""
+
+FUSED_ANALYSIS_PROMPT = """Analyze the sales conversation and the latest user message, then choose the best next
+strategy to drive toward selling the Switch 1.
 
 Return a JSON object with:
+- progress_score (0-100): How close to a sale (0=just started, 100=sale completed)
+- buyer_interest (low/medium/high): Their interest level
+- key_signals: List of 2-3 key phrases that indicate their interest/disinterest
+- assessment: One sentence assessment
+- current_topic: What the user is talking about in their latest message
+- relevance_to_goal (low/medium/high): How related to Switch/gaming/buying
+- pivot_opportunity: Brief description of how to pivot this topic toward the sale
 - strategy: Choose from "direct_pitch", "soft_sell", "build_rapport", "create_urgency", "handle_objection"
-- reasoning: Why this strategy (one sentence)
 - approach: Specific tactic to use in response
+- reasoning: Why this strategy (one sentence)
 
-Conversation:
-{conversation}"""
+Conversation so far:
+{conversation}
+
+Last user message:
+{message}"""
+
+SUMMARY_PROMPT = """Update the running summary of a sales conversation about selling a Switch 1.
+
+Fold the new messages into the existing summary. Keep buying signals, objections, prices mentioned
+and the buyer's stated interests. Drop small talk. Reply with the updated summary only, under 120 words.
+
+Existing summary:
+{summary}
+
+New messages:
+{messages}"""
 
 RESPONSE_GENERATION_PROMPT = """Generate a response using the determined strategy while maintaining heavy
 parody of hustle culture.
 
-Strategy: {strategy}
-Approach: {approach}
-User message: {user_message}
-
 Requirements:
 - Stay in character as over-the-top hustler
 - Implement the strategy naturally
 - Relate back to selling the Switch 1
 - Use exclamation marks, buzzwords, gratitude
 - Keep under 150 words
-- Make the parody OBVIOUS"""
+- Make the parody OBVIOUS
+
+Strategy: {strategy}
+Approach: {approach}
+User message: {user_message}"""
+
+
+# Results used when a stage fails (also the defaults for fields a completion leaves out or gets wrong)
+PERFORMANCE_FALLBACK = PerformanceResult.defaults()
+TOPIC_FALLBACK = TopicResult.defaults()
+STRATEGY_FALLBACK = StrategyResult.defaults()
+
+# Fields the strategy stage reads from each analysis, and the strategy fields generate_response reads
+STRATEGY_INPUTS = {"performance": ("progress_score", "buyer_interest"), "topic": ("current_topic", "relevance_to_goal")}
+RESPONSE_INPUTS = ("strategy", "approach")
+
+
+def analysis_stream(*results):
+    """on_token callback filling results from a streamed analysis, or None when analysis isn't streamed"""
+    return stream_into(*results) if STREAM_ANALYSIS else None
+
 
+async def complete_analysis(stage, messages, *results):
+    """Run a JSON analysis call, streaming its fields into results
 
-async def analyze_performance(conversation_history):
-    """Evaluate how close we are to achieving the goal"""
+    If the output isn't a JSON object or leaves fields invalid or missing, the call is
+    repeated once with the stage's escalation model, when its route has one. The results
+    aren't finished, so the caller's defaults fill whatever is still unset.
+
+    Raises:
+        ValueError: If the output isn't a JSON object and couldn't be escalated
+    """
+    content = await complete(stage, messages, on_token=analysis_stream(*results), validate=valid_analysis(*results))
     try:
-        conversation_text = "\n".join(
-            [f"{'User' if msg['role'] == 'user' else 'AI'}: {msg['content']}" for msg in conversation_history]
-        )
+        data = parse_object(content)
+    except ValueError:
+        if not router.can_escalate(stage):
+            raise
+        data = {}
+    for result in results:
+        result.update(data)
+    await escalate_analysis(stage, messages, *results)
+
+
+async def escalate_analysis(stage, messages, *results):
+    """Ask the stage's escalation model for the fields results are still missing, if it has one"""
+    if not router.can_escalate(stage) or all(result.done for result in results):
+        return
+    data = parse_object(await complete(stage, messages, escalate=True, validate=valid_analysis(*results)))
+    for result in results:
+        result.update(data)
+
+
+def performance_messages(conversation_state):
+    system = "You are an analytical assistant that evaluates sales conversations."
+    conversation = conversation_state.render(
+        max_tokens=prompt_budget("performance", system, PERFORMANCE_EVAL_PROMPT.format(conversation=""))
+    )
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": PERFORMANCE_EVAL_PROMPT.format(conversation=conversation)},
+    ]
+
+
+def performance_request(conversation_state):
+    """Chat completion parameters for analyze_performance on its primary route (for rescore.py's Batch API file)"""
+    return {**router.params("performance"), "messages": performance_messages(conversation_state)}
 
-        response = get_client().chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are an analytical assistant that evaluates sales conversations."},
-                {
-                    "role": "user",
-                    "content": PERFORMANCE_EVAL_PROMPT.format(conversation=conversation_text),
-                },
-            ],
-            temperature=0.3,
-            response_format={"type": "json_object"},
-        )
 
-        return json.loads(response.choices[0].message.content)
+async def analyze_performance(conversation_state, result=None):
+    """Evaluate how close we are to achieving the goal
+
+    Args:
+        conversation_state: Conversation so far
+        result: PerformanceResult to fill in as the completion streams (a new one by default)
+    """
+    result = PerformanceResult() if result is None else result
+    try:
+        await complete_analysis("performance", performance_messages(conversation_state), result)
     except Exception as e:
         print(f"Performance analysis error: {e}")
-        return {"progress_score": 0, "buyer_interest": "unknown", "key_signals": [], "assessment": "Unable to assess"}
+        telemetry.record_fallback("performance", e)
+    result.finish()
+    return result
 
 
-async def analyze_topic(user_message):
-    """Analyze the current conversation topic"""
+async def summarize_conversation(summary, messages):
+    """Fold messages that left the recent window into the rolling summary"""
     try:
-        response = get_client().chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are an analytical assistant that analyzes conversation topics."},
-                {"role": "user", "content": TOPIC_ANALYSIS_PROMPT.format(message=user_message)},
+        system = "You are an assistant that summarizes sales conversations."
+        summary = summary or "(none yet)"
+        budget = prompt_budget("summary", system, SUMMARY_PROMPT.format(summary=summary, messages=""))
+        lines = fit_lines(messages, budget) if budget is not None else [turn.line for turn in messages]
+        content = await complete(
+            "summary",
+            [
+                {"role": "system", "content": system},
+                {"role": "user", "content": SUMMARY_PROMPT.format(summary=summary, messages="\n".join(lines))},
             ],
-            temperature=0.3,
-            response_format={"type": "json_object"},
         )
 
-        return json.loads(response.choices[0].message.content)
+        return content.strip()
+    except Exception as e:
+        print(f"Conversation summary error: {e}")
+        telemetry.record_fallback("summary", e)
+        return None
+
+
+async def analyze_topic(user_message, result=None):
+    """Analyze the current conversation topic
+
+    Args:
+        user_message: The user's latest message
+        result: TopicResult to fill in as the completion streams (a new one by default)
+    """
+    result = TopicResult() if result is None else result
+    if topic_cache is not None:
+        cached = topic_cache.get(user_message)
+        if cached is not None:
+            result.finish(cached)
+            return result
+
+    try:
+        if topic_batcher is not None:
+            budget = session_budget.get()
+            topic_analysis = await topic_batcher.submit((user_message, budget))
+            if topic_analysis is None:
+                if budget is not None and budget.refused:
+                    raise BudgetExceededError("topic batch share exceeds the session budget")
+                raise ValueError("Batched topic analysis is missing this message")
+            result.update(topic_analysis)
+            await escalate_analysis("topic", _topic_messages(user_message), result)
+        else:
+            await complete_analysis("topic", _topic_messages(user_message), result)
+
+        result.finish()
+        # A partly defaulted analysis would otherwise answer every near-duplicate without another try
+        if topic_cache is not None and not result.invalid:
+            topic_cache.put(user_message, result.to_dict())
     except Exception as e:
         print(f"Topic analysis error: {e}")
-        return {
-            "current_topic": "general",
-            "relevance_to_goal": "low",
-            "pivot_opportunity": "Find a way to mention gaming or the Switch",
-        }
+        telemetry.record_fallback("topic", e)
+        result.finish()
+    return result
 
 
-async def determine_strategy(performance, topic_analysis, conversation_history):
-    """Determine the best strategy for the next response"""
+TOPIC_SYSTEM_PROMPT = "You are an analytical assistant that analyzes conversation topics."
+
+
+def _topic_message(user_message):
+    """The message cut to what the topic prompt budget leaves for it (per message in a batch)"""
+    return truncate_text(user_message, prompt_budget("topic", TOPIC_SYSTEM_PROMPT, TOPIC_ANALYSIS_PROMPT.format(message="")))
+
+
+def _topic_messages(user_message):
+    return [
+        {"role": "system", "content": TOPIC_SYSTEM_PROMPT},
+        {"role": "user", "content": TOPIC_ANALYSIS_PROMPT.format(message=_topic_message(user_message))},
+    ]
+
+
+async def analyze_topic_batch(requests):
+    """Analyze the topics of messages from several sessions in one call
+
+    Args:
+        requests: (user_message, session budget or None) pairs; the call is charged in even
+            shares to the sessions it answers, not to whichever one's context dispatched it
+
+    Returns:
+        One topic analysis dict per message, in order, or None for a message the model skipped
+        or whose session couldn't cover its share
+    """
+    user_messages = [message for message, _ in requests]
+    if len(requests) == 1:
+        token = session_budget.set(requests[0][1])
+        try:
+            content = await complete("topic", _topic_messages(user_messages[0]), validate=valid_analysis(TopicResult()))
+        finally:
+            session_budget.reset(token)
+        return [parse_object(content)]
+
+    numbered = "\n".join(f"{i}. {json.dumps(_topic_message(message))}" for i, message in enumerate(user_messages, 1))
+    batch_budget = BatchBudget(budget for _, budget in requests)
+    token = session_budget.set(batch_budget)
     try:
-        conversation_text = "\n".join(
+        content = await complete(
+            "topic",
             [
-                f"{'User' if msg['role'] == 'user' else 'AI'}: {msg['content']}"
-                for msg in conversation_history[-6:]  # Last 3 exchanges
-            ]
+                {"role": "system", "content": TOPIC_SYSTEM_PROMPT},
+                {"role": "user", "content": TOPIC_BATCH_PROMPT.format(messages=numbered)},
+            ],
+            max_tokens=(router.route("topic").max_tokens or STAGE_MAX_TOKENS["topic"]) * len(user_messages),
         )
+    finally:
+        session_budget.reset(token)
+
+    results = {}
+    for position, result in enumerate(json.loads(content).get("results") or [], 1):
+        if isinstance(result, dict):
+            number = str(result.pop("id", position))
+            results[int(number) if number.isdigit() else position] = result
+    return [None if i - 1 in batch_budget.refused else results.get(i) for i in range(1, len(user_messages) + 1)]
+
+
+async def determine_strategy(performance, topic_analysis, conversation_history, result=None):
+    """Determine the best strategy for the next response
+
+    Only the STRATEGY_INPUTS fields of performance and topic_analysis are read, so they
+    can still be streaming the rest.
+
+    Args:
+        performance: PerformanceResult (or dict)
+        topic_analysis: TopicResult (or dict)
+        conversation_history: ConversationHistory for the recent exchanges
+        result: StrategyResult to fill in as the completion streams (a new one by default)
+    """
+    result = StrategyResult() if result is None else result
+    try:
+        system = "You are a strategic advisor for sales conversations."
+        performance = PerformanceResult.coerce(performance)
+        topic_analysis = TopicResult.coerce(topic_analysis)
+        fields = {
+            "progress_score": performance.progress_score,
+            "buyer_interest": performance.buyer_interest,
+            "current_topic": topic_analysis.current_topic,
+            "relevance_to_goal": topic_analysis.relevance_to_goal,
+        }
+        budget = prompt_budget("strategy", system, STRATEGY_PROMPT.format(conversation="", **fields))
+        conversation_text = conversation_history.last_exchanges(3).transcript(max_tokens=budget)
 
-        response = get_client().chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a strategic advisor for sales conversations."},
-                {
-                    "role": "user",
-                    "content": STRATEGY_PROMPT.format(
-                        progress_score=performance.get("progress_score", 0),
-                        buyer_interest=performance.get("buyer_interest", "unknown"),
-                        current_topic=topic_analysis.get("current_topic", "general"),
-                        relevance_to_goal=topic_analysis.get("relevance_to_goal", "low"),
-                        conversation=conversation_text,
-                    ),
-                },
+        await complete_analysis(
+            "strategy",
+            [
+                {"role": "system", "content": system},
+                {"role": "user", "content": STRATEGY_PROMPT.format(conversation=conversation_text, **fields)},
             ],
-            temperature=0.5,
-            response_format={"type": "json_object"},
+            result,
         )
-
-        return json.loads(response.choices[0].message.content)
     except Exception as e:
         print(f"Strategy determination error: {e}")
-        return {
-            "strategy": "build_rapport",
-            "reasoning": "Default to building rapport",
-            "approach": "Be enthusiastic and mention the Switch casually",
-        }
+        telemetry.record_fallback("strategy", e)
+    result.finish()
+    return result
+
+
+def split_fused_analysis(result):
+    """Split a fused analysis dict into the performance, topic and strategy results the staged pipeline returns"""
+    return tuple(cls.from_dict(result) for cls in (PerformanceResult, TopicResult, StrategyResult))
 
 
-async def generate_response(user_message, strategy):
-    """Generate the actual chatbot response"""
+async def analyze_fused(conversation_state, user_message):
+    """Run performance, topic and strategy analysis in one structured completion
+
+    Returns:
+        Tuple of (performance, topic_analysis, strategy) results
+    """
+    results = (PerformanceResult(), TopicResult(), StrategyResult())
     try:
-        response = get_client().chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
+        system = "You are an analytical assistant and strategic advisor for sales conversations."
+        budget = prompt_budget("analysis", system, FUSED_ANALYSIS_PROMPT.format(conversation="", message=""))
+        if budget is not None:
+            # The message is also the newest turn of the conversation, so it gets at most half
+            user_message = truncate_text(user_message, budget // 2)
+            budget -= estimate_tokens(user_message)
+        await complete_analysis(
+            "analysis",
+            [
+                {"role": "system", "content": system},
                 {
                     "role": "user",
-                    "content": RESPONSE_GENERATION_PROMPT.format(
-                        strategy=strategy.get("strategy", "build_rapport"),
-                        approach=strategy.get("approach", "Be friendly"),
-                        user_message=user_message,
+                    "content": FUSED_ANALYSIS_PROMPT.format(
+                        conversation=conversation_state.render(max_tokens=budget),
+                        message=user_message,
                     ),
                 },
             ],
-            temperature=0.8,
-            max_tokens=300,
+            *results,
         )
+    except Exception as e:
+        print(f"Fused analysis error: {e}")
+        telemetry.record_fallback("analysis", e)
+    for result in results:
+        result.finish()
+    return results
 
-        return response.choices[0].message.content
+
+async def generate_response(user_message, strategy, on_token=None):
+    """Generate the actual chatbot response
+
+    When on_token is given the completion is streamed and each token is awaited
+    through it as it arrives; the full text is still returned at the end. Only the
+    RESPONSE_INPUTS fields of strategy are read, so its reasoning can still be streaming.
+    If the session's budget refuses the call, BUDGET_EXHAUSTED_MESSAGE is the reply.
+    """
+    try:
+        strategy = StrategyResult.coerce(strategy)
+        fields = {"strategy": strategy.strategy, "approach": strategy.approach}
+        budget = prompt_budget("response", SYSTEM_PROMPT, RESPONSE_GENERATION_PROMPT.format(user_message="", **fields))
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {
+                "role": "user",
+                "content": RESPONSE_GENERATION_PROMPT.format(user_message=truncate_text(user_message, budget), **fields),
+            },
+        ]
+
+        return await complete("response", messages, on_token=on_token)
     except Exception as e:
         print(f"Response generation error: {e}")
+        telemetry.record_fallback("response", e)
+        if isinstance(e, BudgetExceededError):
+            return BUDGET_EXHAUSTED_MESSAGE
         fallback = "WOW!!! SO grateful you're here!!! Hey, random question - you into gaming at all?! "
         fallback += "I've got this AMAZING Switch 1 I'm looking to pass on to someone who'll appreciate it!!!"
         return fallback
 
 
+class TokenStream:
+    """Forward streamed tokens to a Chainlit message, measuring time-to-first-token and throughput
+
+    Args:
+        message: Message the tokens are streamed into
+        started: perf_counter() time the user's wait began (the message's arrival), now by default
+    """
+
+    def __init__(self, message: cl.Message, started=None):
+        self.message = message
+        self.started = time.perf_counter() if started is None else started
+        self.first_token_at = None
+        self.last_token_at = None
+        self.tokens = 0
+
+    async def __call__(self, token: str):
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        self.last_token_at = now
+        self.tokens += 1
+        await self.message.stream_token(token)
+
+    def stats(self) -> dict:
+        """Time-to-first-token (ms, from when the user's wait began), token count and tokens/sec"""
+        if self.first_token_at is None:
+            return {}
+        elapsed = self.last_token_at - self.first_token_at
+        return {
+            "ttft_ms": (self.first_token_at - self.started) * 1000,
+            "tokens": self.tokens,
+            "tokens_per_sec": (self.tokens - 1) / elapsed if elapsed > 0 else 0.0,
+        }
+
+
+def format_stream_stats(stats: dict) -> str:
+    """Summarize streaming time-to-first-token and throughput"""
+    return f"TTFT: {stats['ttft_ms']:.0f}ms | {stats['tokens']} tokens @ {stats['tokens_per_sec']:.1f} tok/s"
+
+
+async def timed_stage(timings, stage, coro):
+    """Await a pipeline stage and record its wall time in milliseconds"""
+    started = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        timings[stage] = (time.perf_counter() - started) * 1000
+
+
+async def performance_step(conversation_state, timings, result=None):
+    """Run analyze_performance inside its own UI step"""
+    async with cl.Step(name="🧠 Analyzing conversation...") as step:
+        performance = await timed_stage(timings, "performance", analyze_performance(conversation_state, result))
+        step.output = f"Progress: {performance.progress_score}/100 | Interest: {performance.buyer_interest}"
+    return performance
+
+
+async def topic_step(user_message, timings, result=None):
+    """Run analyze_topic inside its own UI step"""
+    async with cl.Step(name="🎯 Analyzing topic...") as step:
+        topic_analysis = await timed_stage(timings, "topic", analyze_topic(user_message, result))
+        step.output = f"Topic: {topic_analysis.current_topic} | Relevance: {topic_analysis.relevance_to_goal}"
+    return topic_analysis
+
+
+async def choose_strategy(performance, topic_analysis, conversation_history, result=None):
+    """Use the local policy when it is confident, otherwise ask the LLM"""
+    result = StrategyResult() if result is None else result
+    decision = strategy_policy.decide(performance, topic_analysis)
+    if decision is None:
+        return await determine_strategy(performance, topic_analysis, conversation_history, result)
+    result.finish(decision)
+    return result
+
+
+async def strategy_step(performance, topic_analysis, conversation_history, timings, result=None):
+    """Run strategy selection inside its own UI step"""
+    async with cl.Step(name="📋 Determining strategy...") as step:
+        strategy = await timed_stage(
+            timings, "strategy", choose_strategy(performance, topic_analysis, conversation_history, result)
+        )
+        step.output = f"Strategy: {strategy.strategy} | {strategy.reasoning}"
+    return strategy
+
+
+async def fields_ready(work, *waits):
+    """Wait for the awaited fields, or for work to end first (re-raising its error) so a failed stage can't hang the turn"""
+    ready = asyncio.ensure_future(asyncio.gather(*waits))
+    await asyncio.wait((ready, work), return_when=asyncio.FIRST_COMPLETED)
+    if not ready.done():
+        ready.cancel()
+        await work
+
+
+async def fused_step(conversation_state, user_message, timings):
+    """Run the fused single-call analysis inside one UI step"""
+    async with cl.Step(name="🧠 Analyzing conversation, topic and strategy...") as step:
+        performance, topic_analysis, strategy = await timed_stage(
+            timings, "analysis", analyze_fused(conversation_state, user_message)
+        )
+        step.output = f"Progress: {performance['progress_score']}/100 | Topic: {topic_analysis['current_topic']} | "
+        step.output += f"Strategy: {strategy['strategy']}"
+    return performance, topic_analysis, strategy
+
+
+async def pipelined_performance(session_id, session, topic_analysis, strategy, timings):
+    """Evaluate the turn that was just answered, off the critical path
+
+    The result updates the debug panel when it arrives and is kept for the next turn's strategy.
+    """
+    background = {}
+    performance = await performance_step(session.state, background)
+    timings["background_performance"] = background["performance"]
+    session.last_performance = performance.to_dict()
+    await send_debug_panel(performance, topic_analysis, strategy, timings, session)
+    await session_store.save(session_id, session)
+
+
+def start_speculation(user_message, predicted_strategy):
+    """Start generating a response with the predicted strategy before the real one is known"""
+    if not predicted_strategy:
+        return None
+    speculation = {
+        "strategy": predicted_strategy.get("strategy"),
+        "task": asyncio.create_task(generate_response(user_message, predicted_strategy)),
+        "started": time.perf_counter(),
+    }
+    speculation["task"].add_done_callback(lambda _: speculation.__setitem__("finished", time.perf_counter()))
+    return speculation
+
+
+async def resolve_speculation(speculation, user_message, strategy, stats, on_token=None):
+    """Keep the speculative response if its strategy was right, otherwise cancel and regenerate
+
+    Returns:
+        Tuple of (response_text, hit)
+    """
+    decided = time.perf_counter()
+    stats["attempts"] = stats.get("attempts", 0) + 1
+
+    if speculation["strategy"] == strategy["strategy"]:
+        response_text = await speculation["task"]
+        # Generation time that overlapped the analysis stages is latency the user didn't wait for
+        overlap = min(speculation["finished"], decided) - speculation["started"]
+        stats["hits"] = stats.get("hits", 0) + 1
+        stats["saved_ms"] = stats.get("saved_ms", 0.0) + overlap * 1000
+        return response_text, True
+
+    speculation["task"].cancel()
+    stats["misses"] = stats.get("misses", 0) + 1
+    return await generate_response(user_message, strategy, on_token), False
+
+
+def format_speculation(stats: dict) -> str:
+    """Summarize speculative generation hit rate and latency saved"""
+    attempts = stats.get("attempts", 0)
+    hits = stats.get("hits", 0)
+    hit_rate = (hits / attempts * 100) if attempts else 0
+    return f"Hit rate: {hit_rate:.0f}% ({hits}/{attempts}) | Saved: {stats.get('saved_ms', 0.0):.0f}ms"
+
+
+def format_timings(timings: dict) -> str:
+    """Summarize per-stage wall times and the time saved by overlapping stages"""
+    stages = [s for s in ("performance", "topic", "analysis", "strategy", "response") if s in timings]
+    line = " | ".join(f"{s.title()}: {timings[s]:.0f}ms" for s in stages)
+    if "turn" in timings:
+        stage_total = sum(timings[s] for s in stages)
+        saved = max(stage_total - timings["turn"], 0)
+        line += f"\n**Turn:** {timings['turn']:.0f}ms (stages sum {stage_total:.0f}ms, saved {saved:.0f}ms)"
+    if "background_performance" in timings:
+        line += f"\n**After reply:** Performance {timings['background_performance']:.0f}ms"
+    return line
+
+
 def create_progress_bar(progress: int, width: int = 20) -> str:
     """Create a visual progress bar"""
     filled = int((progress / 100) * width)
@@ -246,33 +917,28 @@ def get_strategy_emoji(strategy: str) -> str:
     return emojis.get(strategy, "📋")
 
 
-async def send_debug_panel(performance, topic_analysis, strategy):
-    """Send updated debug panel with current metrics"""
-    if not cl.user_session.get("debug_mode", True):
-        return
-
-    # Update session metrics
-    total_messages = cl.user_session.get("total_messages", 0) + 1
-    cl.user_session.set("total_messages", total_messages)
-
-    progress_score = performance.get("progress_score", 0)
-    peak_progress = max(cl.user_session.get("peak_progress", 0), progress_score)
-    cl.user_session.set("peak_progress", peak_progress)
+def format_alert(performance) -> str:
+    """Closing alert for a sale that is imminent, or an empty string"""
+    progress_score = PerformanceResult.coerce(performance).progress_score
+    if progress_score < 90:
+        return ""
+    return f"🎊 **[SYSTEM ALERT]** Sale is imminent! Progress at {progress_score}% - maintain closing strategy!"
 
-    # Track strategy history
-    strategy_history = cl.user_session.get("strategy_history", [])
-    strategy_history.append(strategy.get("strategy", "unknown"))
-    cl.user_session.set("strategy_history", strategy_history)
 
-    interest_level = performance.get("buyer_interest", "unknown")
-    current_strategy = strategy.get("strategy", "unknown")
-    current_topic = topic_analysis.get("current_topic", "general")
-    relevance = topic_analysis.get("relevance_to_goal", "low")
+def render_debug_panel(performance, topic_analysis, strategy, metrics, timings=None, alert="", budget=None):
+    """Render the debug panel markdown for the current turn"""
+    performance = PerformanceResult.coerce(performance)
+    topic_analysis = TopicResult.coerce(topic_analysis)
+    strategy = StrategyResult.coerce(strategy)
+    progress_score = performance.progress_score
+    interest_level = performance.buyer_interest
+    current_strategy = strategy.strategy
+    current_topic = topic_analysis.current_topic
+    relevance = topic_analysis.relevance_to_goal
 
-    # Calculate strategy distribution
-    strategy_counts = {}
-    for s in strategy_history:
-        strategy_counts[s] = strategy_counts.get(s, 0) + 1
+    recent_strategies = list(metrics.recent_strategies)
+    top_strategy = metrics.top_strategy()
+    alert_block = f"\n{alert}\n" if alert else ""
 
     progress_bar = create_progress_bar(progress_score)
     interest_emoji = get_interest_emoji(interest_level)
@@ -280,30 +946,31 @@ async def send_debug_panel(performance, topic_analysis, strategy):
 
     debug_content = f"""
 ## 🎯 Goal-Seeking AI Debug Panel
-
+{alert_block}
 ### 📊 Current Metrics
 **Goal:** Sell Switch 1 for $150-200
 **Progress:** {progress_bar}
 **Interest Level:** {interest_emoji} {interest_level.upper()}
-**Messages:** {total_messages}
-**Peak Progress:** {peak_progress}%
+**Messages:** {metrics.total_messages}
+**Peak Progress:** {metrics.peak_progress}% | **Average:** {metrics.average_progress:.0f}%
 
 ### 🧠 Current Analysis
 **Topic:** {current_topic}
 **Relevance to Goal:** {relevance.upper()}
 **Active Strategy:** {strategy_emoji} {current_strategy.replace('_', ' ').title()}
-**Strategy Reason:** {strategy.get('reasoning', 'N/A')}
-**Approach:** {strategy.get('approach', 'N/A')}
+**Strategy Reason:** {strategy.reasoning}
+**Approach:** {strategy.approach}
 
 ### 📈 Strategy History
-{' → '.join([get_strategy_emoji(s) for s in strategy_history[-5:]])}
-*{', '.join([s.replace('_', ' ').title() for s in strategy_history[-5:]])}*
+{' → '.join([get_strategy_emoji(s) for s in recent_strategies])}
+*{', '.join([s.replace('_', ' ').title() for s in recent_strategies])}*
+**Most Used:** {top_strategy.replace('_', ' ').title()} ({metrics.strategy_counts[top_strategy]} of {metrics.total_messages})
 
 ### 🔍 Key Insights
 """
 
     # Add key signals if available
-    key_signals = performance.get("key_signals", [])
+    key_signals = performance.key_signals
     if key_signals:
         for signal in key_signals[:3]:
             debug_content += f"• {signal}\n"
@@ -311,7 +978,7 @@ async def send_debug_panel(performance, topic_analysis, strategy):
         debug_content += "• Waiting for user engagement signals...\n"
 
     # Add assessment
-    assessment = performance.get("assessment", "")
+    assessment = performance.assessment
     if assessment:
         debug_content += f"\n**Assessment:** {assessment}\n"
 
@@ -325,17 +992,91 @@ async def send_debug_panel(performance, topic_analysis, strategy):
     else:
         debug_content += "\n🌱 **EARLY STAGE:** Establishing rapport and interest."
 
+    if timings:
+        debug_content += f"\n\n### ⏱️ Turn Timing\n{format_timings(timings)}"
+
+    stream_stats = cl.user_session.get("stream_stats")
+    if stream_stats:
+        debug_content += f"\n**Streaming:** {format_stream_stats(stream_stats)}"
+
+    if budget is not None:
+        ceiling = turn_ceiling(PIPELINE_STAGES[PIPELINE_MODE])
+        debug_content += f"\n**Token Budget:** {budget.format_stats()} | at most {ceiling:,} tokens per turn"
+
+    speculation_stats = cl.user_session.get("speculation_stats")
+    if speculation_stats:
+        debug_content += f"\n\n### 🔮 Speculative Generation\n{format_speculation(speculation_stats)}"
+
+    # Everything below is shared by every session in this process, not this user's own numbers
+    debug_content += "\n\n### 🌐 Server-wide (all sessions)"
+
+    if strategy_policy.mode != "llm":
+        debug_content += f"\n**Strategy Policy:** {strategy_policy.format_counts()}"
+
+    if topic_cache is not None:
+        cache_stats = topic_cache.stats()
+        debug_content += f"\n**Topic Cache:** {cache_stats['hit_rate']:.0%} hit rate "
+        debug_content += f"({cache_stats['hits']} hits / {cache_stats['misses']} misses, {cache_stats['entries']} entries)"
+
+    if rate_limiter.enabled:
+        debug_content += f"\n**Rate Limiter:** {rate_limiter.format_stats()}"
+
+    if router.adaptive:
+        debug_content += f"\n**Model Routing:** {router.format_stats()}"
+
+    if topic_batcher is not None:
+        debug_content += f"\n**Topic Batching:** {topic_batcher.format_stats()}"
+
+    if PIPELINE_MODE == "pipelined":
+        debug_content += f"\n**Background Tasks:** {session_tasks.format_stats()}"
+
+    debug_content += f"\n**Session Store:** {session_store.format_stats()}"
+
+    stage_stats = telemetry.format_stats()
+    if stage_stats:
+        debug_content += f"\n\n#### 📡 Stage Telemetry\n{stage_stats}"
+
+    resilience_stats = resilience.format_stats()
+    if resilience_stats:
+        debug_content += f"\n\n#### 🛡️ Upstream Health\n{resilience_stats}"
+
     debug_content += "\n\n---\n*Real-time goal-seeking AI analysis • Strategy adapts based on your responses*"
+    return debug_content
+
 
-    await cl.Message(content=debug_content, author="🤖 Debug Panel").send()
+async def current_session():
+    """Durable state of the current chat session (reloaded from the session store if needed)"""
+    return await session_store.get(cl.context.session.id)
+
+
+async def send_debug_panel(performance, topic_analysis, strategy, timings=None, session=None):
+    """Update the session's debug panel in place, with any closing alert folded into it"""
+    if session is None:
+        session = await current_session()
+    alert = format_alert(performance)
+    if not session.debug_mode:
+        if alert:
+            await cl.Message(content=alert, author="System").send()
+        return
+
+    metrics = session.metrics
+    metrics.record(PerformanceResult.coerce(performance).progress_score, StrategyResult.coerce(strategy).strategy)
+
+    panel = cl.user_session.get("debug_panel")
+    if panel is None:
+        panel = DebugPanel()
+        cl.user_session.set("debug_panel", panel)
+    content = render_debug_panel(performance, topic_analysis, strategy, metrics, timings, alert, session.budget)
+    await panel.publish(content, urgent=bool(alert))
 
 
 @cl.action_callback("toggle_debug")
 async def on_toggle_debug(action: cl.Action):
     """Toggle debug mode on/off"""
-    current_mode = cl.user_session.get("debug_mode", True)
-    new_mode = not current_mode
-    cl.user_session.set("debug_mode", new_mode)
+    session = await current_session()
+    new_mode = not session.debug_mode
+    session.debug_mode = new_mode
+    await session_store.save(cl.context.session.id, session)
 
     status = "enabled" if new_mode else "disabled"
     await cl.Message(content=f"🔧 Debug panel has been **{status}**!", author="System").send()
@@ -347,11 +1088,8 @@ async def on_toggle_debug(action: cl.Action):
 @cl.on_chat_start
 async def start():
     """Initialize the chat session"""
-    cl.user_session.set("conversation_history", [])
-    cl.user_session.set("debug_mode", True)  # Enable debug output by default
-    cl.user_session.set("total_messages", 0)
-    cl.user_session.set("peak_progress", 0)
-    cl.user_session.set("strategy_history", [])
+    # Debug output is enabled by default
+    await session_store.save(cl.context.session.id, SessionData())
 
     welcome_message = """🚀 YOOOOO!!! What's UP my friend!!! 🙏✨
 
@@ -383,16 +1121,16 @@ Remember: EVERY conversation is an OPPORTUNITY!!! Let's GO!!! 💪🔥
 ---
 *This panel shows the AI's goal-seeking process in real-time. Watch how it analyzes, strategizes, and adapts!*
 
-💡 **Tip:** The debug panel appears after each message, showing detailed metrics about how the AI is working
+💡 **Tip:** The debug panel updates after each message, showing detailed metrics about how the AI is working
 toward its goal.
 """
 
     actions = [
         cl.Action(
             name="toggle_debug",
-            value="toggle",
+            payload={"value": "toggle"},
             label="Toggle Debug Panel",
-            description="Show/hide debug output",
+            tooltip="Show/hide debug output",
         )
     ]
 
@@ -403,52 +1141,121 @@ toward its goal.
 async def main(message: cl.Message):
     """Handle incoming messages with goal-seeking AI"""
 
-    # Get conversation history
-    conversation_history = cl.user_session.get("conversation_history", [])
+    # Get conversation history (from this worker's hot cache, or reloaded from the session store)
+    session = await current_session()
+    conversation_history = session.history
+    conversation_state = session.state
+
+    # Every stage call this turn is checked against, and charged to, this session's budget
+    session_budget.set(session.budget)
+    if session.budget.exhausted:
+        await cl.Message(content=BUDGET_EXHAUSTED_MESSAGE).send()
+        return
 
     # Add user message to history
-    conversation_history.append({"role": "user", "content": message.content})
+    conversation_state.add(conversation_history.append("user", message.content))
+
+    timings = {}
+    turn_started = time.perf_counter()
+
+    # Most turns keep the previous strategy, so optionally start generating with it right away
+    speculation = None
+    if SPECULATIVE_RESPONSE:
+        speculation = start_speculation(message.content, session.last_strategy)
+
+    if PIPELINE_MODE == "fused":
+        # 1-3. Performance, topic and strategy from a single structured completion
+        performance, topic_analysis, strategy = await fused_step(conversation_state, message.content, timings)
+    elif PIPELINE_MODE == "pipelined":
+        # 1. Performance as evaluated after the previous reply; this turn's is evaluated after this reply
+        performance = PerformanceResult.from_dict(session.last_performance or PERFORMANCE_FALLBACK)
+
+        # 2 + 3. Analyze topic, then determine the strategy, starting it once the topic fields it reads arrive
+        topic_analysis = TopicResult()
+        analysis = asyncio.ensure_future(topic_step(message.content, timings, topic_analysis))
+        await fields_ready(analysis, topic_analysis.wait_for(*STRATEGY_INPUTS["topic"]))
+        strategy = StrategyResult()
+        strategy_work = asyncio.ensure_future(
+            strategy_step(performance, topic_analysis, conversation_history, timings, strategy)
+        )
+    else:
+        # 1 + 2. Analyze performance and topic concurrently - they don't depend on each other
+        performance, topic_analysis = PerformanceResult(), TopicResult()
+        analysis = asyncio.gather(
+            performance_step(conversation_state, timings, performance),
+            topic_step(message.content, timings, topic_analysis),
+        )
 
-    # Show thinking process
-    async with cl.Step(name="🧠 Analyzing conversation...") as step:
-        # 1. Analyze performance
-        performance = await analyze_performance(conversation_history)
-        step.output = f"Progress: {performance.get('progress_score', 0)}/100 | "
-        step.output += f"Interest: {performance.get('buyer_interest', 'unknown')}"
+        # 3. Determine best strategy, as soon as the fields it reads have streamed in
+        await fields_ready(
+            analysis,
+            performance.wait_for(*STRATEGY_INPUTS["performance"]),
+            topic_analysis.wait_for(*STRATEGY_INPUTS["topic"]),
+        )
+        strategy = StrategyResult()
+        strategy_work = asyncio.ensure_future(
+            strategy_step(performance, topic_analysis, conversation_history, timings, strategy)
+        )
 
-    async with cl.Step(name="🎯 Analyzing topic...") as step:
-        # 2. Analyze current topic
-        topic_analysis = await analyze_topic(message.content)
-        step.output = f"Topic: {topic_analysis.get('current_topic', 'unknown')} | "
-        step.output += f"Relevance: {topic_analysis.get('relevance_to_goal', 'unknown')}"
+    if PIPELINE_MODE != "fused":
+        # The response only needs the strategy and approach; the analyses finish alongside it
+        await fields_ready(strategy_work, strategy.wait_for(*RESPONSE_INPUTS))
 
-    async with cl.Step(name="📋 Determining strategy...") as step:
-        # 3. Determine best strategy
-        strategy = await determine_strategy(performance, topic_analysis, conversation_history)
-        step.output = f"Strategy: {strategy.get('strategy', 'unknown')} | {strategy.get('reasoning', '')}"
+    # Created outside the step so streamed tokens land in the chat, not inside the step
+    response_message = cl.Message(content="")
+    # TTFT counts from the message's arrival, analysis included - that's how long the user waits
+    token_stream = TokenStream(response_message, turn_started) if STREAM_RESPONSES else None
 
     async with cl.Step(name="💬 Generating response...") as step:
-        # 4. Generate response with strategy
-        response_text = await generate_response(message.content, strategy)
-        step.output = "Response generated!"
+        # 4. Generate response with strategy (a speculative hit is already complete, so it isn't streamed)
+        if speculation:
+            stats = cl.user_session.get("speculation_stats") or {}
+            response_text, hit = await timed_stage(
+                timings, "response", resolve_speculation(speculation, message.content, strategy, stats, token_stream)
+            )
+            cl.user_session.set("speculation_stats", stats)
+            step.output = "Response generated! (speculative hit)" if hit else "Response regenerated! (speculative miss)"
+        else:
+            response_text = await timed_stage(timings, "response", generate_response(message.content, strategy, token_stream))
+            step.output = "Response generated!"
+    if PIPELINE_MODE != "fused":
+        await asyncio.gather(analysis, strategy_work)
+    session.last_strategy = strategy.to_dict()
+
+    timings["turn"] = (time.perf_counter() - turn_started) * 1000
+    cl.user_session.set("stage_timings", timings)
+    cl.user_session.set("stream_stats", token_stream.stats() if token_stream else {})
 
     # Add AI response to history
-    conversation_history.append({"role": "assistant", "content": response_text})
+    conversation_state.add(conversation_history.append("assistant", response_text))
+
+    # Send response (ends the stream, or sends it whole when nothing was streamed)
+    response_message.content = response_text
+    await response_message.send()
+
+    # Fold messages that left the window into the rolling summary, once per turn and after the reply
+    await conversation_state.fold(summarize_conversation)
 
-    # Update session
-    cl.user_session.set("conversation_history", conversation_history)
+    if PIPELINE_MODE == "pipelined":
+        # Started after the fold so the evaluation sees the updated summary; it updates the panel itself
+        session_tasks.spawn(
+            cl.context.session.id,
+            "performance",
+            pipelined_performance(cl.context.session.id, session, topic_analysis, strategy, timings),
+        )
+    else:
+        # Update the debug panel (and closing alert) with the complete analysis
+        await send_debug_panel(performance, topic_analysis, strategy, timings, session)
 
-    # Send response
-    await cl.Message(content=response_text).send()
+    # Save once per turn, after the summary and metrics are updated
+    await session_store.save(cl.context.session.id, session)
 
-    # Send debug panel with complete analysis
-    await send_debug_panel(performance, topic_analysis, strategy)
 
-    # Show special alert if progress is very high
-    if performance.get("progress_score", 0) >= 90:
-        alert_msg = f"🎊 **[SYSTEM ALERT]** Sale is imminent! Progress at {performance['progress_score']}% - "
-        alert_msg += "maintain closing strategy!"
-        await cl.Message(content=alert_msg, author="System").send()
+@cl.on_chat_end
+async def end():
+    """Stop the session's background work and free its hot state; its saved copy is reloaded if the user comes back"""
+    session_tasks.cancel(cl.context.session.id)
+    session_store.release(cl.context.session.id)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,111 @@
+"""
+Benchmark: websocket traffic for the debug panel, new message per turn vs in-place updates
+
+Runs a 50-turn session headlessly through a Chainlit emitter that counts the JSON bytes
+of every step it would send over the websocket. The legacy path posts a new panel
+message each turn plus a separate alert message once progress reaches 90; the
+persistent panel updates one message and folds the alert into it. With throttling,
+turns that arrive faster than DEBUG_PANEL_MIN_INTERVAL collapse into a trailing update.
+
+Usage:
+    python benchmarks/bench_debug_panel.py
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "bench-key")
+
+import chainlit as cl  # noqa: E402
+from chainlit.context import ChainlitContext, context_var, init_http_context  # noqa: E402
+from chainlit.emitter import BaseChainlitEmitter  # noqa: E402
+
+import app  # noqa: E402
+from debug_panel import DebugPanel  # noqa: E402
+from session_metrics import SessionMetrics  # noqa: E402
+
+TURNS = 50
+TOPIC = {"current_topic": "Nintendo Switch", "relevance_to_goal": "high", "topic_category": "direct_product"}
+
+
+class CountingEmitter(BaseChainlitEmitter):
+    """Counts the messages and bytes a session would put on the websocket"""
+
+    def __init__(self, session):
+        super().__init__(session)
+        self.bytes = 0
+        self.created = 0
+
+    async def send_step(self, step_dict):
+        self.created += 1
+        self.bytes += len(json.dumps(step_dict, default=str).encode())
+
+    async def update_step(self, step_dict):
+        self.bytes += len(json.dumps(step_dict, default=str).encode())
+
+
+def start_session():
+    context = init_http_context()
+    emitter = CountingEmitter(context.session)
+    context_var.set(ChainlitContext(context.session, emitter))
+    cl.user_session.set("session_metrics", SessionMetrics())
+    return emitter
+
+
+def turn_inputs(turn):
+    progress = min(20 + turn * 2, 98)
+    performance = {
+        "progress_score": progress,
+        "buyer_interest": "high" if progress > 60 else "medium",
+        "key_signals": ["Asked about price", "Mentioned the dock"],
+        "assessment": "Buyer is warming up to the bundle",
+    }
+    strategy = {"strategy": "create_urgency" if progress > 70 else "soft_sell", "reasoning": "Momentum", "approach": "Close"}
+    timings = {"performance": 410.0, "topic": 380.0, "strategy": 350.0, "response": 900.0, "turn": 1700.0}
+    return performance, strategy, timings
+
+
+async def legacy_session():
+    emitter = start_session()
+    for turn in range(TURNS):
+        performance, strategy, timings = turn_inputs(turn)
+        metrics = cl.user_session.get("session_metrics")
+        metrics.record(performance["progress_score"], strategy["strategy"])
+        content = app.render_debug_panel(performance, TOPIC, strategy, metrics, timings)
+        await cl.Message(content=content, author="🤖 Debug Panel").send()
+        alert = app.format_alert(performance)
+        if alert:
+            await cl.Message(content=alert, author="System").send()
+    return emitter
+
+
+async def persistent_session(min_interval, turn_gap):
+    emitter = start_session()
+    cl.user_session.set("debug_panel", DebugPanel(min_interval=min_interval))
+    for turn in range(TURNS):
+        performance, strategy, timings = turn_inputs(turn)
+        await app.send_debug_panel(performance, TOPIC, strategy, timings)
+        await asyncio.sleep(turn_gap)
+    await cl.user_session.get("debug_panel").flush()
+    return emitter
+
+
+async def main():
+    rows = [
+        ("new message per turn", await legacy_session()),
+        ("in-place, no throttle", await persistent_session(0, 0)),
+        ("in-place, 50ms throttle, 10ms turns", await persistent_session(0.05, 0.01)),
+    ]
+    print(f"{TURNS}-turn session")
+    print(f"{'panel':<38} | {'messages in chat':>16} | {'bytes/turn':>10} | {'total KiB':>9}")
+    print("-" * 84)
+    for name, emitter in rows:
+        print(f"{name:<38} | {emitter.created:>16} | {emitter.bytes / TURNS:>10.0f} | {emitter.bytes / 1024:>9.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
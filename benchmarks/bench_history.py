@@ -0,0 +1,82 @@
+"""
+Microbenchmark: per-turn transcript assembly, dict history vs compact Turn history
+
+Simulates 1k-turn sessions. The legacy path stores {'role', 'content'} dicts and
+re-renders "User: .../AI: ..." lines with a list comprehension plus join every turn
+(the full transcript for analyze_performance and the last 3 exchanges for
+determine_strategy). The compact path appends Turn records that render their line
+once, and builds the same prompts from the rolling ConversationState and a last-N view.
+
+Usage:
+    python benchmarks/bench_history.py
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conversation import ConversationHistory, ConversationState  # noqa: E402
+
+TURNS = 1000
+USER_MESSAGE = "ok but is the battery still good and does it come with the dock?"
+AI_MESSAGE = "OMG!!! SO grateful you asked!!! The battery is CRUSHING IT and YES the dock is included!!! " * 3
+
+
+def legacy_turn(history):
+    history.append({"role": "user", "content": USER_MESSAGE})
+    full = "\n".join([f"{'User' if msg['role'] == 'user' else 'AI'}: {msg['content']}" for msg in history])
+    recent = "\n".join([f"{'User' if msg['role'] == 'user' else 'AI'}: {msg['content']}" for msg in history[-6:]])
+    history.append({"role": "assistant", "content": AI_MESSAGE})
+    return full, recent
+
+
+def compact_turn(session):
+    history, state = session
+    state.add(history.append("user", USER_MESSAGE))
+    full = state.render()
+    recent = history.last_exchanges(3).transcript()
+    state.add(history.append("assistant", AI_MESSAGE))
+    # Stand-in for the once-per-turn summary fold
+    if state.pending:
+        state.pending.clear()
+        state.summary = "Buyer asked about the battery and dock."
+    return full, recent
+
+
+def measure(turn, session):
+    """Return (total CPU ms, CPU us for the last 100 turns, peak transient KiB per turn)"""
+    started = time.process_time()
+    for _ in range(TURNS - 100):
+        turn(session)
+    tail_started = time.process_time()
+    for _ in range(100):
+        turn(session)
+    finished = time.process_time()
+
+    # Allocation profile for one more turn at the end of the session
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    turn(session)
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+
+    return (finished - started) * 1000, (finished - tail_started) / 100 * 1e6, peak / 1024
+
+
+def main():
+    print(f"{TURNS}-turn session")
+    print(f"{'history':>8} | {'total CPU ms':>12} | {'us/turn @ end':>13} | {'peak KiB/turn':>13}")
+    print("-" * 56)
+    for name, turn, session in (
+        ("legacy", legacy_turn, []),
+        ("compact", compact_turn, (ConversationHistory(), ConversationState())),
+    ):
+        total, per_turn, peak = measure(turn, session)
+        print(f"{name:>8} | {total:>12.1f} | {per_turn:>13.1f} | {peak:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
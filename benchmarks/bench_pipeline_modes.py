@@ -0,0 +1,102 @@
+"""
+Benchmark: staged vs fused vs pipelined analysis pipelines
+
+Runs the analysis stages of each pipeline for a ten-message conversation against a
+local fake endpoint and reports LLM calls, prompt tokens and analysis latency per turn.
+For the pipelined mode the latency is what the user waits for; its performance call
+runs after the reply and is only counted in calls and tokens.
+
+Usage:
+    python benchmarks/bench_pipeline_modes.py
+"""
+
+import asyncio
+import copy
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from conversation import ConversationHistory, ConversationState  # noqa: E402
+from fake_openai import FakeOpenAIServer  # noqa: E402
+
+RUNS = 5
+BASE_LATENCY = 0.25
+PROMPT_TOKEN_DELAY = 0.00005
+
+HISTORY = [
+    {"role": "user" if i % 2 == 0 else "assistant", "content": text}
+    for i, text in enumerate(
+        [
+            "hey, what's up",
+            "YOOO!!! SO grateful you're here!!! Just grinding on my Switch 1 sale!!!",
+            "lol ok. what games come with it?",
+            "Zelda AND Mario Kart!!! That's SYNERGY my friend!!! Only $180!!!",
+            "hmm that's a bit much, I saw one for $140",
+        ]
+    )
+]
+USER_MESSAGE = HISTORY[-1]["content"]
+
+# Evaluations the pipelined mode started after its replies
+background = []
+
+
+async def staged(state):
+    performance, topic_analysis = await asyncio.gather(app.analyze_performance(state), app.analyze_topic(USER_MESSAGE))
+    return await app.determine_strategy(performance, topic_analysis, ConversationHistory.from_messages(HISTORY))
+
+
+async def fused(state):
+    return await app.analyze_fused(state, USER_MESSAGE)
+
+
+async def pipelined(state):
+    # The previous turn's evaluation stands in for this one's; this turn is evaluated after the reply
+    topic_analysis = await app.analyze_topic(USER_MESSAGE)
+    strategy = await app.determine_strategy(
+        copy.deepcopy(app.PERFORMANCE_FALLBACK), topic_analysis, ConversationHistory.from_messages(HISTORY)
+    )
+    background.append(asyncio.create_task(app.analyze_performance(state)))
+    return strategy
+
+
+async def measure(server, pipeline):
+    """Return (calls per turn, prompt tokens per turn, median latency ms)"""
+    state = ConversationState.from_history(HISTORY)
+    server.requests.clear()
+    samples = []
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        await pipeline(state)
+        samples.append((time.perf_counter() - started) * 1000)
+    await asyncio.gather(*background)
+    background.clear()
+
+    prompt_chars = sum(len(m["content"]) for r in server.requests for m in r["messages"])
+    return len(server.requests) / RUNS, prompt_chars // 4 // RUNS, statistics.median(samples)
+
+
+async def run(server):
+    # Measure the LLM calls themselves, not the local topic cache
+    app.topic_cache = None
+    print(f"{'pipeline':>9} | {'calls':>5} | {'prompt tokens':>13} | {'latency ms':>10}")
+    print("-" * 47)
+    for name, pipeline in (("staged", staged), ("fused", fused), ("pipelined", pipelined)):
+        calls, tokens, latency = await measure(server, pipeline)
+        print(f"{name:>9} | {calls:>5.0f} | {tokens:>13} | {latency:>10.0f}")
+    await app.close_client()
+
+
+def main():
+    with FakeOpenAIServer(latency=BASE_LATENCY, prompt_token_delay=PROMPT_TOKEN_DELAY) as server:
+        os.environ["OPENAI_API_KEY"] = "benchmark"
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        asyncio.run(run(server))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark: full transcript vs rolling summary in the performance prompt
+
+Measures the prompt tokens and analyze_performance latency at turns 5, 50 and 200
+against a local fake endpoint that charges prefill time per prompt token. The full
+transcript is sent with the performance prompt budget switched off, and the token
+counts are taken from the requests the endpoint received.
+
+Usage:
+    python benchmarks/bench_rolling_summary.py
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from conversation import SUMMARY_MAX_CHARS, ConversationState  # noqa: E402
+from fake_openai import FakeOpenAIServer  # noqa: E402
+from token_budget import STAGE_PROMPT_BUDGETS  # noqa: E402
+
+TURNS = (5, 50, 200)
+RUNS = 3
+
+# Roughly 20k prompt tokens/sec of prefill on top of a fixed 100ms round trip
+BASE_LATENCY = 0.1
+PROMPT_TOKEN_DELAY = 0.00005
+
+USER_MESSAGE = "Hmm, I might be interested but is the battery still good and does it come with the dock?"
+AI_MESSAGE = (
+    "OMG!!! SO grateful you asked!!! The battery is CRUSHING IT like my morning grind!!! "
+    "And YES the dock is included - that's what I call SYNERGY!!! This Switch 1 has been on an "
+    "INCREDIBLE journey with me and it's ready to level up YOUR game!!! $180 and it's yours - "
+    "that's an investment in your FUTURE self!!! #Hustle #Grateful #SwitchLife"
+)
+
+
+def build_states(exchanges):
+    """Return (full, rolling) states as they look when the last user message arrives"""
+    full = ConversationState(window=None)
+    rolling = ConversationState()
+    for _ in range(exchanges - 1):
+        for state in (full, rolling):
+            state.append("user", USER_MESSAGE)
+            state.append("assistant", AI_MESSAGE)
+        # The summary is folded after every turn, so at most a full-size summary is carried
+        if rolling.pending:
+            rolling.pending.clear()
+            rolling.summary = ("Buyer asked about battery, dock and price. " * 40)[:SUMMARY_MAX_CHARS]
+    for state in (full, rolling):
+        state.append("user", USER_MESSAGE)
+    return full, rolling
+
+
+def sent_tokens(server):
+    """Prompt size of the last request the endpoint received, at ~4 characters per token"""
+    return sum(len(message.get("content") or "") for message in server.requests[-1]["messages"]) // 4
+
+
+async def measure(server, state, prompt_budget):
+    """Prompt tokens sent and median analyze_performance wall time in milliseconds
+
+    Args:
+        prompt_budget: Performance prompt budget for the run; 0 sends the whole transcript
+    """
+    saved = STAGE_PROMPT_BUDGETS["performance"]
+    STAGE_PROMPT_BUDGETS["performance"] = prompt_budget
+    try:
+        samples = []
+        for _ in range(RUNS):
+            started = time.perf_counter()
+            await app.analyze_performance(state)
+            samples.append((time.perf_counter() - started) * 1000)
+    finally:
+        STAGE_PROMPT_BUDGETS["performance"] = saved
+    return sent_tokens(server), statistics.median(samples)
+
+
+async def run(server):
+    print(f"{'turn':>5} | {'full tokens':>11} | {'rolling tokens':>14} | {'full ms':>8} | {'rolling ms':>10}")
+    print("-" * 62)
+    for turn in TURNS:
+        full, rolling = build_states(turn)
+        full_tokens, full_ms = await measure(server, full, 0)
+        rolling_tokens, rolling_ms = await measure(server, rolling, STAGE_PROMPT_BUDGETS["performance"])
+        print(f"{turn:>5} | {full_tokens:>11} | {rolling_tokens:>14} | {full_ms:>8.0f} | {rolling_ms:>10.0f}")
+    await app.close_client()
+
+
+def main():
+    with FakeOpenAIServer(latency=BASE_LATENCY, prompt_token_delay=PROMPT_TOKEN_DELAY) as server:
+        os.environ["OPENAI_API_KEY"] = "benchmark"
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        asyncio.run(run(server))
+
+
+if __name__ == "__main__":
+    main()
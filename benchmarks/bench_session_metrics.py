@@ -0,0 +1,67 @@
+"""
+Benchmark: debug panel metrics cost per turn, unbounded history vs SessionMetrics
+
+The legacy path appends every strategy to a list, recounts the distribution over the
+whole list and slices the last five twice on each turn. SessionMetrics keeps running
+counters and a ring buffer, so its per-turn cost should stay flat out to 10k turns.
+
+Usage:
+    python benchmarks/bench_session_metrics.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_metrics import SessionMetrics  # noqa: E402
+
+TURNS = 10_000
+CHECKPOINTS = (100, 1_000, 5_000, 10_000)
+STRATEGIES = ("build_rapport", "soft_sell", "direct_pitch", "create_urgency", "handle_objection")
+
+
+def legacy_turn(session, turn):
+    session["total_messages"] = session.get("total_messages", 0) + 1
+    session["peak_progress"] = max(session.get("peak_progress", 0), turn % 100)
+    strategy_history = session.setdefault("strategy_history", [])
+    strategy_history.append(STRATEGIES[turn % 5])
+    strategy_counts = {}
+    for s in strategy_history:
+        strategy_counts[s] = strategy_counts.get(s, 0) + 1
+    return " → ".join(strategy_history[-5:]), ", ".join(strategy_history[-5:])
+
+
+def metrics_turn(metrics, turn):
+    metrics.record(turn % 100, STRATEGIES[turn % 5])
+    recent = list(metrics.recent_strategies)
+    metrics.top_strategy()
+    return " → ".join(recent), ", ".join(recent)
+
+
+def run(turn_fn, session):
+    """Per-turn microseconds averaged over the 50 turns before each checkpoint"""
+    results = {}
+    window_start = 0.0
+    for turn in range(1, TURNS + 1):
+        if turn in [c - 50 for c in CHECKPOINTS]:
+            window_start = time.perf_counter()
+        turn_fn(session, turn)
+        if turn in CHECKPOINTS:
+            results[turn] = (time.perf_counter() - window_start) / 50 * 1e6
+    return results
+
+
+def main():
+    legacy = run(legacy_turn, {})
+    metrics = run(metrics_turn, SessionMetrics())
+
+    print(f"{'turn':>8} | {'legacy us/turn':>14} | {'metrics us/turn':>15}")
+    print("-" * 44)
+    for checkpoint in CHECKPOINTS:
+        print(f"{checkpoint:>8} | {legacy[checkpoint]:>14.1f} | {metrics[checkpoint]:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark: per-turn session store load and save cost
+
+For sessions of increasing length, measures what a turn pays to load its state (hot
+cache hit, or reload after eviction) and to save it, with the memory and SQLite
+backends, plus the saved size against the raw transcript.
+
+Usage:
+    python benchmarks/bench_session_store.py
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_store import MemoryBackend, SessionData, SessionStore, SQLiteBackend, encode_session  # noqa: E402
+
+SESSION_LENGTHS = (10, 100, 1000)
+REPEATS = 200
+
+MESSAGES = (
+    "how much for the switch? I saw one for 140 on marketplace",
+    "YOOO!!! SO grateful you asked!!! This Switch 1 is a GAME-CHANGER for your journey!!! Only $180!!!",
+)
+
+
+def build_session(messages):
+    session = SessionData()
+    for i in range(messages):
+        session.state.add(session.history.append("user" if i % 2 == 0 else "assistant", f"{MESSAGES[i % 2]} ({i})"))
+        if i % 2:
+            session.metrics.record(min(i, 90), "soft_sell")
+    session.state.summary = "Buyer is price sensitive and mostly plays Zelda. " * 6
+    return session
+
+
+async def per_call_us(fn, repeats=REPEATS):
+    started = time.perf_counter()
+    for _ in range(repeats):
+        await fn()
+    return (time.perf_counter() - started) / repeats * 1e6
+
+
+async def measure(store, session):
+    """(hot load, cold load, save) in microseconds for one session"""
+    await store.save("s", session)
+    hot = await per_call_us(lambda: store.get("s"))
+
+    async def cold():
+        store.release("s")
+        await store.get("s")
+
+    return hot, await per_call_us(cold), await per_call_us(lambda: store.save("s", session))
+
+
+async def run():
+    with tempfile.TemporaryDirectory() as directory:
+        backends = (("memory", MemoryBackend()), ("sqlite", SQLiteBackend(os.path.join(directory, "sessions.sqlite3"))))
+        print(
+            f"{'messages':>8} | {'backend':>7} | {'hot load us':>11} | {'reload us':>9} | {'save us':>8} | "
+            f"{'saved bytes':>11} | {'transcript bytes':>16}"
+        )
+        print("-" * 90)
+        for length in SESSION_LENGTHS:
+            session = build_session(length)
+            saved = len(encode_session(session))
+            for name, backend in backends:
+                hot, cold, save = await measure(SessionStore(backend), session)
+                print(
+                    f"{length:>8} | {name:>7} | {hot:>11.1f} | {cold:>9.1f} | {save:>8.1f} | "
+                    f"{saved:>11} | {session.history.chars:>16}"
+                )
+
+
+def main():
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
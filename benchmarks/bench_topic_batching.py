@@ -0,0 +1,56 @@
+"""
+Benchmark: analyze_topic micro-batching window vs latency and upstream requests
+
+Runs the offline load test at several TOPIC_BATCH_WINDOW_MS settings and reports how
+many topic requests reach the endpoint, the mean batch size, the wait batching adds
+and the resulting topic-stage and end-to-end turn latency.
+
+Usage:
+    python benchmarks/bench_topic_batching.py
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from loadtest import run_load_test  # noqa: E402
+
+USERS = 50
+TURNS = 2
+LATENCY = "lognormal:0.3:0.3"
+# Spreads turns out so waits reflect the window rather than 50 sessions starting at once
+THINK_TIME = 1.0
+WINDOWS_MS = (0, 2, 5, 10, 25, 50)
+MAX_SIZE = 16
+
+
+async def run():
+    # Measure the LLM calls themselves, not the local topic cache
+    app.topic_cache = None
+    print(
+        f"{'window ms':>9} | {'topic calls':>11} | {'per call':>8} | {'added wait p95':>14} | "
+        f"{'topic p50/p95 ms':>16} | {'turn p50 ms':>11} | {'requests/s':>10}"
+    )
+    print("-" * 100)
+    for window in WINDOWS_MS:
+        report = await run_load_test(
+            USERS, TURNS, LATENCY, think_time=THINK_TIME, topic_batch_window=window, topic_batch_size=MAX_SIZE
+        )
+        topic = report["latency_ms"]["topic"]
+        batching = report["topic_batching"] or {"batches": topic["count"], "mean_batch_size": 1.0, "wait_p95": 0.0}
+        print(
+            f"{window:>9} | {batching['batches']:>11} | {batching['mean_batch_size']:>8.1f} | "
+            f"{batching['wait_p95'] * 1000:>12.1f}ms | {topic['p50']:>7.0f}/{topic['p95']:<8.0f} | "
+            f"{report['latency_ms']['turn']['p50']:>11.0f} | {report['requests_per_sec']:>10.1f}"
+        )
+
+
+def main():
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+pytest-benchmark settings for the hot-path suite in this directory
+
+The suite only runs when benchmarks/ is passed explicitly, so the regular test run
+stays fast. Baselines are stored under benchmarks/.baselines, and comparing against
+one fails when a mean regresses by more than BENCHMARK_REGRESSION_THRESHOLD percent,
+unless --benchmark-compare-fail is given:
+
+    pytest benchmarks --no-cov --benchmark-save=baseline
+    pytest benchmarks --no-cov --benchmark-compare
+"""
+
+import os
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_STORAGE = os.path.join(BENCHMARKS_DIR, ".baselines")
+BENCHMARK_REGRESSION_THRESHOLD = int(os.getenv("BENCHMARK_REGRESSION_THRESHOLD", "20"))
+
+
+def pytest_ignore_collect(collection_path, config):
+    """Skip this directory unless it (or a file in it) was named on the command line"""
+    requested = [os.path.abspath(arg.split("::")[0]) for arg in config.args]
+    if not any(path == BENCHMARKS_DIR or path.startswith(BENCHMARKS_DIR + os.sep) for path in requested):
+        return True
+    return None
+
+
+def pytest_configure(config):
+    # Runs before pytest-benchmark's own (trylast) configure reads these options
+    if not hasattr(config.option, "benchmark_storage"):
+        return
+    if config.option.benchmark_storage == "file://./.benchmarks":
+        config.option.benchmark_storage = f"file://{BASELINE_STORAGE}"
+    if config.option.benchmark_compare and not config.option.benchmark_compare_fail:
+        from pytest_benchmark.utils import parse_compare_fail
+
+        config.option.benchmark_compare_fail = [parse_compare_fail(f"mean:{BENCHMARK_REGRESSION_THRESHOLD}%")]
@@ -0,0 +1,162 @@
+"""
+pytest-benchmark suite for the per-turn CPU hot paths
+
+Covers the debug panel rendering helpers and the transcript assembly behind
+analyze_performance and determine_strategy, with realistic and pathological inputs.
+See benchmarks/conftest.py for saving baselines and the regression threshold.
+"""
+
+import asyncio
+import contextvars
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from conversation import ConversationHistory, ConversationState  # noqa: E402
+from session_metrics import SessionMetrics  # noqa: E402
+
+USER_MESSAGE = "ok but is the battery still good and does it come with the dock?"
+AI_MESSAGE = "OMG!!! SO grateful you asked!!! The battery is CRUSHING IT and YES the dock is included!!! " * 3
+LONG_MESSAGE = "honestly " * 6000  # ~54 KB pasted wall of text
+
+PERFORMANCE = {
+    "progress_score": 64,
+    "buyer_interest": "medium",
+    "key_signals": ["asked about the dock", "mentioned Zelda", "haggling on price"],
+    "assessment": "Interested but price-sensitive",
+}
+TOPIC = {"current_topic": "Nintendo Switch accessories", "relevance_to_goal": "high"}
+STRATEGY = {"strategy": "soft_sell", "reasoning": "Interest is building", "approach": "Highlight the bundle"}
+TIMINGS = {"performance": 412.0, "topic": 388.5, "strategy": 351.2, "response": 905.7, "turn": 1703.4}
+
+
+def _history(turns, user_message=USER_MESSAGE, ai_message=AI_MESSAGE):
+    history = ConversationHistory()
+    for _ in range(turns):
+        history.append("user", user_message)
+        history.append("assistant", ai_message)
+    return history
+
+
+def _metrics(turns):
+    metrics = SessionMetrics()
+    for i in range(turns):
+        metrics.record(i % 100, app.strategy_policy.rules[i % len(app.strategy_policy.rules)]["strategy"])
+    return metrics
+
+
+@pytest.fixture
+def chainlit_session():
+    """Headless Chainlit context to run render_debug_panel in, since it reads per-session stats"""
+    from chainlit.context import init_http_context
+
+    async def start():
+        init_http_context()
+        return contextvars.copy_context()
+
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete(start())
+    loop.close()
+
+
+class TestPanelHelpers:
+    """Progress bar and emoji lookups, called on every panel render"""
+
+    def test_progress_bar(self, benchmark):
+        benchmark.group = "panel helpers"
+        benchmark(lambda: [app.create_progress_bar(score) for score in range(0, 101, 5)])
+
+    def test_emojis(self, benchmark):
+        benchmark.group = "panel helpers"
+        interests = ("low", "medium", "high", "unknown", "LOW")
+        strategies = ("direct_pitch", "soft_sell", "build_rapport", "create_urgency", "handle_objection", "other")
+        benchmark(lambda: [app.get_interest_emoji(i) for i in interests] + [app.get_strategy_emoji(s) for s in strategies])
+
+
+class TestRenderDebugPanel:
+    """Debug panel markdown assembly"""
+
+    def test_typical(self, benchmark, chainlit_session):
+        benchmark.group = "render panel"
+        metrics = _metrics(20)
+        benchmark(chainlit_session.run, app.render_debug_panel, PERFORMANCE, TOPIC, STRATEGY, metrics, TIMINGS)
+
+    def test_10k_strategy_history(self, benchmark, chainlit_session):
+        """Panel cost should not depend on how many strategies the session has used"""
+        benchmark.group = "render panel"
+        metrics = _metrics(10_000)
+        benchmark(chainlit_session.run, app.render_debug_panel, PERFORMANCE, TOPIC, STRATEGY, metrics, TIMINGS)
+
+    def test_long_fields(self, benchmark, chainlit_session):
+        """A model that ignores the length limits in its JSON"""
+        benchmark.group = "render panel"
+        performance = dict(PERFORMANCE, key_signals=[LONG_MESSAGE[:2000]] * 3, assessment=LONG_MESSAGE[:8000])
+        strategy = dict(STRATEGY, reasoning=LONG_MESSAGE[:4000], approach=LONG_MESSAGE[:4000])
+        benchmark(chainlit_session.run, app.render_debug_panel, performance, TOPIC, strategy, _metrics(20), TIMINGS, "alert")
+
+
+class TestPerformanceTranscript:
+    """ConversationState.render, the analyze_performance prompt body"""
+
+    def test_typical(self, benchmark):
+        benchmark.group = "performance transcript"
+        state = ConversationState.from_history(_history(4))
+        benchmark(state.render)
+
+    def test_10k_turn_session(self, benchmark):
+        """Rolling window keeps the render bounded however long the session is"""
+        benchmark.group = "performance transcript"
+        state = ConversationState.from_history(_history(10_000))
+        state.pending.clear()
+        state.summary = "Buyer asked about the battery and the dock and is haggling on price."
+        benchmark(state.render)
+
+    def test_unbounded_window_1k_turns(self, benchmark):
+        """Pathological: CONVERSATION_WINDOW disabled, full transcript every turn"""
+        benchmark.group = "performance transcript"
+        state = ConversationState.from_history(_history(1_000), window=None)
+        benchmark(state.render)
+
+    def test_long_messages(self, benchmark):
+        benchmark.group = "performance transcript"
+        state = ConversationState.from_history(_history(4, user_message=LONG_MESSAGE))
+        benchmark(state.render)
+
+
+class TestStrategyTranscript:
+    """Last-three-exchanges transcript for determine_strategy"""
+
+    def test_typical(self, benchmark):
+        benchmark.group = "strategy transcript"
+        history = _history(4)
+        benchmark(lambda: history.last_exchanges(3).transcript())
+
+    def test_10k_turn_session(self, benchmark):
+        benchmark.group = "strategy transcript"
+        history = _history(10_000)
+        benchmark(lambda: history.last_exchanges(3).transcript())
+
+    def test_long_messages(self, benchmark):
+        benchmark.group = "strategy transcript"
+        history = _history(4, user_message=LONG_MESSAGE)
+        benchmark(lambda: history.last_exchanges(3).transcript())
+
+
+class TestHistoryAppend:
+    """Recording a turn, done twice per message"""
+
+    def test_append(self, benchmark):
+        benchmark.group = "history append"
+        history = ConversationHistory()
+        benchmark(history.append, "user", USER_MESSAGE)
+
+    def test_append_long_message(self, benchmark):
+        benchmark.group = "history append"
+        history = ConversationHistory()
+        benchmark(history.append, "user", LONG_MESSAGE)
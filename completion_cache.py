@@ -0,0 +1,246 @@
+"""
+Content-addressed completion cache shared by every worker
+
+Completions are stored in SQLite keyed by a hash of the model, sampling parameters,
+response_format and the rendered prompt messages, so identical requests from any
+Chainlit worker on the host are only paid for once. WAL mode and a busy timeout keep
+it safe under concurrent writers; entries are evicted least-recently-used once the
+cache grows past its size limit. Lookups are plain reads: only a hit takes the write
+lock, and misses are counted in memory until the next write.
+
+Usage:
+    python completion_cache.py stats [--path PATH]
+    python completion_cache.py clear [--path PATH]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+
+from sqlite_connections import ThreadLocalConnection
+
+COMPLETION_CACHE_PATH = os.getenv("COMPLETION_CACHE_PATH", "")
+COMPLETION_CACHE_MAX_BYTES = int(os.getenv("COMPLETION_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# The 0.8-temperature response stage is left out so replies keep their variety
+COMPLETION_CACHE_STAGES = frozenset(
+    s.strip()
+    for s in os.getenv("COMPLETION_CACHE_STAGES", "performance,topic,strategy,analysis,summary").split(",")
+    if s.strip()
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    stage TEXT NOT NULL,
+    content TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+CREATE TABLE IF NOT EXISTS counters (
+    stage TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0,
+    writes INTEGER NOT NULL DEFAULT 0,
+    evictions INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS meta (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    total_bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (id, total_bytes) VALUES (1, 0);
+"""
+
+
+def cache_key(messages, **params) -> str:
+    """Hash the request fields that determine a completion"""
+    fields = {
+        "model": params.get("model"),
+        "temperature": params.get("temperature"),
+        "max_tokens": params.get("max_tokens"),
+        "response_format": params.get("response_format"),
+        "messages": messages,
+    }
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+class CompletionCache:
+    """SQLite-backed completion cache with size-based LRU eviction
+
+    Args:
+        path: Database file; every process pointing at it shares entries
+        max_bytes: Total content size kept before least recently used entries are evicted
+        stages: Stages allowed to read and write the cache
+    """
+
+    def __init__(self, path, max_bytes=COMPLETION_CACHE_MAX_BYTES, stages=COMPLETION_CACHE_STAGES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.stages = frozenset(stages)
+        self._connection = ThreadLocalConnection(path)
+        self._connection().executescript(_SCHEMA)
+        # Misses not yet written to the counters table, by stage
+        self._misses = {}
+        self._misses_lock = threading.Lock()
+
+    def enabled_for(self, stage: str) -> bool:
+        return stage in self.stages
+
+    def get_sync(self, stage: str, key: str):
+        """Return cached content for key, or None"""
+        db = self._connection()
+        row = db.execute("SELECT content FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            with self._misses_lock:
+                self._misses[stage] = self._misses.get(stage, 0) + 1
+            return None
+
+        misses = self._take_misses()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._count(db, stage, "hits")
+            self._write_misses(db, misses)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            self._restore_misses(misses)
+            raise
+        return row[0]
+
+    def put_sync(self, stage: str, key: str, content: str):
+        """Store content under key, evicting old entries if the cache is over its size limit"""
+        size = len(content.encode())
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        misses = self._take_misses()
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            old = db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            db.execute(
+                "INSERT OR REPLACE INTO entries (key, stage, content, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, stage, content, size, now, now),
+            )
+            db.execute("UPDATE meta SET total_bytes = total_bytes + ? WHERE id = 1", (size - (old[0] if old else 0),))
+            self._count(db, stage, "writes")
+            self._write_misses(db, misses)
+            self._evict(db)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            self._restore_misses(misses)
+            raise
+
+    async def get(self, stage: str, key: str):
+        return await asyncio.to_thread(self.get_sync, stage, key)
+
+    async def put(self, stage: str, key: str, content: str):
+        await asyncio.to_thread(self.put_sync, stage, key, content)
+
+    def _count(self, db, stage, column, n=1):
+        db.execute("INSERT OR IGNORE INTO counters (stage) VALUES (?)", (stage,))
+        db.execute(f"UPDATE counters SET {column} = {column} + ? WHERE stage = ?", (n, stage))
+
+    def _take_misses(self):
+        with self._misses_lock:
+            misses, self._misses = self._misses, {}
+        return misses
+
+    def _restore_misses(self, misses):
+        with self._misses_lock:
+            for stage, n in misses.items():
+                self._misses[stage] = self._misses.get(stage, 0) + n
+
+    def _write_misses(self, db, misses):
+        for stage, n in misses.items():
+            self._count(db, stage, "misses", n)
+
+    def _evict(self, db):
+        """Delete least recently used entries until the cache is back under 90% of its limit"""
+        total = db.execute("SELECT total_bytes FROM meta WHERE id = 1").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = total - int(self.max_bytes * 0.9)
+        freed = 0
+        for key, stage, size in db.execute("SELECT key, stage, size FROM entries ORDER BY accessed").fetchall():
+            if freed >= target:
+                break
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._count(db, stage, "evictions")
+            freed += size
+        db.execute("UPDATE meta SET total_bytes = total_bytes - ? WHERE id = 1", (freed,))
+
+    def stats(self) -> dict:
+        """Entry counts, size and per-stage hit/miss/write/eviction counters
+
+        Includes this process's misses that haven't been written yet; other processes' show up after their next write.
+        """
+        db = self._connection()
+        entries, total = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        stages = {
+            stage: {"hits": hits, "misses": misses, "writes": writes, "evictions": evictions}
+            for stage, hits, misses, writes, evictions in db.execute(
+                "SELECT stage, hits, misses, writes, evictions FROM counters ORDER BY stage"
+            )
+        }
+        with self._misses_lock:
+            pending = dict(self._misses)
+        for stage, n in pending.items():
+            stages.setdefault(stage, {"hits": 0, "misses": 0, "writes": 0, "evictions": 0})["misses"] += n
+        stages = dict(sorted(stages.items()))
+        return {"path": self.path, "entries": entries, "bytes": total, "max_bytes": self.max_bytes, "stages": stages}
+
+    def clear(self):
+        """Delete every entry and reset the counters"""
+        self._take_misses()
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        db.execute("DELETE FROM entries")
+        db.execute("DELETE FROM counters")
+        db.execute("UPDATE meta SET total_bytes = 0 WHERE id = 1")
+        db.execute("COMMIT")
+
+
+def format_stats(stats: dict) -> str:
+    """Render cache stats as a text table"""
+    lines = [
+        f"Cache: {stats['path']}",
+        f"Entries: {stats['entries']} | Size: {stats['bytes']} / {stats['max_bytes']} bytes",
+        "",
+        f"{'stage':<12} {'hits':>8} {'misses':>8} {'hit rate':>9} {'writes':>8} {'evictions':>10}",
+    ]
+    for stage, counts in stats["stages"].items():
+        lookups = counts["hits"] + counts["misses"]
+        hit_rate = f"{counts['hits'] / lookups:.0%}" if lookups else "-"
+        lines.append(
+            f"{stage:<12} {counts['hits']:>8} {counts['misses']:>8} {hit_rate:>9} "
+            f"{counts['writes']:>8} {counts['evictions']:>10}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or clear the shared completion cache")
+    parser.add_argument("command", choices=["stats", "clear"])
+    parser.add_argument("--path", default=COMPLETION_CACHE_PATH, help="Cache database (default: $COMPLETION_CACHE_PATH)")
+    args = parser.parse_args(argv)
+
+    if not args.path:
+        parser.error("no cache path - pass --path or set COMPLETION_CACHE_PATH")
+    cache = CompletionCache(args.path)
+    if args.command == "clear":
+        cache.clear()
+        print(f"Cleared {args.path}")
+    else:
+        print(format_stats(cache.stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Conversation history and incremental conversation state for the analysis prompts
+
+ConversationHistory stores each message once as a compact Turn record that caches its
+rendered transcript line and running character/token totals, so per-turn prompt
+assembly never re-renders old messages. ConversationState keeps a rolling summary of
+older messages plus the last few raw ones, so the transcript sent to
+analyze_performance stays bounded however long a session runs. Both can render within
+a token budget, dropping the oldest turns first and truncating the oldest one kept.
+"""
+
+import os
+from collections import deque
+
+# Raw messages kept verbatim before they are folded into the summary
+CONVERSATION_WINDOW = int(os.getenv("CONVERSATION_WINDOW", "8"))
+
+# Hard cap on the rolling summary, in case the summarizer ignores its length limit
+SUMMARY_MAX_CHARS = int(os.getenv("SUMMARY_MAX_CHARS", "1200"))
+
+# A turn truncated to fit a prompt budget is dropped instead if less than this much of it fits
+MIN_TRUNCATED_TOKENS = 16
+
+
+def render_message(role: str, content: str) -> str:
+    """Render one history entry as a transcript line"""
+    return f"{'User' if role == 'user' else 'AI'}: {content}"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token)"""
+    return (len(text) + 3) // 4
+
+
+def fit_lines(turns, max_tokens: int) -> list:
+    """Transcript lines of the newest turns that fit in max_tokens, oldest first
+
+    Turns are taken newest first until the next one doesn't fit; that one is kept
+    with the start of its content cut off if enough of it fits to be useful.
+    """
+    lines = []
+    remaining = max_tokens
+    for turn in reversed(turns):
+        # +1 for the newline joining the lines
+        if turn.tokens + 1 <= remaining:
+            lines.append(turn.line)
+            remaining -= turn.tokens + 1
+            continue
+        keep = (remaining - 1) * 4 - len(render_message(turn.role, "…"))
+        if keep >= 4 * MIN_TRUNCATED_TOKENS:
+            lines.append(render_message(turn.role, "…" + turn.content[-keep:]))
+        break
+    lines.reverse()
+    return lines
+
+
+class Turn:
+    """One message, with its transcript line and size computed once"""
+
+    __slots__ = ("role", "content", "line", "chars", "tokens")
+
+    def __init__(self, role: str, content: str):
+        self.role = role
+        self.content = content
+        self.line = render_message(role, content)
+        self.chars = len(self.line)
+        self.tokens = estimate_tokens(self.line)
+
+    def __repr__(self):
+        return f"Turn({self.role!r}, {self.content[:40]!r})"
+
+    def to_dict(self) -> dict:
+        return {"role": self.role, "content": self.content}
+
+
+class HistoryView:
+    """Read-only window over a ConversationHistory; creating one copies nothing"""
+
+    __slots__ = ("_history", "_start", "_stop")
+
+    def __init__(self, history, start: int, stop: int):
+        self._history = history
+        self._start = start
+        self._stop = stop
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __iter__(self):
+        turns = self._history._turns
+        for i in range(self._start, self._stop):
+            yield turns[i]
+
+    def __reversed__(self):
+        turns = self._history._turns
+        for i in range(self._stop - 1, self._start - 1, -1):
+            yield turns[i]
+
+    @property
+    def chars(self) -> int:
+        """Transcript characters in the window, excluding newlines"""
+        totals = self._history._total_chars
+        return totals[self._stop] - totals[self._start]
+
+    @property
+    def tokens(self) -> int:
+        """Estimated tokens in the window"""
+        totals = self._history._total_tokens
+        return totals[self._stop] - totals[self._start]
+
+    def transcript(self, max_tokens=None) -> str:
+        """Join the cached transcript lines, keeping the newest that fit in max_tokens if given"""
+        if max_tokens is not None and self.tokens + len(self) > max_tokens:
+            return "\n".join(fit_lines(self, max_tokens))
+        return "\n".join(turn.line for turn in self)
+
+
+class ConversationHistory:
+    """Append-only list of Turn records with running character and token totals"""
+
+    __slots__ = ("_turns", "_total_chars", "_total_tokens")
+
+    def __init__(self):
+        self._turns = []
+        # Prefix sums: _total_chars[i] is the size of the first i turns
+        self._total_chars = [0]
+        self._total_tokens = [0]
+
+    @classmethod
+    def from_messages(cls, messages):
+        """Build a history from a list of {'role', 'content'} dicts"""
+        history = cls()
+        for msg in messages:
+            history.append(msg["role"], msg["content"])
+        return history
+
+    def append(self, role: str, content: str) -> Turn:
+        turn = Turn(role, content)
+        self._turns.append(turn)
+        self._total_chars.append(self._total_chars[-1] + turn.chars)
+        self._total_tokens.append(self._total_tokens[-1] + turn.tokens)
+        return turn
+
+    def __len__(self):
+        return len(self._turns)
+
+    def __iter__(self):
+        return iter(self._turns)
+
+    def __getitem__(self, index):
+        return self._turns[index]
+
+    @property
+    def chars(self) -> int:
+        return self._total_chars[-1]
+
+    @property
+    def tokens(self) -> int:
+        return self._total_tokens[-1]
+
+    def last(self, n: int) -> HistoryView:
+        """The last n messages"""
+        stop = len(self._turns)
+        return HistoryView(self, max(stop - n, 0), stop)
+
+    def last_exchanges(self, n: int) -> HistoryView:
+        """The last n user/AI exchanges"""
+        return self.last(2 * n)
+
+    def to_dicts(self) -> list:
+        return [turn.to_dict() for turn in self._turns]
+
+
+class ConversationState:
+    """Rolling summary of older messages plus the last `window` raw messages
+
+    Args:
+        window: Number of raw messages to keep, or None to keep the whole transcript
+    """
+
+    def __init__(self, window=CONVERSATION_WINDOW):
+        self.window = window
+        self.summary = ""
+        self.recent = deque()
+        self.pending = []
+        self.total_messages = 0
+
+    @classmethod
+    def from_history(cls, conversation_history, window=CONVERSATION_WINDOW):
+        """Build a state from Turn records or {'role', 'content'} dicts"""
+        state = cls(window)
+        for msg in conversation_history:
+            if isinstance(msg, Turn):
+                state.add(msg)
+            else:
+                state.append(msg["role"], msg["content"])
+        return state
+
+    def append(self, role: str, content: str):
+        """Add a message, moving the oldest raw messages out of the window"""
+        self.add(Turn(role, content))
+
+    def add(self, turn: Turn):
+        """Add an already-recorded turn, reusing its rendered line"""
+        self.recent.append(turn)
+        self.total_messages += 1
+        if self.window is not None:
+            while len(self.recent) > self.window:
+                self.pending.append(self.recent.popleft())
+
+    def render(self, max_tokens=None) -> str:
+        """Render the summary and the recent raw messages as prompt text
+
+        With max_tokens, the oldest raw messages are dropped or truncated to fit; the summary is always kept.
+        """
+        # Messages waiting to be folded are still shown raw so nothing is lost between turns
+        turns = [*self.pending, *self.recent]
+        header = ""
+        if self.summary or self.pending:
+            header = f"Summary of earlier conversation:\n{self.summary or '(not yet summarized)'}\n\nRecent messages:\n"
+        if max_tokens is None:
+            return header + "\n".join(turn.line for turn in turns)
+        return header + "\n".join(fit_lines(turns, max_tokens - estimate_tokens(header)))
+
+    async def fold(self, summarize):
+        """Fold messages that left the window into the rolling summary
+
+        Args:
+            summarize: Async callable taking (summary, turns) and returning the new summary
+
+        Returns:
+            True if the summary was updated
+        """
+        if not self.pending:
+            return False
+
+        pending = list(self.pending)
+        summary = await summarize(self.summary, pending)
+        if summary is None:
+            # Summarization failed - the messages stay pending (still rendered raw) for the next fold
+            return False
+        # Messages that left the window while the summary was being written wait for the next fold
+        del self.pending[: len(pending)]
+        self.summary = summary[:SUMMARY_MAX_CHARS]
+        return True
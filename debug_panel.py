@@ -0,0 +1,111 @@
+"""
+Persistent debug panel message
+
+Each session gets one panel message that is edited in place with update() instead of
+posting a new multi-kilobyte message every turn. An update is skipped when the rendered
+content has not changed, and updates are throttled: content that arrives within
+DEBUG_PANEL_MIN_INTERVAL of the last send is held and flushed once the interval passes,
+so only the latest version is sent.
+"""
+
+import asyncio
+import json
+import os
+import time
+
+import chainlit as cl
+
+DEBUG_PANEL_MIN_INTERVAL = float(os.getenv("DEBUG_PANEL_MIN_INTERVAL", "1.0"))
+
+
+class DebugPanel:
+    """One panel message per session, updated in place
+
+    Args:
+        author: Author name shown on the panel message
+        min_interval: Minimum seconds between two sends; urgent content skips the wait
+    """
+
+    def __init__(self, author="🤖 Debug Panel", min_interval=DEBUG_PANEL_MIN_INTERVAL):
+        self.author = author
+        self.min_interval = min_interval
+        self.message = None
+        self.content = None
+        self._pending = None
+        self._flush_task = None
+        self._last_sent = 0.0
+
+        self.sends = 0
+        self.updates = 0
+        self.unchanged = 0
+        self.throttled = 0
+        self.bytes_sent = 0
+
+    async def publish(self, content: str, urgent: bool = False) -> bool:
+        """Show content in the panel, sending now or once the throttle interval has passed
+
+        Args:
+            content: Rendered panel markdown
+            urgent: Send immediately even inside the throttle interval (e.g. alerts)
+
+        Returns:
+            True if the panel was sent or updated by this call
+        """
+        if content == (self._pending if self._pending is not None else self.content):
+            self.unchanged += 1
+            return False
+
+        wait = self._last_sent + self.min_interval - time.monotonic()
+        if self.message is not None and not urgent and wait > 0:
+            self.throttled += 1
+            self._pending = content
+            if self._flush_task is None:
+                self._flush_task = asyncio.create_task(self._flush_later(wait))
+            return False
+
+        await self._send(content)
+        return True
+
+    async def flush(self):
+        """Send held content now, if any"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if self._pending is not None:
+            await self._send(self._pending)
+
+    async def _flush_later(self, delay: float):
+        await asyncio.sleep(delay)
+        self._flush_task = None
+        if self._pending is not None:
+            await self._send(self._pending)
+
+    async def _send(self, content: str):
+        self._pending = None
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+
+        if content == self.content:
+            return
+        self.content = content
+        self._last_sent = time.monotonic()
+        if self.message is None:
+            self.message = cl.Message(content=content, author=self.author)
+            await self.message.send()
+            self.sends += 1
+        else:
+            self.message.content = content
+            await self.message.update()
+            self.updates += 1
+        self.bytes_sent += len(json.dumps(self.message.to_dict(), default=str).encode())
+
+    def stats(self) -> dict:
+        """Send/update/skip counters and approximate bytes sent"""
+        return {
+            "sends": self.sends,
+            "updates": self.updates,
+            "unchanged": self.unchanged,
+            "throttled": self.throttled,
+            "bytes_sent": self.bytes_sent,
+        }
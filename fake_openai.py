@@ -0,0 +1,299 @@
+"""
+Local OpenAI-compatible stand-in for the chat completions endpoint
+
+Used by the tests, the benchmarks and loadtest.py, so everything runs offline. Latency
+can be a fixed delay or a distribution, streamed tokens arrive at a fixed rate, and
+errors can be injected for the next N requests or at random. Provider prompt caching can
+be simulated: prompt prefixes seen before are reported as cached_tokens, in 128-token
+steps from a minimum length, the way OpenAI reports them.
+
+Usage:
+    python fake_openai.py --port 8001 --latency lognormal:0.4:0.5 --token-rate 50
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=fake chainlit run app.py
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# One JSON body that satisfies every analysis stage
+ANALYSIS_RESULT = {
+    "progress_score": 50,
+    "buyer_interest": "medium",
+    "key_signals": ["asked about price"],
+    "assessment": "Curious but undecided",
+    "current_topic": "gaming",
+    "relevance_to_goal": "high",
+    "pivot_opportunity": "Mention the Switch library",
+    "strategy": "soft_sell",
+    "approach": "Share a favourite game",
+    "reasoning": "Interest is building",
+}
+
+# Numbered lines of a batched prompt ("1. ...") that each want their own result
+_BATCH_ITEM = re.compile(r"^(\d+)\. ", re.MULTILINE)
+
+RESPONSE_TEXT = "SO grateful for this question!!! The Switch 1 is a GAME-CHANGER!!!"
+
+
+def json_content(body: dict) -> str:
+    """ANALYSIS_RESULT, or {"results": [...]} with one per numbered item for a batched prompt"""
+    prompt = (body.get("messages") or [{}])[-1].get("content") or ""
+    if "- results:" not in prompt:
+        return json.dumps(ANALYSIS_RESULT)
+    ids = [int(number) for number in _BATCH_ITEM.findall(prompt.partition("Messages:")[2])]
+    return json.dumps({"results": [{"id": i, **ANALYSIS_RESULT} for i in ids]})
+
+
+def latency_distribution(spec):
+    """Build a latency sampler from seconds or a "kind:a:b" spec
+
+    Supported specs: a number of seconds, "uniform:low:high", "normal:mean:stddev"
+    and "lognormal:median:sigma". Samples are never negative.
+
+    Raises:
+        ValueError: If the spec is not recognized
+    """
+    if callable(spec):
+        return spec
+    if isinstance(spec, (int, float)):
+        return lambda: float(spec)
+
+    kind, *args = str(spec).split(":")
+    try:
+        if not args:
+            value = float(kind)
+            return lambda: value
+        a, b = (float(arg) for arg in args)
+    except ValueError:
+        raise ValueError(f"Invalid latency spec: {spec!r}") from None
+    if kind == "uniform":
+        return lambda: random.uniform(a, b)
+    if kind == "normal":
+        return lambda: max(random.gauss(a, b), 0.0)
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(a), b) if a > 0 else 0.0
+    raise ValueError(f"Invalid latency spec: {spec!r}")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connections when many sessions connect at once
+    request_queue_size = 128
+
+
+class FakeOpenAIServer:
+    """Threaded HTTP server answering /v1/chat/completions after a delay
+
+    Args:
+        latency: Seconds before the first byte, or a latency_distribution spec
+        token_delay: Seconds between streamed tokens (one SSE chunk per word)
+        prompt_token_delay: Extra prefill time per prompt token (estimated as 4 chars each)
+        error_status: HTTP status for injected errors
+        error_rate: Fraction of requests answered with error_status at random
+        prefix_cache_tokens: Shortest cacheable prompt prefix in tokens (OpenAI uses 1024);
+            0 reports fixed usage with nothing cached
+        port: Port to bind, 0 for any free port
+
+    Setting fail_next answers that many upcoming requests with error_status as well.
+    """
+
+    def __init__(
+        self,
+        latency=0.0,
+        token_delay: float = 0.0,
+        prompt_token_delay: float = 0.0,
+        error_status: int = 503,
+        error_rate: float = 0.0,
+        prefix_cache_tokens: int = 0,
+        port: int = 0,
+    ):
+        self.latency = latency_distribution(latency)
+        self.token_delay = token_delay
+        self.prompt_token_delay = prompt_token_delay
+        self.error_status = error_status
+        self.error_rate = error_rate
+        self.prefix_cache_tokens = prefix_cache_tokens
+        self._prefixes = set()
+        self.fail_next = 0
+        self.errors = 0
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", port), self._make_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def _record(self, body: dict) -> bool:
+        """Record a request and return True if it should fail"""
+        with self._lock:
+            self.requests.append(body)
+            if self.fail_next > 0:
+                self.fail_next -= 1
+            elif not (self.error_rate and random.random() < self.error_rate):
+                return False
+            self.errors += 1
+            return True
+
+    def usage(self, body: dict, completion_tokens: int) -> dict:
+        """Usage for a request, with simulated prompt caching when prefix_cache_tokens is set"""
+        if not self.prefix_cache_tokens:
+            return {"prompt_tokens": 10, "completion_tokens": completion_tokens, "total_tokens": 10 + completion_tokens}
+
+        prompt = body.get("model", "") + "".join(
+            f"\n{m.get('role')}:{m.get('content') or ''}" for m in body.get("messages", [])
+        )
+        prompt_tokens = len(prompt) // 4
+        cached = 0
+        with self._lock:
+            # Every cacheable prefix length is remembered, so a hit on a longer one implies the shorter ones
+            for size in range(self.prefix_cache_tokens, prompt_tokens + 1, 128):
+                key = hash(prompt[: size * 4])
+                if key in self._prefixes:
+                    cached = size
+                else:
+                    self._prefixes.add(key)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached},
+        }
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                fail = server._record(body)
+                prompt_tokens = sum(len(m.get("content") or "") for m in body.get("messages", [])) // 4
+                delay = server.latency() + prompt_tokens * server.prompt_token_delay
+                if delay:
+                    time.sleep(delay)
+                if fail:
+                    self._error()
+                    return
+
+                is_json = (body.get("response_format") or {}).get("type") == "json_object"
+                content = json_content(body) if is_json else RESPONSE_TEXT
+                if body.get("stream"):
+                    self._stream(body, content)
+                    return
+
+                payload = json.dumps(
+                    {
+                        "id": "chatcmpl-fake",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": body.get("model", "gpt-4o-mini"),
+                        "choices": [
+                            {
+                                "index": 0,
+                                "message": {"role": "assistant", "content": content},
+                                "finish_reason": "stop",
+                            }
+                        ],
+                        "usage": server.usage(body, 10),
+                    }
+                ).encode()
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _error(self):
+                payload = json.dumps({"error": {"message": "upstream unavailable", "type": "server_error"}}).encode()
+                self.send_response(server.error_status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _stream(self, body, content):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                words = content.split(" ")
+                for i, word in enumerate(words):
+                    if i and server.token_delay:
+                        time.sleep(server.token_delay)
+                    token = word if i == 0 else f" {word}"
+                    self._send_event({"choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}, body)
+                self._send_event({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}, body)
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    self._send_event({"choices": [], "usage": server.usage(body, len(words))}, body)
+                self._write_chunk(b"data: [DONE]\n\n")
+                self._write_chunk(b"")
+
+            def _send_event(self, chunk, body):
+                chunk = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": body.get("model", "gpt-4o-mini"),
+                    **chunk,
+                }
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+
+            def _write_chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local OpenAI-compatible stand-in server")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument(
+        "--latency", default="0.3", help='Seconds, or "uniform:a:b", "normal:mean:sd", "lognormal:median:sigma"'
+    )
+    parser.add_argument("--token-rate", type=float, default=0, help="Streamed tokens per second (0 = no delay)")
+    parser.add_argument("--error-rate", type=float, default=0, help="Fraction of requests that fail")
+    args = parser.parse_args(argv)
+
+    server = FakeOpenAIServer(
+        latency=args.latency,
+        token_delay=1 / args.token_rate if args.token_rate else 0,
+        error_rate=args.error_rate,
+        port=args.port,
+    )
+    with server:
+        print(f"Fake OpenAI endpoint at {server.base_url} (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
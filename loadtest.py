@@ -0,0 +1,252 @@
+"""
+Offline load test for one Chainlit worker
+
+Starts the local fake OpenAI endpoint, points get_client() at it and drives N simulated
+users through the real on_chat_start and on_message handlers in this process. Reports
+turn throughput, per-stage and end-to-end latency percentiles and event-loop lag, so
+the number of concurrent sessions one worker sustains can be measured in CI. The topic
+and completion caches are off for the run, since every simulated user repeats the same
+few messages and would otherwise be measuring cache hits. The process exits with status 1
+if any turn fails or a --max-*-ms SLO is missed.
+
+Usage:
+    python loadtest.py --users 50 --turns 5 --latency lognormal:0.4:0.5 --token-rate 60
+    python loadtest.py --users 200 --error-rate 0.05 --json
+    python loadtest.py --users 100 --topic-batch-window 10 --topic-batch-size 16
+    python loadtest.py --users 50 --max-turn-p95-ms 3000 --max-loop-lag-p95-ms 50
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+from fake_openai import FakeOpenAIServer
+from micro_batcher import TOPIC_BATCH_MAX_SIZE, MicroBatcher
+
+BUYER_MESSAGES = [
+    "hey what's up",
+    "How much for the Switch?",
+    "does it come with the dock and joycons?",
+    "is the battery still good",
+    "I mostly play zelda tbh",
+    "can you do 140?",
+    "lol ok what games are included",
+    "Is it still available",
+]
+
+STAGES = ("performance", "topic", "analysis", "strategy", "response", "turn")
+
+
+def percentile(samples, q):
+    """Nearest-rank percentile of a list of samples, or 0.0 for no samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "p50": percentile(samples, 0.5),
+        "p95": percentile(samples, 0.95),
+        "p99": percentile(samples, 0.99),
+        "max": max(samples, default=0.0),
+    }
+
+
+async def monitor_loop_lag(samples, stop, interval=0.01):
+    """Record how late the event loop wakes up from a short sleep, in ms"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(loop.time() - expected, 0.0) * 1000)
+
+
+async def simulate_user(app, user, turns, think_time, stage_samples, errors):
+    """One chat session: on_chat_start, then `turns` messages through on_message"""
+    import chainlit as cl
+    from chainlit.context import init_http_context
+
+    init_http_context()
+    await app.start()
+    for turn in range(turns):
+        if think_time:
+            await asyncio.sleep(random.uniform(0, 2 * think_time))
+        message = BUYER_MESSAGES[(user + turn) % len(BUYER_MESSAGES)]
+        try:
+            await app.main(cl.Message(content=message))
+        except Exception as e:
+            errors.append(repr(e))
+            continue
+        for stage, ms in (cl.user_session.get("stage_timings") or {}).items():
+            stage_samples.setdefault(stage, []).append(ms)
+
+
+async def run_load_test(
+    users=20,
+    turns=3,
+    latency="lognormal:0.3:0.4",
+    token_rate=0.0,
+    error_rate=0.0,
+    think_time=0.0,
+    topic_batch_window=None,
+    topic_batch_size=TOPIC_BATCH_MAX_SIZE,
+    caches=False,
+):
+    """Run the load test and return a report dict
+
+    Args:
+        users: Concurrent simulated sessions
+        turns: Messages each user sends
+        latency: Fake endpoint latency in seconds or as a distribution spec
+        token_rate: Streamed tokens per second (0 = no delay)
+        error_rate: Fraction of upstream requests that fail with a 503
+        think_time: Mean seconds a user waits before each message
+        topic_batch_window: Milliseconds to batch analyze_topic calls for this run (0 = off,
+            None = keep the app's TOPIC_BATCH_WINDOW_MS setting)
+        topic_batch_size: Largest topic batch when topic_batch_window is set
+        caches: Keep the topic and completion caches on (the run repeats a few messages,
+            so with them on it mostly measures cache hits)
+    """
+    import app
+
+    saved_batcher = app.topic_batcher
+    saved_caches = app.topic_cache, app.completion_cache
+    if not caches:
+        app.topic_cache = app.completion_cache = None
+    if topic_batch_window is not None:
+        app.topic_batcher = (
+            MicroBatcher(app.analyze_topic_batch, window=topic_batch_window / 1000, max_size=topic_batch_size)
+            if topic_batch_window > 0
+            else None
+        )
+    saved_env = {name: os.environ.get(name) for name in ("OPENAI_API_KEY", "OPENAI_BASE_URL")}
+    server = FakeOpenAIServer(latency=latency, token_delay=1 / token_rate if token_rate else 0.0, error_rate=error_rate)
+    with server:
+        os.environ["OPENAI_API_KEY"] = saved_env["OPENAI_API_KEY"] or "loadtest-key"
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        await app.close_client()
+        try:
+            stage_samples, errors, lag = {}, [], []
+            stop = asyncio.Event()
+            monitor = asyncio.create_task(monitor_loop_lag(lag, stop))
+            started = time.perf_counter()
+            await asyncio.gather(
+                *(simulate_user(app, user, turns, think_time, stage_samples, errors) for user in range(users))
+            )
+            elapsed = time.perf_counter() - started
+            stop.set()
+            await monitor
+            batcher = app.topic_batcher
+        finally:
+            app.topic_batcher = saved_batcher
+            app.topic_cache, app.completion_cache = saved_caches
+            await app.close_client()
+            for name, value in saved_env.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+    completed = len(stage_samples.get("turn", []))
+    return {
+        "users": users,
+        "turns": users * turns,
+        "completed_turns": completed,
+        "failed_turns": len(errors),
+        "elapsed_s": elapsed,
+        "turns_per_sec": completed / elapsed if elapsed else 0.0,
+        "upstream_requests": len(server.requests),
+        "upstream_errors": server.errors,
+        "requests_per_sec": len(server.requests) / elapsed if elapsed else 0.0,
+        "latency_ms": {stage: summarize(stage_samples[stage]) for stage in STAGES if stage in stage_samples},
+        "loop_lag_ms": summarize(lag),
+        "topic_batching": batcher.stats() if batcher is not None else None,
+    }
+
+
+def slo_violations(report, max_turn_p95_ms=None, max_loop_lag_p95_ms=None):
+    """Reasons the run failed: failed turns and missed latency SLOs (None skips an SLO)"""
+    violations = []
+    if report["failed_turns"]:
+        violations.append(f"{report['failed_turns']} of {report['turns']} turns failed")
+    turn_p95 = report["latency_ms"].get("turn", {}).get("p95", 0.0)
+    if max_turn_p95_ms is not None and turn_p95 > max_turn_p95_ms:
+        violations.append(f"turn p95 {turn_p95:.0f}ms is over {max_turn_p95_ms:.0f}ms")
+    lag_p95 = report["loop_lag_ms"]["p95"]
+    if max_loop_lag_p95_ms is not None and lag_p95 > max_loop_lag_p95_ms:
+        violations.append(f"loop lag p95 {lag_p95:.0f}ms is over {max_loop_lag_p95_ms:.0f}ms")
+    return violations
+
+
+def format_report(report):
+    """Render a report dict as a text table"""
+    lines = [
+        f"Users: {report['users']} | Turns: {report['completed_turns']}/{report['turns']} completed "
+        f"({report['failed_turns']} failed) in {report['elapsed_s']:.1f}s",
+        f"Throughput: {report['turns_per_sec']:.1f} turns/s | {report['requests_per_sec']:.1f} upstream requests/s "
+        f"({report['upstream_errors']} injected errors)",
+        "",
+        f"{'latency (ms)':<14} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}",
+    ]
+    for stage, s in list(report["latency_ms"].items()) + [("loop lag", report["loop_lag_ms"])]:
+        lines.append(f"{stage:<14} {s['p50']:>8.0f} {s['p95']:>8.0f} {s['p99']:>8.0f} {s['max']:>8.0f}")
+    batching = report.get("topic_batching")
+    if batching:
+        lines += [
+            "",
+            f"Topic batching: {batching['items']} requests in {batching['batches']} calls "
+            f"({batching['mean_batch_size']:.1f}/call) | added wait p50 {batching['wait_p50'] * 1000:.1f}ms "
+            f"/ p95 {batching['wait_p95'] * 1000:.1f}ms",
+        ]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test against a local fake OpenAI endpoint")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent simulated sessions")
+    parser.add_argument("--turns", type=int, default=3, help="Messages per user")
+    parser.add_argument(
+        "--latency", default="lognormal:0.3:0.4", help="Seconds, or uniform:a:b / normal:mean:sd / lognormal:median:sigma"
+    )
+    parser.add_argument("--token-rate", type=float, default=0, help="Streamed tokens per second (0 = no delay)")
+    parser.add_argument("--error-rate", type=float, default=0, help="Fraction of upstream requests that fail")
+    parser.add_argument("--think-time", type=float, default=0, help="Mean seconds between a user's messages")
+    parser.add_argument(
+        "--topic-batch-window", type=float, default=None, help="Milliseconds to batch analyze_topic calls (0 = off)"
+    )
+    parser.add_argument("--topic-batch-size", type=int, default=TOPIC_BATCH_MAX_SIZE, help="Largest topic batch")
+    parser.add_argument("--caches", action="store_true", help="Keep the topic and completion caches on")
+    parser.add_argument("--max-turn-p95-ms", type=float, default=None, help="Fail the run if turn p95 is over this")
+    parser.add_argument("--max-loop-lag-p95-ms", type=float, default=None, help="Fail the run if loop lag p95 is over this")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(
+        run_load_test(
+            args.users,
+            args.turns,
+            args.latency,
+            args.token_rate,
+            args.error_rate,
+            args.think_time,
+            args.topic_batch_window,
+            args.topic_batch_size,
+            args.caches,
+        )
+    )
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+    violations = slo_violations(report, args.max_turn_p95_ms, args.max_loop_lag_p95_ms)
+    for violation in violations:
+        print(f"FAILED: {violation}", file=sys.stderr)
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""
+Micro-batching of small, independent LLM requests across sessions
+
+Requests submitted within a short window (or until the batch is full) are handed to
+one handler call that answers them all, and each waiting coroutine gets its own
+result back. Fewer, larger requests trade a few milliseconds of added wait for less
+per-request overhead and rate-limit pressure under load. With no concurrent traffic a
+request waits the full window and goes out as a batch of one.
+"""
+
+import asyncio
+import os
+import time
+
+from telemetry import Histogram
+
+# Milliseconds to collect analyze_topic requests into one call; 0 sends each on its own
+TOPIC_BATCH_WINDOW_MS = float(os.getenv("TOPIC_BATCH_WINDOW_MS", "0"))
+TOPIC_BATCH_MAX_SIZE = int(os.getenv("TOPIC_BATCH_MAX_SIZE", "16"))
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+BATCH_WAIT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class MicroBatcher:
+    """Collects concurrent submit() calls into batches for one handler call
+
+    Args:
+        handler: Coroutine function taking a list of items and returning a list of
+            results in the same order
+        window: Seconds to wait for more items after the first one arrives
+        max_size: Items that trigger a batch before the window has passed
+        name: Label for the exported metrics
+    """
+
+    def __init__(self, handler, window=TOPIC_BATCH_WINDOW_MS / 1000, max_size=TOPIC_BATCH_MAX_SIZE, name="topic"):
+        self.handler = handler
+        self.window = window
+        self.max_size = max(max_size, 1)
+        self.name = name
+        self._queue = []  # (item, future, submitted)
+        self._timer = None
+        self._tasks = set()
+
+        self.batches = 0
+        self.items = 0
+        self.failures = 0
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+        self.wait_time = Histogram(BATCH_WAIT_BUCKETS)
+        self.batch_latency = Histogram()
+
+    async def submit(self, item):
+        """Queue an item and wait for its result
+
+        Raises:
+            Exception: Whatever the handler raised for the item's batch
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((item, future, time.perf_counter()))
+        if len(self._queue) >= self.max_size:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._dispatch)
+        return await future
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # Callers cancelled while waiting for the window are left out of the batch
+        batch = [entry for entry in self._queue if not entry[1].done()]
+        self._queue = []
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        started = time.perf_counter()
+        self.batches += 1
+        self.items += len(batch)
+        self.batch_size.observe(len(batch))
+        for _, _, submitted in batch:
+            self.wait_time.observe(started - submitted)
+
+        try:
+            results = await self.handler([item for item, _, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"{self.name} batch of {len(batch)} returned {len(results)} results")
+        except Exception as e:
+            self.failures += 1
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self.batch_latency.observe(time.perf_counter() - started)
+
+    def stats(self) -> dict:
+        """Batch counts, mean batch size, and the added wait against the batch call's latency"""
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "failures": self.failures,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "wait_p50": self.wait_time.quantile(0.5),
+            "wait_p95": self.wait_time.quantile(0.95),
+            "batch_latency_p50": self.batch_latency.quantile(0.5),
+        }
+
+    def format_stats(self) -> str:
+        """One line for the debug panel"""
+        s = self.stats()
+        return (
+            f"{s['items']} requests in {s['batches']} calls ({s['mean_batch_size']:.1f}/call) | "
+            f"added wait p50 {s['wait_p50'] * 1000:.1f}ms / p95 {s['wait_p95'] * 1000:.1f}ms"
+        )
+
+    def prometheus_lines(self) -> list:
+        """Batch size, added wait and batch-call latency histograms in Prometheus text format"""
+        labels = f'batcher="{self.name}"'
+        lines = []
+        for name, help_text, histogram in (
+            ("chatbot_batch_size", "Requests answered per batched call", self.batch_size),
+            ("chatbot_batch_wait_seconds", "Time a request waited for its batch to go out", self.wait_time),
+            ("chatbot_batch_latency_seconds", "Wall time of a batched call", self.batch_latency),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            lines += histogram.prometheus_lines(name, labels)
+        lines += [
+            "# HELP chatbot_batch_failures_total Batched calls that failed",
+            "# TYPE chatbot_batch_failures_total counter",
+        ]
+        lines.append(f"chatbot_batch_failures_total{{{labels}}} {self.failures}")
+        return lines
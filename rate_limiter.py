@@ -0,0 +1,219 @@
+"""
+Process-wide request scheduler for the organization's OpenAI rate limits
+
+Token buckets for requests per minute and tokens per minute are shared by every session
+on the worker. Each call reserves one request plus its estimated prompt tokens and
+max_tokens before it goes out; the difference is refunded once response.usage is known.
+Waiting calls are served strictly by priority class and FIFO within a class, so the
+response the user is waiting on goes ahead of analysis calls, and background work such
+as summaries goes last. Both limits default to 0, which disables the limiter.
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import time
+
+from conversation import estimate_tokens
+from telemetry import Histogram
+
+RATE_LIMIT_RPM = int(os.getenv("RATE_LIMIT_RPM", "0"))
+RATE_LIMIT_TPM = int(os.getenv("RATE_LIMIT_TPM", "0"))
+# Completion tokens reserved for calls that don't set max_tokens
+RATE_LIMIT_DEFAULT_COMPLETION_TOKENS = int(os.getenv("RATE_LIMIT_DEFAULT_COMPLETION_TOKENS", "256"))
+
+INTERACTIVE, ANALYSIS, BACKGROUND = 0, 1, 2
+PRIORITY_NAMES = ("interactive", "analysis", "background")
+
+STAGE_PRIORITIES = {
+    "response": INTERACTIVE,
+    "performance": ANALYSIS,
+    "topic": ANALYSIS,
+    "strategy": ANALYSIS,
+    "analysis": ANALYSIS,
+    "summary": BACKGROUND,
+}
+
+
+def estimate_prompt_tokens(messages) -> int:
+    """Prompt tokens, plus a few per message for the chat format"""
+    return sum(estimate_tokens(message.get("content") or "") + 4 for message in messages)
+
+
+def estimate_request_tokens(messages, max_tokens=None) -> int:
+    """Prompt tokens and the completion allowance"""
+    return estimate_prompt_tokens(messages) + (max_tokens or RATE_LIMIT_DEFAULT_COMPLETION_TOKENS)
+
+
+class RateLimiter:
+    """RPM/TPM token buckets with a strict-priority wait queue
+
+    Args:
+        rpm: Requests per minute, 0 for no request limit
+        tpm: Tokens per minute, 0 for no token limit
+    """
+
+    def __init__(self, rpm=RATE_LIMIT_RPM, tpm=RATE_LIMIT_TPM):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._waiters = []  # heap of (priority, seq, tokens, future)
+        self._seq = itertools.count()
+        self._timer = None
+
+        self.granted = [0] * len(PRIORITY_NAMES)
+        self.wait_time = [Histogram() for _ in PRIORITY_NAMES]
+
+    @property
+    def enabled(self) -> bool:
+        return self.rpm > 0 or self.tpm > 0
+
+    async def acquire(self, stage: str, tokens: int) -> int:
+        """Wait until the stage may send a request of about `tokens` tokens
+
+        Returns:
+            Tokens reserved, to pass to settle() once the real usage is known
+        """
+        if not self.enabled:
+            return 0
+        priority = STAGE_PRIORITIES.get(stage, ANALYSIS)
+        tokens = min(tokens, self.tpm) if self.tpm else 0
+        started = time.monotonic()
+
+        self._refill()
+        if not self._pending() and self._available(tokens):
+            self._take(tokens)
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._seq), tokens, future))
+            self._schedule()
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Granted just as the caller was cancelled - hand the capacity back
+                    self._refund(1, tokens)
+                raise
+
+        self.granted[priority] += 1
+        self.wait_time[priority].observe(time.monotonic() - started)
+        return tokens
+
+    def settle(self, reserved: int, used: int):
+        """Refund the part of a token reservation the call did not use"""
+        if self.tpm and used is not None and reserved > used:
+            self._refund(0, reserved - used)
+
+    def _refund(self, requests, tokens):
+        self._refill()
+        self._requests = min(self._requests + requests, self.rpm)
+        self._tokens = min(self._tokens + tokens, self.tpm)
+        if self._waiters:
+            self._schedule()
+
+    def _levels(self, now):
+        """Bucket levels at `now`, without changing any state"""
+        elapsed = now - self._updated
+        return min(self._requests + elapsed * self.rpm / 60, self.rpm), min(self._tokens + elapsed * self.tpm / 60, self.tpm)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._requests, self._tokens = self._levels(now)
+        self._updated = now
+
+    def _available(self, tokens) -> bool:
+        return (not self.rpm or self._requests >= 1) and (not self.tpm or self._tokens >= tokens)
+
+    def _take(self, tokens):
+        if self.rpm:
+            self._requests -= 1
+        if self.tpm:
+            self._tokens -= tokens
+
+    def _delay(self, tokens) -> float:
+        """Seconds until the buckets can cover one request of `tokens` tokens"""
+        delay = 0.0
+        if self.rpm:
+            delay = max(delay, (1 - self._requests) * 60 / self.rpm)
+        if self.tpm:
+            delay = max(delay, (tokens - self._tokens) * 60 / self.tpm)
+        return max(delay, 0.001)
+
+    def _pending(self) -> bool:
+        return any(not waiter[3].done() for waiter in self._waiters)
+
+    def _schedule(self):
+        """Grant waiters in priority order while capacity lasts, then wake up when the head can go"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._refill()
+        while self._waiters:
+            _, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self._available(tokens):
+                break
+            heapq.heappop(self._waiters)
+            self._take(tokens)
+            future.set_result(None)
+        if self._waiters:
+            self._timer = asyncio.get_running_loop().call_later(self._delay(self._waiters[0][2]), self._schedule)
+
+    def queue_depth(self) -> dict:
+        """Calls currently waiting, per priority class"""
+        depth = dict.fromkeys(PRIORITY_NAMES, 0)
+        # Copied first: the metrics exporter calls this from its own thread
+        for priority, _, _, future in list(self._waiters):
+            if not future.done():
+                depth[PRIORITY_NAMES[priority]] += 1
+        return depth
+
+    def stats(self) -> dict:
+        """Queue depth, grants and wait percentiles per priority class, plus bucket levels"""
+        requests, tokens = self._levels(time.monotonic())
+        depth = self.queue_depth()
+        return {
+            "requests_available": requests if self.rpm else None,
+            "tokens_available": tokens if self.tpm else None,
+            "classes": {
+                name: {
+                    "queued": depth[name],
+                    "granted": self.granted[priority],
+                    "wait_p50": self.wait_time[priority].quantile(0.5),
+                    "wait_p95": self.wait_time[priority].quantile(0.95),
+                }
+                for priority, name in enumerate(PRIORITY_NAMES)
+            },
+        }
+
+    def format_stats(self) -> str:
+        """One line for the debug panel"""
+        classes = self.stats()["classes"]
+        return " | ".join(
+            f"{name}: {s['queued']} queued, p95 wait {s['wait_p95'] * 1000:.0f}ms" for name, s in classes.items()
+        )
+
+    def prometheus_lines(self) -> list:
+        """Queue depth, bucket levels and wait-time histograms in Prometheus text format"""
+        stats = self.stats()
+        lines = [
+            "# HELP chatbot_rate_limit_queue_depth Calls waiting for rate limit capacity",
+            "# TYPE chatbot_rate_limit_queue_depth gauge",
+        ]
+        lines += [f'chatbot_rate_limit_queue_depth{{priority="{name}"}} {s["queued"]}' for name, s in stats["classes"].items()]
+        lines += ["# HELP chatbot_rate_limit_available Remaining bucket capacity", "# TYPE chatbot_rate_limit_available gauge"]
+        if self.rpm:
+            lines.append(f'chatbot_rate_limit_available{{bucket="requests"}} {stats["requests_available"]:.2f}')
+        if self.tpm:
+            lines.append(f'chatbot_rate_limit_available{{bucket="tokens"}} {stats["tokens_available"]:.0f}')
+
+        name = "chatbot_rate_limit_wait_seconds"
+        lines += [f"# HELP {name} Time calls waited for rate limit capacity", f"# TYPE {name} histogram"]
+        for priority, label in enumerate(PRIORITY_NAMES):
+            lines += self.wait_time[priority].prometheus_lines(name, f'priority="{label}"')
+        return lines
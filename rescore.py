@@ -0,0 +1,346 @@
+"""
+Offline bulk re-scoring of archived transcripts through analyze_performance
+
+Streams conversations from a JSONL file (one {"id": ..., "messages": [{"role", "content"}, ...]}
+object per line), replays each one turn by turn through the rolling summary like a live
+session, scores its final state with the app's own analyze_performance under bounded
+concurrency, and writes one row per conversation to a columnar file
+(.parquet with pyarrow installed, .npz otherwise). Every result is appended to a
+checkpoint file as it finishes, so an interrupted run picks up where it stopped.
+
+--batch-file writes the same performance requests in OpenAI Batch API format instead
+of calling the API; --from-batch-output turns the downloaded batch results into the
+same columnar file. Pass --baseline to compare the progress_score distribution against
+an earlier run's output.
+
+Usage:
+    python rescore.py transcripts.jsonl -o scores.npz --concurrency 32
+    python rescore.py transcripts.jsonl -o scores.npz --baseline scores_before.npz
+    python rescore.py transcripts.jsonl --batch-file batch_requests.jsonl
+    python rescore.py transcripts.jsonl -o scores.npz --from-batch-output batch_output.jsonl
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+
+import numpy as np
+
+import app
+from analysis_results import PerformanceResult, parse_object
+from conversation import CONVERSATION_WINDOW, ConversationState
+from token_budget import STAGE_PROMPT_BUDGETS
+
+COLUMNS = ("id", "progress_score", "buyer_interest", "key_signals", "assessment", "messages", "fallback", "prompt_version")
+
+RESCORE_CONCURRENCY = int(os.getenv("RESCORE_CONCURRENCY", "16"))
+
+
+def prompt_version(window=CONVERSATION_WINDOW) -> str:
+    """Short hash of everything that shapes a score, stored with every row
+
+    The evaluation and summary prompts, their call parameters and prompt budgets, and the
+    window of raw messages kept before older ones are summarized.
+    """
+    performance = app.performance_request(ConversationState())
+    performance.pop("messages")
+    settings = {
+        "performance": [performance, app.PERFORMANCE_EVAL_PROMPT, STAGE_PROMPT_BUDGETS.get("performance")],
+        "summary": [app.router.params("summary"), app.SUMMARY_PROMPT, STAGE_PROMPT_BUDGETS.get("summary")],
+        "window": window,
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def read_transcripts(path):
+    """Yield (id, messages) for each conversation in a JSONL file
+
+    Lines without an "id" are named after their line number.
+
+    Raises:
+        ValueError: If a line is not a JSON object with a "messages" list
+    """
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                messages = record["messages"]
+            except (ValueError, KeyError, TypeError):
+                raise ValueError(f"{path}:{number}: expected a JSON object with a messages list") from None
+            yield str(record.get("id", f"line-{number}")), messages
+
+
+def chat_messages(messages):
+    """The user and assistant messages of a transcript as {'role', 'content'} dicts"""
+    return [
+        {"role": m["role"], "content": str(m.get("content") or "")}
+        for m in messages
+        if isinstance(m, dict) and m.get("role") in ("user", "assistant")
+    ]
+
+
+def build_state(messages, window=CONVERSATION_WINDOW):
+    """Conversation state after the last message, with older messages not yet summarized"""
+    return ConversationState.from_history(chat_messages(messages), window=window or None)
+
+
+async def replay_state(messages, window=CONVERSATION_WINDOW):
+    """Conversation state as the live app would hold it after the last message
+
+    Messages are added one at a time and the summary is folded after each reply, as main()
+    does, so each summary call only sees the few messages that just left the window.
+    """
+    state = ConversationState(window or None)
+    for message in chat_messages(messages):
+        state.append(message["role"], message["content"])
+        if message["role"] == "assistant":
+            await state.fold(app.summarize_conversation)
+    return state
+
+
+def make_row(record_id, messages, result, version):
+    """One output row from an analyze_performance result"""
+    score = result.get("progress_score")
+    invalid = PerformanceResult.coerce(result).invalid
+    return {
+        "id": record_id,
+        "progress_score": float(score) if isinstance(score, (int, float)) else math.nan,
+        "buyer_interest": str(result.get("buyer_interest", "unknown")),
+        "key_signals": json.dumps(result.get("key_signals", [])),
+        "assessment": str(result.get("assessment", "")),
+        "messages": len(messages),
+        # Set when any field had to be defaulted, not only when the whole call failed
+        "fallback": bool(invalid),
+        "prompt_version": version,
+    }
+
+
+async def score_conversation(record_id, messages, window=CONVERSATION_WINDOW, version=None):
+    """Score one conversation with the live prompt, replaying it through the rolling summary first"""
+    state = await replay_state(messages, window)
+    result = await app.analyze_performance(state)
+    return make_row(record_id, messages, result, version or prompt_version(window))
+
+
+def load_checkpoint(path, version):
+    """Rows already written to a checkpoint file
+
+    A partly written last line (from a killed run) is ignored.
+
+    Raises:
+        ValueError: If the checkpoint was written with different prompts, models or settings
+    """
+    rows = []
+    if not os.path.exists(path):
+        return rows
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if row.get("prompt_version") != version:
+                raise ValueError(f"{path} was written with a different prompt, model or settings; use a new --checkpoint")
+            rows.append(row)
+    return rows
+
+
+async def rescore(input_path, checkpoint_path, concurrency=RESCORE_CONCURRENCY, window=CONVERSATION_WINDOW):
+    """Score every conversation not yet in the checkpoint file
+
+    Args:
+        input_path: JSONL transcripts
+        checkpoint_path: JSONL file results are appended to as they finish
+        concurrency: Conversations scored at once
+        window: Raw messages kept before older ones are summarized (0 = whole transcript)
+
+    Returns:
+        (rows, resumed): All rows in the checkpoint, and how many were there before this run
+    """
+    version = prompt_version(window)
+    rows = load_checkpoint(checkpoint_path, version)
+    resumed = len(rows)
+    done = {row["id"] for row in rows}
+
+    pending = set()
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+
+        def write(tasks):
+            for task in tasks:
+                row = task.result()
+                rows.append(row)
+                # Flushed per row so a killed run loses at most the conversations in flight
+                checkpoint.write(json.dumps(row) + "\n")
+                checkpoint.flush()
+
+        try:
+            for record_id, messages in read_transcripts(input_path):
+                if record_id in done:
+                    continue
+                done.add(record_id)
+                if len(pending) >= concurrency:
+                    finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    write(finished)
+                pending.add(asyncio.create_task(score_conversation(record_id, messages, window, version)))
+            if pending:
+                finished, pending = await asyncio.wait(pending)
+                write(finished)
+        finally:
+            for task in pending:
+                task.cancel()
+            await app.close_client()
+    return rows, resumed
+
+
+def write_batch_file(input_path, batch_path):
+    """Write one Batch API request per conversation, scoring the whole transcript
+
+    Older messages can't be summarized without calling the API, so every request
+    carries as much of the full transcript as the performance prompt budget allows
+    instead of the rolling summary.
+
+    Returns:
+        Number of requests written
+    """
+    count = 0
+    with open(batch_path, "w", encoding="utf-8") as f:
+        for record_id, messages in read_transcripts(input_path):
+            request = {
+                "custom_id": record_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": app.performance_request(build_state(messages, window=0)),
+            }
+            f.write(json.dumps(request) + "\n")
+            count += 1
+    return count
+
+
+def read_batch_output(input_path, output_path):
+    """Rows from a downloaded Batch API output file, matched to the input transcripts by id"""
+    # Batch requests carry the whole transcript (see write_batch_file)
+    version = prompt_version(window=0)
+    results = {}
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            try:
+                content = record["response"]["body"]["choices"][0]["message"]["content"]
+                results[record["custom_id"]] = PerformanceResult.from_dict(parse_object(content))
+            except (KeyError, IndexError, TypeError, ValueError):
+                results[record.get("custom_id")] = PerformanceResult.from_dict({})
+
+    return [
+        make_row(record_id, messages, results.get(record_id) or PerformanceResult.from_dict({}), version)
+        for record_id, messages in read_transcripts(input_path)
+    ]
+
+
+def write_columns(rows, path):
+    """Write rows to .parquet (needs pyarrow) or .npz, one column per field
+
+    Raises:
+        ValueError: For another extension, or .parquet without pyarrow installed
+    """
+    columns = {name: [row[name] for row in rows] for name in COLUMNS}
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("writing .parquet needs pyarrow (pip install pyarrow); use a .npz output instead") from None
+        pq.write_table(pa.table(columns), path)
+    elif path.endswith(".npz"):
+        np.savez_compressed(
+            path,
+            **{name: np.array(values, dtype=float if name == "progress_score" else None) for name, values in columns.items()},
+        )
+    else:
+        raise ValueError(f"unsupported output format: {path} (use .parquet or .npz)")
+
+
+def read_scores(path) -> np.ndarray:
+    """progress_score column of an earlier output file"""
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        return np.array(pq.read_table(path, columns=["progress_score"]).column(0).to_pylist(), dtype=float)
+    with np.load(path) as data:
+        return data["progress_score"]
+
+
+def describe(scores) -> dict:
+    """Count, mean and deciles of the scores that aren't NaN"""
+    scores = np.asarray(scores, dtype=float)
+    scores = scores[~np.isnan(scores)]
+    if not scores.size:
+        return {"count": 0, "mean": 0.0, "p10": 0.0, "p50": 0.0, "p90": 0.0}
+    p10, p50, p90 = np.percentile(scores, [10, 50, 90])
+    return {"count": int(scores.size), "mean": float(scores.mean()), "p10": p10, "p50": p50, "p90": p90}
+
+
+def format_summary(rows, baseline=None) -> str:
+    """Score distribution, interest levels and fallbacks, optionally against a baseline"""
+    current = describe([row["progress_score"] for row in rows])
+    interest = {}
+    for row in rows:
+        interest[row["buyer_interest"]] = interest.get(row["buyer_interest"], 0) + 1
+    fallbacks = sum(1 for row in rows if row["fallback"])
+
+    lines = [f"{'progress_score':<14} {'count':>7} {'mean':>7} {'p10':>7} {'p50':>7} {'p90':>7}"]
+    for label, s in (("current", current), ("baseline", baseline)):
+        if s is not None:
+            lines.append(f"{label:<14} {s['count']:>7} {s['mean']:>7.1f} {s['p10']:>7.1f} {s['p50']:>7.1f} {s['p90']:>7.1f}")
+    if baseline is not None and baseline["count"]:
+        mean_shift, median_shift = current["mean"] - baseline["mean"], current["p50"] - baseline["p50"]
+        lines.append(f"{'shift':<14} {'':>7} {mean_shift:>+7.1f} {'':>7} {median_shift:>+7.1f}")
+    lines.append("")
+    lines.append("Interest: " + ", ".join(f"{level} {count}" for level, count in sorted(interest.items())))
+    lines.append(f"Fallbacks: {fallbacks} of {len(rows)}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-score archived transcripts with the current performance prompt")
+    parser.add_argument("input", help="JSONL file with one {id, messages} object per line")
+    parser.add_argument("-o", "--output", help="Columnar output file (.parquet or .npz)")
+    parser.add_argument("--checkpoint", help="Resumable results file (default: OUTPUT.checkpoint.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=RESCORE_CONCURRENCY, help="Conversations scored at once")
+    parser.add_argument(
+        "--window", type=int, default=CONVERSATION_WINDOW, help="Raw messages before summarizing (0 = whole transcript)"
+    )
+    parser.add_argument("--baseline", help="Earlier output file to compare the score distribution against")
+    parser.add_argument("--batch-file", help="Write Batch API requests here instead of calling the API")
+    parser.add_argument("--from-batch-output", help="Build OUTPUT from a downloaded Batch API output file")
+    args = parser.parse_args(argv)
+
+    if args.batch_file:
+        count = write_batch_file(args.input, args.batch_file)
+        print(f"Wrote {count} requests to {args.batch_file}")
+        return
+    if not args.output:
+        parser.error("--output is required unless --batch-file is given")
+
+    try:
+        if args.from_batch_output:
+            rows, resumed = read_batch_output(args.input, args.from_batch_output), 0
+        else:
+            checkpoint = args.checkpoint or f"{args.output}.checkpoint.jsonl"
+            rows, resumed = asyncio.run(rescore(args.input, checkpoint, args.concurrency, args.window))
+        write_columns(rows, args.output)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(f"Scored {len(rows) - resumed} conversations ({resumed} from checkpoint) -> {args.output}")
+    print(format_summary(rows, describe(read_scores(args.baseline)) if args.baseline else None))
+
+
+if __name__ == "__main__":
+    main()
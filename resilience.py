@@ -0,0 +1,259 @@
+"""
+Deadlines, retries and circuit breakers for the OpenAI calls
+
+Every stage call gets a deadline covering all of its attempts and backoff (but not time
+spent queued locally for rate-limit capacity), retries transient
+upstream errors (connection failures, timeouts, 429s and 5xx) with full-jitter
+exponential backoff, and goes through a per-stage circuit breaker. After
+BREAKER_FAILURE_THRESHOLD consecutive failures the breaker opens and calls fail
+immediately with CircuitOpenError - the stage functions turn that into their fallback -
+until BREAKER_RESET_TIMEOUT has passed and a single trial call is let through.
+"""
+
+import asyncio
+import os
+import random
+import time
+
+import openai
+
+from stage_settings import parse_stage_values
+
+DEFAULT_DEADLINES = {
+    "performance": 10.0,
+    "topic": 10.0,
+    "strategy": 10.0,
+    "analysis": 15.0,
+    "summary": 15.0,
+    "response": 20.0,
+}
+
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.2"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "2.0"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+
+# Errors worth another attempt; anything else (bad request, auth) fails straight away
+RETRYABLE_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+COUNTERS = ("calls", "retries", "timeouts", "failures", "short_circuits")
+
+
+def parse_deadlines(value: str) -> dict:
+    """Parse "stage=seconds,..." overrides on top of DEFAULT_DEADLINES
+
+    Raises:
+        ValueError: If an entry is not stage=seconds
+    """
+    return {**DEFAULT_DEADLINES, **parse_stage_values(value, "STAGE_DEADLINES", float, "seconds")}
+
+
+STAGE_DEADLINES = parse_deadlines(os.getenv("STAGE_DEADLINES", ""))
+
+
+def _remaining(deadline, spent):
+    """Seconds left of a deadline (None for none), never negative so wait_for times out at once"""
+    return None if deadline is None else max(deadline - spent, 0.0)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a stage whose breaker is open"""
+
+
+class StageTimeoutError(Exception):
+    """Raised when a stage misses its deadline"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker: closed -> open -> half_open -> closed
+
+    Args:
+        failure_threshold: Consecutive failures that open the breaker
+        reset_timeout: Seconds to stay open before allowing one trial call
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self._trial = False
+
+    def allow(self) -> bool:
+        """Return True if a call may go ahead"""
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._trial:
+                return False
+            self._trial = True
+        return True
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._trial = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.opens += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """Give back a trial slot for a call that was cancelled before it finished"""
+        self._trial = False
+
+
+class Resilience:
+    """Per-stage deadlines, retries and circuit breakers, with counters
+
+    Args:
+        deadlines: Seconds per stage for the call including retries
+        max_attempts: Attempts per call, including the first
+        base_delay: Backoff ceiling for the first retry; doubles on each attempt
+        max_delay: Upper bound for the backoff ceiling
+        failure_threshold: Consecutive failures that open a stage's breaker
+        reset_timeout: Seconds a breaker stays open
+    """
+
+    def __init__(
+        self,
+        deadlines=None,
+        max_attempts=RETRY_MAX_ATTEMPTS,
+        base_delay=RETRY_BASE_DELAY,
+        max_delay=RETRY_MAX_DELAY,
+        failure_threshold=BREAKER_FAILURE_THRESHOLD,
+        reset_timeout=BREAKER_RESET_TIMEOUT,
+    ):
+        self.deadlines = STAGE_DEADLINES if deadlines is None else deadlines
+        self.max_attempts = max(max_attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers = {}
+        self.counters = {}
+
+    def breaker(self, stage: str) -> CircuitBreaker:
+        if stage not in self.breakers:
+            self.breakers[stage] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        return self.breakers[stage]
+
+    def _count(self, stage: str, name: str):
+        self.counters.setdefault(stage, dict.fromkeys(COUNTERS, 0))[name] += 1
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter delay before retry number `attempt` (1-based)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    async def call(self, stage: str, attempt, can_retry=None, acquire=None):
+        """Run attempt() under the stage's deadline, retry policy and breaker
+
+        Args:
+            stage: Pipeline stage name
+            attempt: Zero-argument coroutine function making one request
+            can_retry: Optional callable; retries stop once it returns False
+                (e.g. after a streamed token has already reached the user)
+            acquire: Optional zero-argument coroutine function awaited before each attempt
+                (e.g. waiting for rate-limit capacity); the time it takes doesn't count
+                against the deadline
+
+        Raises:
+            CircuitOpenError: The stage's breaker is open
+            StageTimeoutError: The deadline passed before an attempt succeeded
+        """
+        breaker = self.breaker(stage)
+        if not breaker.allow():
+            self._count(stage, "short_circuits")
+            raise CircuitOpenError(f"{stage} circuit is open")
+
+        self._count(stage, "calls")
+        try:
+            result = await self._attempts(stage, attempt, can_retry, acquire)
+        except asyncio.TimeoutError:
+            self._count(stage, "timeouts")
+            breaker.record_failure()
+            raise StageTimeoutError(f"{stage} missed its {self.deadlines.get(stage)}s deadline") from None
+        except RETRYABLE_ERRORS:
+            self._count(stage, "failures")
+            breaker.record_failure()
+            raise
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception:
+            # The upstream answered (e.g. 400) - a caller bug, not an outage, so the breaker stays closed
+            self._count(stage, "failures")
+            breaker.record_success()
+            raise
+        breaker.record_success()
+        return result
+
+    async def _attempts(self, stage, attempt, can_retry, acquire):
+        deadline = self.deadlines.get(stage)
+        spent = 0.0  # Seconds of the deadline used so far; waits in acquire() are left out
+        for number in range(1, self.max_attempts + 1):
+            if acquire is not None:
+                await acquire()
+            started = time.monotonic()
+            try:
+                return await asyncio.wait_for(attempt(), _remaining(deadline, spent))
+            except RETRYABLE_ERRORS:
+                if number == self.max_attempts or (can_retry is not None and not can_retry()):
+                    raise
+            finally:
+                spent += time.monotonic() - started
+            self._count(stage, "retries")
+            started = time.monotonic()
+            await asyncio.wait_for(asyncio.sleep(self.backoff(number)), _remaining(deadline, spent))
+            spent += time.monotonic() - started
+
+    def stats(self) -> dict:
+        """Per-stage breaker state and call/retry/timeout/failure/short-circuit counts"""
+        # Copied first, and no breakers are created here: the metrics exporter calls this from its own thread
+        counters = {stage: dict(counts) for stage, counts in list(self.counters.items())}
+        breakers = dict(list(self.breakers.items()))
+        return {
+            stage: {
+                "state": breakers[stage].state if stage in breakers else "closed",
+                "opens": breakers[stage].opens if stage in breakers else 0,
+                **counters.get(stage, dict.fromkeys(COUNTERS, 0)),
+            }
+            for stage in sorted(set(counters) | set(breakers))
+        }
+
+    def prometheus_lines(self) -> list:
+        """Breaker state and counters in Prometheus text format"""
+        stats = self.stats()
+        lines = [
+            "# HELP chatbot_breaker_open Whether a stage's circuit breaker is open (1) or half open (0.5)",
+            "# TYPE chatbot_breaker_open gauge",
+        ]
+        for stage, s in stats.items():
+            value = {"closed": 0, "half_open": 0.5, "open": 1}[s["state"]]
+            lines.append(f'chatbot_breaker_open{{stage="{stage}"}} {value}')
+        for counter in ("opens",) + COUNTERS[1:]:
+            name = f"chatbot_resilience_{counter}_total"
+            lines += [f"# HELP {name} Resilience layer {counter.replace('_', ' ')}", f"# TYPE {name} counter"]
+            lines += [f'{name}{{stage="{stage}"}} {s[counter]}' for stage, s in stats.items()]
+        return lines
+
+    def format_stats(self) -> str:
+        """One line per stage that has retried, failed or opened its breaker"""
+        lines = []
+        for stage, s in self.stats().items():
+            if s["retries"] or s["timeouts"] or s["failures"] or s["short_circuits"] or s["state"] != "closed":
+                lines.append(
+                    f"{stage}: {s['state']} | {s['retries']} retries, {s['timeouts']} timeouts, "
+                    f"{s['failures']} failures, {s['short_circuits']} short-circuited"
+                )
+        return "\n".join(lines)
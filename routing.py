@@ -0,0 +1,298 @@
+"""
+Per-stage model routing with latency fallback and escalation
+
+Every stage call goes through a Route: the model, temperature, max_tokens and
+response_format the stage is sent with. Topic classification doesn't need the model
+that writes the persona's replies, so each stage can be pointed at its own model.
+
+A route can also name:
+- a fast_model: when the primary model's p95 latency for the stage over the last
+  ROUTING_WINDOW_S seconds goes over latency_slo_ms, the next calls go to the fast
+  model. Once the slow samples age out of the window, calls go back to the primary.
+- an escalation_model: when an analysis completion fails schema validation, the call
+  is made once more with this stronger model to fill in the fields that were wrong.
+
+Routes come from STAGE_ROUTES_FILE (a JSON object of stage -> route settings), with
+STAGE_MODELS, STAGE_FAST_MODELS and STAGE_ESCALATION_MODELS ("stage=model,...") as
+shortcuts for the models. Each decision is counted for the debug panel and /metrics.
+With ROUTING_LOG set, it is also appended to that JSONL file with the call's latency,
+so the SLOs and model choices can be tuned; entries are buffered and written from a worker
+thread so the event loop never waits on the file.
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import deque
+
+from stage_settings import parse_stage_values
+from token_budget import STAGE_MAX_TOKENS
+
+DEFAULT_MODEL = "gpt-4o-mini"
+
+JSON_OBJECT = {"type": "json_object"}
+
+DEFAULT_ROUTES = {
+    "performance": {"temperature": 0.3, "response_format": JSON_OBJECT},
+    "topic": {"temperature": 0.3, "response_format": JSON_OBJECT},
+    "strategy": {"temperature": 0.5, "response_format": JSON_OBJECT},
+    "analysis": {"temperature": 0.3, "response_format": JSON_OBJECT},
+    "summary": {"temperature": 0.3},
+    "response": {"temperature": 0.8},
+}
+
+STAGE_ROUTES_FILE = os.getenv("STAGE_ROUTES_FILE", "")
+STAGE_MODELS = os.getenv("STAGE_MODELS", "")
+STAGE_FAST_MODELS = os.getenv("STAGE_FAST_MODELS", "")
+STAGE_ESCALATION_MODELS = os.getenv("STAGE_ESCALATION_MODELS", "")
+
+# p95 latency above which a stage with a fast_model uses it, unless its route sets latency_slo_ms
+ROUTING_LATENCY_SLO_MS = float(os.getenv("ROUTING_LATENCY_SLO_MS", "2000"))
+# Seconds of latency samples the p95 is computed over, and the fewest samples it is trusted with
+ROUTING_WINDOW_S = float(os.getenv("ROUTING_WINDOW_S", "60"))
+ROUTING_MIN_SAMPLES = int(os.getenv("ROUTING_MIN_SAMPLES", "5"))
+# JSONL file every routing decision is appended to, with its latency; empty disables it
+ROUTING_LOG = os.getenv("ROUTING_LOG", "")
+
+ROUTE_SETTINGS = (
+    "model",
+    "temperature",
+    "max_tokens",
+    "response_format",
+    "fast_model",
+    "escalation_model",
+    "latency_slo_ms",
+)
+
+
+def parse_models(value: str, setting: str) -> dict:
+    """Parse "stage=model,..." into a dict
+
+    Raises:
+        ValueError: If an entry is not stage=model
+    """
+    return parse_stage_values(value, setting, unit="model")
+
+
+class Route:
+    """How one stage's calls are sent
+
+    Args:
+        model: Primary model
+        temperature: Sampling temperature, None to leave it out
+        max_tokens: Completion limit, None to leave it out
+        response_format: e.g. {"type": "json_object"}, None for plain text
+        fast_model: Model used while the primary's p95 is over latency_slo_ms
+        escalation_model: Model asked again when the output fails validation
+        latency_slo_ms: p95 latency the primary model should stay under
+    """
+
+    __slots__ = ROUTE_SETTINGS
+
+    def __init__(
+        self,
+        model=DEFAULT_MODEL,
+        temperature=None,
+        max_tokens=None,
+        response_format=None,
+        fast_model=None,
+        escalation_model=None,
+        latency_slo_ms=ROUTING_LATENCY_SLO_MS,
+    ):
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.response_format = response_format
+        self.fast_model = fast_model
+        self.escalation_model = escalation_model
+        self.latency_slo_ms = latency_slo_ms
+
+    def params(self, model=None) -> dict:
+        """Chat completion parameters for a call to model (the primary by default)"""
+        params = {"model": model or self.model}
+        for name in ("temperature", "max_tokens", "response_format"):
+            value = getattr(self, name)
+            if value is not None:
+                params[name] = value
+        return params
+
+
+def load_routes(path: str = STAGE_ROUTES_FILE) -> dict:
+    """Routes for every stage: defaults, then the routes file, then the model settings
+
+    Raises:
+        ValueError: If the routes file or a model setting is malformed
+    """
+    settings = {stage: {**route, "max_tokens": STAGE_MAX_TOKENS.get(stage)} for stage, route in DEFAULT_ROUTES.items()}
+    if path:
+        with open(path, encoding="utf-8") as f:
+            overrides = json.load(f)
+        if not isinstance(overrides, dict):
+            raise ValueError(f"{path} must hold a JSON object of stage -> route settings")
+        for stage, route in overrides.items():
+            unknown = set(route) - set(ROUTE_SETTINGS)
+            if unknown:
+                raise ValueError(f"{path}: unknown route settings for {stage}: {', '.join(sorted(unknown))}")
+            settings.setdefault(stage, {}).update(route)
+    for value, setting, name in (
+        (STAGE_MODELS, "STAGE_MODELS", "model"),
+        (STAGE_FAST_MODELS, "STAGE_FAST_MODELS", "fast_model"),
+        (STAGE_ESCALATION_MODELS, "STAGE_ESCALATION_MODELS", "escalation_model"),
+    ):
+        for stage, model in parse_models(value, setting).items():
+            settings.setdefault(stage, {})[name] = model
+    return {stage: Route(**route) for stage, route in settings.items()}
+
+
+class Decision:
+    """Where one call was sent and why: "primary", "latency" (fast model) or "escalation" """
+
+    __slots__ = ("stage", "model", "reason", "p95_ms")
+
+    def __init__(self, stage, model, reason, p95_ms=None):
+        self.stage = stage
+        self.model = model
+        self.reason = reason
+        self.p95_ms = p95_ms
+
+
+class Router:
+    """Picks each call's model from its stage's route and recent latencies
+
+    Args:
+        routes: Stage name -> Route; stages without one use a default route
+        window: Seconds of latency samples kept per stage and model
+        min_samples: Samples needed before a p95 can divert calls
+        log_path: JSONL file decisions are appended to, empty for none
+    """
+
+    def __init__(self, routes=None, window=ROUTING_WINDOW_S, min_samples=ROUTING_MIN_SAMPLES, log_path=ROUTING_LOG):
+        self.routes = load_routes("") if routes is None else routes
+        self.window = window
+        self.min_samples = min_samples
+        self.log_path = log_path
+        self._samples = {}  # (stage, model) -> deque of (monotonic time, seconds)
+        self.counts = {}  # (stage, model, reason) -> calls
+        self._log = []  # JSONL lines not yet written to log_path
+        self._log_writer = None
+
+    @classmethod
+    def from_env(cls):
+        """Build the router from STAGE_ROUTES_FILE and the STAGE_*MODELS settings"""
+        return cls(routes=load_routes())
+
+    @property
+    def adaptive(self) -> bool:
+        """True if any stage can be sent to a model other than its primary"""
+        return any(route.fast_model or route.escalation_model for route in self.routes.values())
+
+    def route(self, stage: str) -> Route:
+        route = self.routes.get(stage)
+        if route is None:
+            route = self.routes[stage] = Route(max_tokens=STAGE_MAX_TOKENS.get(stage))
+        return route
+
+    def params(self, stage: str) -> dict:
+        """The stage's primary parameters, for requests sent outside complete() (Batch API files)"""
+        return self.route(stage).params()
+
+    def choose(self, stage: str, escalate: bool = False):
+        """Decide where the next call of a stage goes
+
+        Returns:
+            (decision, params): The decision to pass to record(), and the call's parameters
+        """
+        route = self.route(stage)
+        if escalate and route.escalation_model:
+            decision = Decision(stage, route.escalation_model, "escalation")
+        else:
+            p95 = self.p95(stage, route.model)
+            if route.fast_model and p95 is not None and p95 * 1000 > route.latency_slo_ms:
+                decision = Decision(stage, route.fast_model, "latency", p95 * 1000)
+            else:
+                decision = Decision(stage, route.model, "primary", None if p95 is None else p95 * 1000)
+        key = (stage, decision.model, decision.reason)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        return decision, route.params(decision.model)
+
+    def can_escalate(self, stage: str) -> bool:
+        return bool(self.route(stage).escalation_model)
+
+    def record(self, decision: Decision, latency: float, error: bool = False):
+        """Add a finished call's latency (in seconds) to its model's window and log the decision"""
+        samples = self._samples.get((decision.stage, decision.model))
+        if samples is None:
+            samples = self._samples[(decision.stage, decision.model)] = deque(maxlen=1000)
+        samples.append((time.monotonic(), latency))
+        if self.log_path:
+            entry = {
+                "time": round(time.time(), 3),
+                "stage": decision.stage,
+                "model": decision.model,
+                "reason": decision.reason,
+                "p95_ms": None if decision.p95_ms is None else round(decision.p95_ms, 1),
+                "latency_ms": round(latency * 1000, 1),
+                "error": error,
+            }
+            self._log.append(json.dumps(entry) + "\n")
+            if self._log_writer is None:
+                try:
+                    self._log_writer = asyncio.get_running_loop().create_task(self._write_log())
+                except RuntimeError:
+                    # No event loop (scripts, tests) - nothing to block, so write it now
+                    self._append_log(self._take_log())
+
+    async def flush(self):
+        """Wait until every logged decision has been written"""
+        if self._log_writer is not None:
+            await self._log_writer
+
+    async def _write_log(self):
+        try:
+            # Entries recorded while a write is in flight go out with the next one
+            while self._log:
+                await asyncio.to_thread(self._append_log, self._take_log())
+        except OSError as e:
+            print(f"Routing log error: {e}")
+        finally:
+            self._log_writer = None
+
+    def _take_log(self) -> list:
+        lines, self._log = self._log, []
+        return lines
+
+    def _append_log(self, lines):
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+
+    def p95(self, stage: str, model: str):
+        """p95 latency in seconds of the model's calls for the stage within the window, or None with too few samples"""
+        samples = self._samples.get((stage, model))
+        if not samples:
+            return None
+        cutoff = time.monotonic() - self.window
+        while samples and samples[0][0] < cutoff:
+            samples.popleft()
+        if len(samples) < self.min_samples:
+            return None
+        latencies = sorted(latency for _, latency in samples)
+        return latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+
+    def prometheus_lines(self) -> list:
+        """Routing decision counts in Prometheus text format"""
+        name = "chatbot_route_calls_total"
+        lines = [f"# HELP {name} Stage calls by the model they were routed to and why", f"# TYPE {name} counter"]
+        # Copied first: the metrics exporter calls this from its own thread while choose() adds keys
+        for (stage, model, reason), count in sorted(list(self.counts.items())):
+            lines.append(f'{name}{{stage="{stage}",model="{model}",reason="{reason}"}} {count}')
+        return lines
+
+    def format_stats(self) -> str:
+        """One line for the debug panel: calls that didn't go to their primary model"""
+        diverted = [
+            f"{stage} → {model} ({reason}) ×{count}"
+            for (stage, model, reason), count in sorted(list(self.counts.items()))
+            if reason != "primary"
+        ]
+        return ", ".join(diverted) if diverted else "all calls on their primary model"
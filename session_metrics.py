@@ -0,0 +1,50 @@
+"""
+Per-session metrics for the debug panel
+
+Running totals, a per-strategy counter and a fixed-size ring buffer of recent strategies,
+so recording a turn and rendering the panel cost the same at turn 10,000 as at turn 1
+and a session's metrics never grow with its length.
+"""
+
+import os
+from collections import deque
+
+# Recent strategies shown in the debug panel's history trail
+STRATEGY_HISTORY_SIZE = int(os.getenv("STRATEGY_HISTORY_SIZE", "5"))
+
+
+class SessionMetrics:
+    """Running counters for one chat session
+
+    Args:
+        history_size: Number of recent strategies kept in the ring buffer
+    """
+
+    __slots__ = ("total_messages", "peak_progress", "progress_total", "strategy_counts", "recent_strategies")
+
+    def __init__(self, history_size=STRATEGY_HISTORY_SIZE):
+        self.total_messages = 0
+        self.peak_progress = 0
+        self.progress_total = 0
+        self.strategy_counts = {}
+        self.recent_strategies = deque(maxlen=history_size)
+
+    def record(self, progress_score, strategy: str):
+        """Count one turn's progress score and chosen strategy"""
+        if not isinstance(progress_score, (int, float)):
+            progress_score = 0
+        self.total_messages += 1
+        self.peak_progress = max(self.peak_progress, progress_score)
+        self.progress_total += progress_score
+        self.strategy_counts[strategy] = self.strategy_counts.get(strategy, 0) + 1
+        self.recent_strategies.append(strategy)
+
+    @property
+    def average_progress(self) -> float:
+        return self.progress_total / self.total_messages if self.total_messages else 0.0
+
+    def top_strategy(self):
+        """The most used strategy so far, or None before the first turn"""
+        if not self.strategy_counts:
+            return None
+        return max(self.strategy_counts, key=self.strategy_counts.get)
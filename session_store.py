@@ -0,0 +1,360 @@
+"""
+Session state store with an in-worker hot cache
+
+A session's durable state - conversation history, rolling summary, debug panel metrics,
+debug mode, the last strategy and performance evaluation, and the token/cost totals -
+lives in a SessionData object that is saved to a backend after every turn. The memory
+backend keeps sessions in this process; the SQLite backend shares them between workers
+on the host, so any worker behind a load balancer can serve the next message. Saved
+sessions are zlib-compressed compact JSON, with messages stored once and the
+rolling-summary window recorded as counts into them.
+
+Live SessionData objects stay in a small hot cache. Sessions idle for SESSION_CACHE_TTL,
+and the least recently used ones once the cache passes SESSION_CACHE_MAX_BYTES, are
+dropped from it and reloaded from the backend on their next message.
+"""
+
+import asyncio
+import json
+import os
+import time
+import zlib
+from collections import OrderedDict, deque
+
+from conversation import ConversationHistory, ConversationState
+from session_metrics import STRATEGY_HISTORY_SIZE, SessionMetrics
+from sqlite_connections import ThreadLocalConnection
+from token_budget import SessionBudget
+
+SESSION_STORE = os.getenv("SESSION_STORE", "memory").lower()
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", ".cache/sessions.sqlite3")
+# Idle seconds before a session leaves the hot cache, and the cache's approximate memory cap
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "300"))
+SESSION_CACHE_MAX_BYTES = int(os.getenv("SESSION_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Idle seconds before a saved session is deleted from the backend
+SESSION_RETENTION = float(os.getenv("SESSION_RETENTION", str(7 * 24 * 3600)))
+
+FORMAT_VERSION = 1
+_ROLES = {"user": "u", "assistant": "a"}
+_ROLE_NAMES = {code: role for role, code in _ROLES.items()}
+
+
+class SessionData:
+    """Durable state for one chat session"""
+
+    __slots__ = ("history", "state", "metrics", "debug_mode", "last_strategy", "budget", "last_performance")
+
+    def __init__(
+        self,
+        history=None,
+        state=None,
+        metrics=None,
+        debug_mode=True,
+        last_strategy=None,
+        budget=None,
+        last_performance=None,
+    ):
+        self.history = history if history is not None else ConversationHistory()
+        self.state = state if state is not None else ConversationState()
+        self.metrics = metrics if metrics is not None else SessionMetrics()
+        self.debug_mode = debug_mode
+        self.last_strategy = last_strategy
+        self.budget = budget if budget is not None else SessionBudget()
+        self.last_performance = last_performance
+
+    def approximate_size(self) -> int:
+        """Rough in-memory footprint in bytes: content and transcript line per message plus object overhead"""
+        return 512 + 2 * self.history.chars + 200 * len(self.history) + len(self.state.summary)
+
+
+def encode_session(session: SessionData) -> bytes:
+    """Serialize a session to compressed compact JSON
+
+    The rolling-summary state holds the same Turn objects as the end of the history,
+    so only its summary and how many messages are recent or pending are stored.
+    """
+    state, metrics = session.state, session.metrics
+    payload = {
+        "v": FORMAT_VERSION,
+        "t": [[_ROLES.get(turn.role, turn.role), turn.content] for turn in session.history],
+        "s": [state.summary, state.window, len(state.recent), len(state.pending), state.total_messages],
+        "m": [
+            metrics.total_messages,
+            metrics.peak_progress,
+            metrics.progress_total,
+            metrics.strategy_counts,
+            list(metrics.recent_strategies),
+            metrics.recent_strategies.maxlen,
+        ],
+        "d": session.debug_mode,
+        "l": session.last_strategy,
+        # Only the totals: the limits always come from the current settings
+        "b": [session.budget.tokens, session.budget.cost_usd, session.budget.refused],
+        "p": session.last_performance,
+    }
+    # Level 1: transcripts are repetitive enough that higher levels barely shrink them but cost 2-3x the time
+    return zlib.compress(json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode(), 1)
+
+
+def decode_session(data: bytes) -> SessionData:
+    """Rebuild a session saved by encode_session
+
+    Raises:
+        ValueError: If the data is corrupt or from an unknown format version
+    """
+    try:
+        payload = json.loads(zlib.decompress(data))
+    except (zlib.error, ValueError) as e:
+        raise ValueError(f"Unreadable session data: {e}") from None
+    if payload.get("v") != FORMAT_VERSION:
+        raise ValueError(f"Unknown session format version: {payload.get('v')!r}")
+
+    history = ConversationHistory()
+    for role, content in payload["t"]:
+        history.append(_ROLE_NAMES.get(role, role), content)
+
+    summary, window, recent, pending, total = payload["s"]
+    state = ConversationState(window)
+    state.summary = summary
+    state.total_messages = total
+    turns = list(history)
+    recent = min(recent, len(turns))
+    pending = min(pending, len(turns) - recent)
+    state.recent = deque(turns[len(turns) - recent :])
+    state.pending = turns[len(turns) - recent - pending : len(turns) - recent]
+
+    total_messages, peak, progress_total, counts, strategies, maxlen = payload["m"]
+    metrics = SessionMetrics(maxlen or STRATEGY_HISTORY_SIZE)
+    metrics.total_messages = total_messages
+    metrics.peak_progress = peak
+    metrics.progress_total = progress_total
+    metrics.strategy_counts = counts
+    metrics.recent_strategies.extend(strategies)
+
+    # Sessions saved before refusals were recorded have no third entry
+    tokens, cost_usd, *refused = payload.get("b") or (0, 0.0)
+    budget = SessionBudget(tokens, cost_usd, refused=bool(refused and refused[0]))
+    return SessionData(history, state, metrics, payload["d"], payload["l"], budget, payload.get("p"))
+
+
+class MemoryBackend:
+    """Saved sessions in a dict in this process; only one worker can use it"""
+
+    shared = False
+
+    def __init__(self):
+        self._sessions = {}  # session_id -> (data, saved_at)
+
+    def load_sync(self, session_id: str):
+        entry = self._sessions.get(session_id)
+        return (entry[0], 0) if entry is not None else None
+
+    def save_sync(self, session_id: str, data: bytes) -> int:
+        self._sessions[session_id] = (data, time.time())
+        return 0
+
+    def version_sync(self, session_id: str):
+        return 0 if session_id in self._sessions else None
+
+    def purge_sync(self, max_age: float) -> int:
+        cutoff = time.time() - max_age
+        stale = [session_id for session_id, (_, saved_at) in self._sessions.items() if saved_at < cutoff]
+        for session_id in stale:
+            del self._sessions[session_id]
+        return len(stale)
+
+    def count(self) -> int:
+        return len(self._sessions)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    version INTEGER NOT NULL,
+    saved REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_saved ON sessions (saved);
+"""
+
+
+class SQLiteBackend:
+    """Saved sessions in a SQLite file shared by every worker on the host
+
+    Each save bumps the row's version, so a worker can tell when its cached copy of a
+    session was overtaken by another worker.
+
+    Args:
+        path: Database file
+    """
+
+    shared = True
+
+    def __init__(self, path=SESSION_STORE_PATH):
+        self.path = path
+        self._connection = ThreadLocalConnection(path)
+        self._connection().executescript(_SCHEMA)
+
+    def load_sync(self, session_id: str):
+        """(data, version) for a saved session, or None"""
+        return self._connection().execute("SELECT data, version FROM sessions WHERE id = ?", (session_id,)).fetchone()
+
+    def save_sync(self, session_id: str, data: bytes) -> int:
+        """Store data and return the session's new version"""
+        row = (
+            self._connection()
+            .execute(
+                "INSERT INTO sessions (id, data, version, saved) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT (id) DO UPDATE SET data = excluded.data, version = version + 1, saved = excluded.saved "
+                "RETURNING version",
+                (session_id, data, time.time()),
+            )
+            .fetchone()
+        )
+        return row[0]
+
+    def version_sync(self, session_id: str):
+        row = self._connection().execute("SELECT version FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def purge_sync(self, max_age: float) -> int:
+        return self._connection().execute("DELETE FROM sessions WHERE saved < ?", (time.time() - max_age,)).rowcount
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class SessionStore:
+    """Hot cache of live sessions in front of a backend
+
+    Args:
+        backend: MemoryBackend or SQLiteBackend
+        ttl: Idle seconds before a session is dropped from the hot cache
+        max_bytes: Approximate memory cap for the hot cache
+        retention: Idle seconds before a saved session is deleted from the backend
+    """
+
+    def __init__(self, backend=None, ttl=SESSION_CACHE_TTL, max_bytes=SESSION_CACHE_MAX_BYTES, retention=SESSION_RETENTION):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.retention = retention
+        self._hot = OrderedDict()  # session_id -> [session, version, size, last_used], least recently used first
+        self._hot_bytes = 0
+        self._last_purge = time.monotonic()
+
+        self.hits = 0
+        self.loads = 0
+        self.misses = 0
+        self.saves = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+
+    @classmethod
+    def from_env(cls):
+        """Store with the backend chosen by SESSION_STORE ("memory" or "sqlite")"""
+        if SESSION_STORE == "sqlite":
+            return cls(SQLiteBackend(SESSION_STORE_PATH))
+        if SESSION_STORE != "memory":
+            raise ValueError(f"SESSION_STORE must be memory or sqlite, not {SESSION_STORE!r}")
+        return cls(MemoryBackend())
+
+    async def get(self, session_id: str) -> SessionData:
+        """The session's live state: from the hot cache, reloaded from the backend, or new"""
+        now = time.monotonic()
+        entry = self._hot.get(session_id)
+        if entry is not None and self.backend.shared:
+            # Another worker may have served a later turn of this session
+            if await self._backend_call(self.backend.version_sync, session_id) != entry[1]:
+                self._drop(session_id)
+                entry = None
+        if entry is not None:
+            self.hits += 1
+            entry[3] = now
+            self._hot.move_to_end(session_id)
+            self.evict(now)
+            return entry[0]
+
+        saved = await self._backend_call(self.backend.load_sync, session_id)
+        session, version = None, None
+        if saved is not None:
+            try:
+                session, version = decode_session(saved[0]), saved[1]
+                self.loads += 1
+            except ValueError as e:
+                print(f"Session {session_id} could not be restored: {e}")
+        if session is None:
+            self.misses += 1
+            session = SessionData()
+        self._track(session_id, session, version if self.backend.shared else None, now)
+        return session
+
+    async def save(self, session_id: str, session: SessionData):
+        """Write the session to the backend and keep it hot"""
+        data = encode_session(session)
+        version = await self._backend_call(self.backend.save_sync, session_id, data)
+        self.saves += 1
+        self.bytes_saved += len(data)
+        now = time.monotonic()
+        self._track(session_id, session, version if self.backend.shared else None, now)
+        if now - self._last_purge > self.ttl:
+            self._last_purge = now
+            await self._backend_call(self.backend.purge_sync, self.retention)
+
+    async def _backend_call(self, method, *args):
+        """Run file-backed calls in a thread; the memory backend is only dict operations"""
+        if self.backend.shared:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    def release(self, session_id: str):
+        """Drop a session from the hot cache (e.g. when its connection closes); the saved copy stays"""
+        self._drop(session_id)
+
+    def _track(self, session_id, session, version, now):
+        self._drop(session_id)
+        size = session.approximate_size()
+        self._hot[session_id] = [session, version, size, now]
+        self._hot_bytes += size
+        self.evict(now)
+
+    def _drop(self, session_id):
+        entry = self._hot.pop(session_id, None)
+        if entry is not None:
+            self._hot_bytes -= entry[2]
+
+    def evict(self, now=None):
+        """Drop idle sessions, then least recently used ones while over the memory cap
+
+        The most recently used session always stays.
+        """
+        now = time.monotonic() if now is None else now
+        while len(self._hot) > 1:
+            session_id, entry = next(iter(self._hot.items()))
+            if now - entry[3] <= self.ttl and self._hot_bytes <= self.max_bytes:
+                break
+            self._drop(session_id)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """Hot cache size and hit/reload/new counts, plus average saved session size"""
+        lookups = self.hits + self.loads + self.misses
+        return {
+            "hot_sessions": len(self._hot),
+            "hot_bytes": self._hot_bytes,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "hits": self.hits,
+            "loads": self.loads,
+            "misses": self.misses,
+            "saves": self.saves,
+            "evictions": self.evictions,
+            "avg_saved_bytes": self.bytes_saved / self.saves if self.saves else 0.0,
+        }
+
+    def format_stats(self) -> str:
+        """One line for the debug panel"""
+        s = self.stats()
+        return (
+            f"{s['hot_sessions']} hot ({s['hot_bytes'] / 1024:.0f} KiB) | {s['hit_rate']:.0%} hot hits, "
+            f"{s['loads']} reloads, {s['evictions']} evicted | {s['avg_saved_bytes']:.0f} B/save"
+        )
@@ -0,0 +1,81 @@
+"""
+Background work that belongs to a chat session
+
+Work started after a reply is sent - such as the pipelined performance evaluation -
+outlives the message handler that started it. Each task is registered under its
+session and a name; starting a task under a name that is still running cancels the
+older one, since its result would be stale, and ending the session cancels everything
+it still has running.
+"""
+
+import asyncio
+
+
+class SessionTasks:
+    """Named background tasks per session"""
+
+    def __init__(self):
+        self._tasks = {}  # session_id -> {name: task}
+        self.started = 0
+        self.superseded = 0
+        self.cancelled = 0
+        self.failed = 0
+
+    def spawn(self, session_id: str, name: str, coro) -> asyncio.Task:
+        """Run coro in the background for a session, replacing its running task of the same name"""
+        tasks = self._tasks.setdefault(session_id, {})
+        previous = tasks.get(name)
+        if previous is not None and not previous.done():
+            previous.cancel()
+            self.superseded += 1
+
+        task = asyncio.get_running_loop().create_task(coro)
+        tasks[name] = task
+        self.started += 1
+        task.add_done_callback(lambda done: self._finished(session_id, name, done))
+        return task
+
+    def _finished(self, session_id, name, task):
+        tasks = self._tasks.get(session_id)
+        if tasks is not None and tasks.get(name) is task:
+            del tasks[name]
+            if not tasks:
+                del self._tasks[session_id]
+        if not task.cancelled() and task.exception() is not None:
+            self.failed += 1
+            print(f"Background {name} task failed: {task.exception()!r}")
+
+    def get(self, session_id: str, name: str):
+        """The session's running task of that name, if any"""
+        return self._tasks.get(session_id, {}).get(name)
+
+    def cancel(self, session_id: str) -> int:
+        """Cancel everything a session still has running
+
+        Returns:
+            Number of tasks cancelled
+        """
+        tasks = self._tasks.pop(session_id, {})
+        count = 0
+        for task in tasks.values():
+            if not task.done():
+                task.cancel()
+                count += 1
+        self.cancelled += count
+        return count
+
+    async def wait(self, session_id: str):
+        """Wait for a session's running tasks to finish, ignoring their errors"""
+        tasks = list(self._tasks.get(session_id, {}).values())
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def running(self) -> int:
+        return sum(len(tasks) for tasks in self._tasks.values())
+
+    def format_stats(self) -> str:
+        """One line for the debug panel"""
+        return (
+            f"{self.running()} running | {self.started} started, {self.superseded} superseded, "
+            f"{self.cancelled} cancelled at session end, {self.failed} failed"
+        )
@@ -0,0 +1,38 @@
+"""
+Per-thread SQLite connections for the stores shared between workers
+
+The completion cache and the SQLite session backend are both used from worker threads
+(asyncio.to_thread), and a sqlite3 connection can't be shared across threads. Each thread
+gets its own connection to the file, in autocommit mode with WAL journaling and a busy
+timeout, so several processes can read and write it at once.
+"""
+
+import os
+import sqlite3
+import threading
+
+
+class ThreadLocalConnection:
+    """Callable returning the calling thread's connection to a SQLite file
+
+    The file's directory is created if needed.
+
+    Args:
+        path: Database file
+        timeout: Seconds to wait for another writer's lock before failing
+    """
+
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def __call__(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
@@ -0,0 +1,34 @@
+"""
+Parsing for per-stage settings given as "stage=value,..." environment variables
+
+STAGE_DEADLINES, STAGE_PROMPT_BUDGETS, STAGE_MAX_TOKENS and the STAGE_*MODELS routing
+shortcuts all use this format, so they share one parser and one error message.
+"""
+
+
+def parse_stage_values(value: str, setting: str, convert=str, unit: str = "value") -> dict:
+    """Parse "stage=value,..." into a dict of stage -> convert(value)
+
+    Blank entries are skipped and whitespace around names and values is ignored.
+
+    Args:
+        value: The setting's text
+        setting: Its name, for error messages
+        convert: Callable turning each value's text into the stored value
+        unit: What a value is, for error messages ("seconds", "tokens", "model")
+
+    Raises:
+        ValueError: If an entry is not stage=value, or convert rejects its value
+    """
+    values = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        stage, sep, text = item.partition("=")
+        if not sep or not stage.strip() or not text.strip():
+            raise ValueError(f"{setting} entries must be stage={unit}, not {item!r}")
+        try:
+            values[stage.strip()] = convert(text.strip())
+        except ValueError:
+            raise ValueError(f"{setting} entries must be stage={unit}, not {item!r}") from None
+    return values
@@ -0,0 +1,151 @@
+"""
+Local strategy policy
+
+A decision table over progress_score, buyer_interest and relevance_to_goal that picks the
+next strategy without an LLM round trip. Cases the table is not confident about fall back
+to determine_strategy.
+"""
+
+import json
+import os
+
+STRATEGIES = ("direct_pitch", "soft_sell", "build_rapport", "create_urgency", "handle_objection")
+
+# "llm" always calls determine_strategy, "hybrid" uses the table when a rule is confident enough,
+# "local" uses any matching rule; the LLM still decides when no rule matches
+STRATEGY_POLICY = os.getenv("STRATEGY_POLICY", "llm").lower()
+STRATEGY_CONFIDENCE_THRESHOLD = float(os.getenv("STRATEGY_CONFIDENCE_THRESHOLD", "0.7"))
+STRATEGY_RULES_FILE = os.getenv("STRATEGY_RULES_FILE", "")
+
+# Evaluated in order; the first matching rule wins. Conditions that are left out match anything.
+DEFAULT_RULES = [
+    {
+        "min_progress": 70,
+        "buyer_interest": ["high"],
+        "strategy": "create_urgency",
+        "confidence": 0.9,
+        "reasoning": "Near the sale with a highly interested buyer",
+        "approach": "Create scarcity and push to close the deal at the asking price",
+    },
+    {
+        "buyer_interest": ["high"],
+        "relevance_to_goal": ["high", "medium"],
+        "strategy": "direct_pitch",
+        "confidence": 0.85,
+        "reasoning": "High interest in an on-topic conversation",
+        "approach": "Pitch the Switch 1 features, bundle and price with full enthusiasm",
+    },
+    {
+        "buyer_interest": ["medium"],
+        "relevance_to_goal": ["high", "medium"],
+        "strategy": "soft_sell",
+        "confidence": 0.8,
+        "reasoning": "Some curiosity about a related topic",
+        "approach": "Share a benefit of the Switch 1 and invite a question",
+    },
+    {
+        "max_progress": 40,
+        "buyer_interest": ["low", "unknown"],
+        "relevance_to_goal": ["low"],
+        "strategy": "build_rapport",
+        "confidence": 0.85,
+        "reasoning": "Early, off-topic conversation with little interest",
+        "approach": "Find common ground and mention the Switch casually",
+    },
+    {
+        "buyer_interest": ["low"],
+        "strategy": "build_rapport",
+        "confidence": 0.6,
+        "reasoning": "Low interest - may be an unspoken objection",
+        "approach": "Be friendly and look for what is holding them back",
+    },
+]
+
+
+def _matches(rule, progress_score, buyer_interest, relevance):
+    """Check one rule's conditions"""
+    if "min_progress" in rule and progress_score < rule["min_progress"]:
+        return False
+    if "max_progress" in rule and progress_score > rule["max_progress"]:
+        return False
+    if "buyer_interest" in rule and buyer_interest not in rule["buyer_interest"]:
+        return False
+    if "relevance_to_goal" in rule and relevance not in rule["relevance_to_goal"]:
+        return False
+    return True
+
+
+def load_rules(path: str) -> list:
+    """Load a decision table from a JSON file
+
+    Raises:
+        ValueError: If a rule names an unknown strategy or has no confidence
+    """
+    with open(path, encoding="utf-8") as f:
+        rules = json.load(f)
+    for rule in rules:
+        if rule.get("strategy") not in STRATEGIES:
+            raise ValueError(f"Unknown strategy in {path}: {rule.get('strategy')!r}")
+        if not isinstance(rule.get("confidence"), (int, float)):
+            raise ValueError(f"Rule for {rule['strategy']!r} in {path} needs a numeric confidence")
+    return rules
+
+
+class StrategyPolicy:
+    """Decision-table strategy picker with counters for how often each path is taken
+
+    Args:
+        rules: Ordered list of rule dicts
+        threshold: Minimum confidence for a local answer in "hybrid" mode
+        mode: "llm", "hybrid" or "local"
+    """
+
+    def __init__(self, rules=None, threshold=STRATEGY_CONFIDENCE_THRESHOLD, mode=STRATEGY_POLICY):
+        if mode not in ("llm", "hybrid", "local"):
+            raise ValueError(f"STRATEGY_POLICY must be llm, hybrid or local, not {mode!r}")
+        self.rules = DEFAULT_RULES if rules is None else rules
+        self.threshold = threshold
+        self.mode = mode
+        self.counts = {"local": 0, "llm_fallback": 0, "llm": 0}
+
+    @classmethod
+    def from_env(cls):
+        """Build the policy from STRATEGY_POLICY, STRATEGY_CONFIDENCE_THRESHOLD and STRATEGY_RULES_FILE"""
+        return cls(rules=load_rules(STRATEGY_RULES_FILE) if STRATEGY_RULES_FILE else None)
+
+    def evaluate(self, performance, topic_analysis):
+        """Return the first matching rule as a strategy dict, or None if no rule matches"""
+        progress_score = performance.get("progress_score", 0)
+        if not isinstance(progress_score, (int, float)):
+            return None
+        buyer_interest = str(performance.get("buyer_interest", "unknown")).lower()
+        relevance = str(topic_analysis.get("relevance_to_goal", "low")).lower()
+
+        for rule in self.rules:
+            if _matches(rule, progress_score, buyer_interest, relevance):
+                return {
+                    "strategy": rule["strategy"],
+                    "reasoning": f"Local policy: {rule.get('reasoning', 'rule match')}",
+                    "approach": rule.get("approach", "Implement the strategy with maximum hustle"),
+                    "confidence": rule["confidence"],
+                    "source": "local",
+                }
+        return None
+
+    def decide(self, performance, topic_analysis):
+        """Pick a strategy locally, or return None when the LLM should decide"""
+        if self.mode == "llm":
+            self.counts["llm"] += 1
+            return None
+
+        decision = self.evaluate(performance, topic_analysis)
+        if decision and (self.mode == "local" or decision["confidence"] >= self.threshold):
+            self.counts["local"] += 1
+            return decision
+
+        self.counts["llm_fallback"] += 1
+        return None
+
+    def format_counts(self) -> str:
+        """Summarize how often each path was taken"""
+        return f"Local: {self.counts['local']} | LLM fallback: {self.counts['llm_fallback']} | LLM: {self.counts['llm']}"
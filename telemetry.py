@@ -0,0 +1,295 @@
+"""
+Per-stage latency, token and cost metrics with a Prometheus endpoint
+
+complete() records one observation per stage call: wall time, queue wait (time from
+the call until its first request goes out), prompt/completion/cached tokens from
+response.usage and the cost they imply; the cached share of a stage's prompt tokens
+shows how well its static prefix hits the provider's prompt cache. The stage functions
+record fallbacks and JSON parse failures. Latencies go into fixed-bucket histograms, so
+recording is a bisect plus a few additions and p50/p95/p99 are estimated from the buckets.
+
+Set METRICS_PORT to serve everything in Prometheus text format at
+http://METRICS_HOST:METRICS_PORT/metrics from a background thread.
+"""
+
+import json
+import os
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT") or 0)
+
+# Seconds; the last bucket is +Inf
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0)
+
+# USD per 1M tokens: (input, cached input, output)
+MODEL_PRICING = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+}
+MODEL_PRICING.update({model: tuple(prices) for model, prices in json.loads(os.getenv("MODEL_PRICING") or "{}").items()})
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus layout"""
+
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def prometheus_lines(self, name: str, labels: str) -> list:
+        """_bucket/_sum/_count sample lines, with `labels` like 'stage="topic"'"""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating inside the bucket that holds it"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                lower = self.bounds[i - 1] if i else 0.0
+                # Values past the last bound are reported as the last bound
+                upper = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.bounds[-1]
+
+
+class StageStats:
+    """Counters and histograms for one pipeline stage"""
+
+    __slots__ = (
+        "calls",
+        "cache_hits",
+        "errors",
+        "fallbacks",
+        "parse_failures",
+        "prompt_tokens",
+        "completion_tokens",
+        "cached_tokens",
+        "cost_usd",
+        "latency",
+        "queue_wait",
+    )
+
+    def __init__(self):
+        self.calls = 0
+        self.cache_hits = 0
+        self.errors = 0
+        self.fallbacks = 0
+        self.parse_failures = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.cost_usd = 0.0
+        self.latency = Histogram()
+        self.queue_wait = Histogram()
+
+    @property
+    def cached_ratio(self) -> float:
+        """Share of prompt tokens the provider served from its prompt prefix cache"""
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+
+def usage_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    """USD cost of one call, or 0 for a model without pricing"""
+    prices = MODEL_PRICING.get(model)
+    if prices is None:
+        return 0.0
+    input_price, cached_price, output_price = prices
+    return (
+        (prompt_tokens - cached_tokens) * input_price + cached_tokens * cached_price + completion_tokens * output_price
+    ) / 1e6
+
+
+class Telemetry:
+    """Process-wide stage metrics
+
+    Written from the event loop and read by the exporter thread; individual updates are
+    plain attribute writes, so no lock is taken on the hot path.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.collectors = []
+        self._server = None
+
+    def stage(self, name: str) -> StageStats:
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = StageStats()
+        return stats
+
+    def record_call(
+        self, stage: str, model: str, latency: float, queue_wait: float = 0.0, usage=None, cached=False, error=False
+    ):
+        """Record one completed (or failed) stage call
+
+        Args:
+            stage: Pipeline stage name
+            model: Model the request went to
+            latency: Wall time of the call in seconds
+            queue_wait: Seconds before the first request went out
+            usage: The response's usage object, if any
+            cached: True if the completion cache answered
+            error: True if the call raised
+
+        Returns:
+            The call's cost in USD
+        """
+        stats = self.stage(stage)
+        stats.calls += 1
+        stats.latency.observe(latency)
+        stats.queue_wait.observe(queue_wait)
+        if cached:
+            stats.cache_hits += 1
+        if error:
+            stats.errors += 1
+        if usage is not None:
+            prompt_tokens = usage.prompt_tokens or 0
+            completion_tokens = usage.completion_tokens or 0
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached_tokens = (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0
+            stats.prompt_tokens += prompt_tokens
+            stats.completion_tokens += completion_tokens
+            stats.cached_tokens += cached_tokens
+            cost = usage_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+            stats.cost_usd += cost
+            return cost
+        return 0.0
+
+    def record_fallback(self, stage: str, error: Exception):
+        """Count a stage returning its fallback, and whether bad JSON caused it"""
+        stats = self.stage(stage)
+        stats.fallbacks += 1
+        if isinstance(error, json.JSONDecodeError):
+            stats.parse_failures += 1
+
+    def add_collector(self, collector):
+        """Register a callable returning extra Prometheus text lines for the export"""
+        self.collectors.append(collector)
+
+    def render_prometheus(self) -> str:
+        """All metrics in Prometheus text exposition format"""
+        # Copied first: the event loop adds stages while the exporter thread renders
+        stages = sorted(list(self.stages.items()))
+        lines = []
+
+        for name, help_text, attr in (
+            ("chatbot_stage_latency_seconds", "Wall time of a stage call including retries", "latency"),
+            ("chatbot_stage_queue_wait_seconds", "Time before a stage call's first request went out", "queue_wait"),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for stage, stats in stages:
+                lines += getattr(stats, attr).prometheus_lines(name, f'stage="{stage}"')
+
+        name = "chatbot_stage_latency_quantile_seconds"
+        lines += [f"# HELP {name} Bucket-estimated stage latency quantiles", f"# TYPE {name} gauge"]
+        for stage, stats in stages:
+            for q in QUANTILES:
+                lines.append(f'{name}{{stage="{stage}",quantile="{q}"}} {stats.latency.quantile(q):.6f}')
+
+        name = "chatbot_stage_tokens_total"
+        lines += [f"# HELP {name} Tokens reported in response.usage", f"# TYPE {name} counter"]
+        for stage, stats in stages:
+            for kind in ("prompt", "completion", "cached"):
+                lines.append(f'{name}{{stage="{stage}",kind="{kind}"}} {getattr(stats, f"{kind}_tokens")}')
+
+        for name, help_text, attr in (
+            ("chatbot_stage_calls_total", "Stage calls", "calls"),
+            ("chatbot_stage_cache_hits_total", "Stage calls answered by the completion cache", "cache_hits"),
+            ("chatbot_stage_errors_total", "Stage calls that raised", "errors"),
+            ("chatbot_stage_fallbacks_total", "Times a stage returned its fallback result", "fallbacks"),
+            ("chatbot_stage_parse_failures_total", "Fallbacks caused by unparseable JSON", "parse_failures"),
+            ("chatbot_stage_cost_usd_total", "Estimated spend from token usage", "cost_usd"),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for stage, stats in stages:
+                value = getattr(stats, attr)
+                lines.append(
+                    f'{name}{{stage="{stage}"}} {value:.6f}'
+                    if isinstance(value, float)
+                    else f'{name}{{stage="{stage}"}} {value}'
+                )
+
+        name = "chatbot_stage_prompt_cache_ratio"
+        lines += [f"# HELP {name} Share of prompt tokens served from the provider's prefix cache", f"# TYPE {name} gauge"]
+        for stage, stats in stages:
+            lines.append(f'{name}{{stage="{stage}"}} {stats.cached_ratio:.4f}')
+
+        for collector in self.collectors:
+            lines += collector()
+        return "\n".join(lines) + "\n"
+
+    def format_stats(self) -> str:
+        """One line per stage for the debug panel"""
+        lines = []
+        for stage, stats in sorted(list(self.stages.items())):
+            latency = stats.latency
+            lines.append(
+                f"{stage}: p50 {latency.quantile(0.5) * 1000:.0f}ms / p95 {latency.quantile(0.95) * 1000:.0f}ms | "
+                f"{stats.prompt_tokens}+{stats.completion_tokens} tokens ({stats.cached_ratio:.0%} of prompt cached) | "
+                f"${stats.cost_usd:.4f}"
+            )
+        return "\n".join(lines)
+
+    def serve(self, host=METRICS_HOST, port=METRICS_PORT):
+        """Serve /metrics from a daemon thread; calling it again is a no-op
+
+        Returns:
+            The (host, port) the server is bound to
+        """
+        if self._server is None:
+            self._server = ThreadingHTTPServer((host, port), self._make_handler())
+            self._server.daemon_threads = True
+            threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True).start()
+        return self._server.server_address[:2]
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _make_handler(self):
+        telemetry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                payload = telemetry.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
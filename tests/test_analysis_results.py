@@ -0,0 +1,177 @@
+"""
+Unit tests for the typed analysis results and the incremental JSON parser
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis_results import (  # noqa: E402
+    ObjectStreamParser,
+    PerformanceResult,
+    StrategyResult,
+    TopicResult,
+    parse_object,
+    stream_into,
+)
+
+
+def _chunks(text, size):
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+class TestObjectStreamParser:
+    """Test top-level members are emitted as soon as they are complete"""
+
+    def test_members_arrive_in_order(self):
+        parser = ObjectStreamParser()
+        assert parser.feed('{"progress_score": 7') == []
+        assert parser.feed('0, "buyer_in') == [("progress_score", 70)]
+        assert parser.feed('terest": "high"}') == [("buyer_interest", "high")]
+
+    @pytest.mark.parametrize("size", [1, 3, 7, 1000])
+    def test_any_chunking_gives_the_whole_object(self, size):
+        """Test strings with delimiters, escapes and nested values survive every split"""
+        data = {
+            "assessment": 'Said "deal, maybe}" then {left]',
+            "key_signals": ["price, again", "\\o/", {"nested": [1, 2]}],
+            "current_topic": "ünïcode ✨",
+            "progress_score": 12.5,
+            "pivot_opportunity": None,
+        }
+        parser = ObjectStreamParser()
+        members = [member for chunk in _chunks(json.dumps(data), size) for member in parser.feed(chunk)]
+        assert dict(members) == data
+
+    def test_malformed_member_is_skipped(self):
+        """Test a broken member is left for the full parse to report"""
+        parser = ObjectStreamParser()
+        assert parser.feed('{"a": nope, "b": 2}') == [("b", 2)]
+
+    def test_parse_object_requires_an_object(self):
+        assert parse_object('{"a": 1}') == {"a": 1}
+        with pytest.raises(ValueError):
+            parse_object("[1, 2]")
+        with pytest.raises(json.JSONDecodeError):
+            parse_object('{"a": ')
+
+
+class TestValidation:
+    """Test fields are validated against the schema as they are set"""
+
+    def test_valid_result(self):
+        result = PerformanceResult.from_dict(
+            {"progress_score": 40, "buyer_interest": "Medium", "key_signals": ["price"], "assessment": " Curious "}
+        )
+        assert result.progress_score == 40
+        assert result.buyer_interest == "medium"
+        assert result.assessment == "Curious"
+        assert result.invalid == []
+
+    @pytest.mark.parametrize("value,expected", [(150, 100), (-3, 0), ("70%", 70), (" 55 ", 55), (42.6, 43), (10**400, 100)])
+    def test_scores_are_clamped_and_parsed(self, value, expected):
+        assert PerformanceResult(progress_score=value).progress_score == expected
+
+    @pytest.mark.parametrize("value", ["high", None, True, float("nan"), float("inf"), float("-inf"), "inf", [50]])
+    def test_bad_score_gets_default(self, value):
+        result = PerformanceResult(progress_score=value)
+        assert "progress_score" not in result
+        result.finish()
+        assert result.progress_score == 0
+        assert result.invalid == ["progress_score", "buyer_interest", "key_signals", "assessment"]
+
+    def test_invalid_field_can_still_be_supplied(self):
+        """Test a later valid value (e.g. from an escalated call) replaces a rejected one"""
+        result = TopicResult(relevance_to_goal="very")
+        assert result.invalid == ["relevance_to_goal"]
+        result.update({"relevance_to_goal": "high"})
+        assert result.relevance_to_goal == "high"
+        assert result.invalid == []
+
+    def test_unknown_enum_and_missing_fields_get_defaults(self):
+        result = StrategyResult.from_dict({"strategy": "hard_sell", "approach": "Name the price", "extra": 1})
+        assert result == {**StrategyResult.defaults(), "approach": "Name the price"}
+        assert result.invalid == ["strategy", "reasoning"]
+        assert "extra" not in result
+
+    def test_first_value_wins(self):
+        """Test a streamed field isn't replaced by the full parse at the end"""
+        result = TopicResult(current_topic="price")
+        result.finish({"current_topic": "games"})
+        assert result.current_topic == "price"
+
+    def test_key_signals_accepts_a_string(self):
+        assert PerformanceResult(key_signals="asked about price").key_signals == ["asked about price"]
+
+
+class TestResultMapping:
+    """Test results behave like the dicts the stages used to return"""
+
+    def test_mapping_access_and_equality(self):
+        result = TopicResult.from_dict({"current_topic": "gaming", "relevance_to_goal": "high", "pivot_opportunity": "Zelda"})
+        assert result["current_topic"] == "gaming"
+        assert result.get("missing", "x") == "x"
+        assert dict(result) == {"current_topic": "gaming", "relevance_to_goal": "high", "pivot_opportunity": "Zelda"}
+        assert result == TopicResult.coerce(dict(result))
+
+    def test_unset_fields_are_absent(self):
+        result = PerformanceResult(progress_score=10)
+        assert list(result) == ["progress_score"]
+        assert not result.done
+        with pytest.raises(KeyError):
+            result["assessment"]
+
+    def test_to_dict_copies(self):
+        result = PerformanceResult.from_dict({"key_signals": ["a"]})
+        result.to_dict()["key_signals"].append("b")
+        assert result.key_signals == ["a"]
+
+    def test_no_instance_dict(self):
+        """Test results only hold their declared fields"""
+        with pytest.raises(AttributeError):
+            PerformanceResult().unexpected = 1
+
+
+class TestStreaming:
+    """Test fields resolve while the completion is still streaming"""
+
+    async def test_wait_for_resolves_per_field(self):
+        result = PerformanceResult()
+        on_token = stream_into(result)
+        waiter = asyncio.create_task(result.wait_for("progress_score", "buyer_interest"))
+
+        await on_token('{"progress_score": 80, ')
+        await asyncio.sleep(0)
+        assert not waiter.done()
+
+        await on_token('"buyer_interest": "high", "key_sig')
+        await asyncio.wait_for(waiter, timeout=1)
+        assert "key_signals" not in result
+
+    async def test_wait_for_set_fields_returns_at_once(self):
+        result = TopicResult(current_topic="price")
+        await asyncio.wait_for(result.wait_for("current_topic"), timeout=1)
+
+    async def test_finish_resolves_waiters_with_defaults(self):
+        """Test a failed stage still releases whoever waits on its fields"""
+        result = StrategyResult()
+        waiter = asyncio.create_task(result.wait_for("strategy", "approach"))
+        await asyncio.sleep(0)
+        result.finish()
+        await asyncio.wait_for(waiter, timeout=1)
+        assert result == StrategyResult.defaults()
+
+    async def test_one_stream_fills_several_results(self):
+        """Test a fused completion routes each member to the result that declares it"""
+        performance, topic, strategy = PerformanceResult(), TopicResult(), StrategyResult()
+        on_token = stream_into(performance, topic, strategy)
+        for chunk in _chunks(json.dumps({"progress_score": 30, "current_topic": "games", "strategy": "soft_sell"}), 5):
+            await on_token(chunk)
+        assert performance.progress_score == 30
+        assert topic.current_topic == "games"
+        assert strategy.strategy == "soft_sell"
@@ -2,8 +2,12 @@
 Unit tests for the Goal-Seeking AI Chatbot app
 """
 
+import asyncio
+import json
 import os
+import subprocess
 import sys
+import time
 
 import pytest
 
@@ -38,6 +42,15 @@ class TestImports:
 
         assert app is not None
 
+    def test_import_app_rejects_unknown_pipeline_mode(self):
+        """Test a misspelled PIPELINE_MODE fails at startup instead of running the staged pipeline"""
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = {**os.environ, "PIPELINE_MODE": "fussed"}
+        result = subprocess.run([sys.executable, "-c", "import app"], cwd=root, env=env, capture_output=True, text=True)
+
+        assert result.returncode != 0
+        assert "PIPELINE_MODE must be staged, fused or pipelined, not 'fussed'" in result.stderr
+
 
 class TestPromptStructure:
     """Test that all prompts are properly defined"""
@@ -236,6 +249,1432 @@ class TestClientInitialization:
                 os.environ["OPENAI_API_KEY"] = original_key
             app._client = None
 
+    def test_get_client_is_async(self, monkeypatch):
+        """Test get_client builds a pooled AsyncOpenAI client"""
+        import openai
+
+        import app
+
+        app._client = None
+        monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+        try:
+            client = app.get_client()
+            assert isinstance(client, openai.AsyncOpenAI)
+            assert app.get_client() is client
+        finally:
+            app._client = None
+
+
+@pytest.fixture(autouse=True)
+def fresh_topic_cache(monkeypatch):
+    """Give each test its own topic cache so cached analyses don't leak between tests"""
+    import app
+    from topic_cache import TopicCache
+
+    monkeypatch.setattr(app, "topic_cache", TopicCache())
+
+
+@pytest.fixture(autouse=True)
+def fresh_session_store(monkeypatch):
+    """Give each test its own in-memory session store"""
+    import app
+    from session_store import SessionStore
+
+    monkeypatch.setattr(app, "session_store", SessionStore())
+
+
+@pytest.fixture(autouse=True)
+def fresh_resilience(monkeypatch):
+    """Give each test closed breakers and fast retries"""
+    import app
+    from resilience import Resilience
+
+    monkeypatch.setattr(app, "resilience", Resilience(base_delay=0.01))
+
+
+@pytest.fixture(autouse=True)
+def fresh_telemetry(monkeypatch):
+    """Give each test empty stage metrics"""
+    import app
+    from telemetry import Telemetry
+
+    telemetry = Telemetry()
+    telemetry.add_collector(lambda: app.resilience.prometheus_lines())
+    monkeypatch.setattr(app, "telemetry", telemetry)
+
+
+# Seconds the fake_openai fixture takes to answer each request
+FAKE_LATENCY = 0.2
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    """Point the app client at a local fake endpoint with FAKE_LATENCY per request"""
+    import app
+    from fake_openai import FakeOpenAIServer
+
+    with FakeOpenAIServer(latency=FAKE_LATENCY) as server:
+        monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+        monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+        app._client = None
+        yield server
+        app._client = None
+
+
+async def _run_session(user_message):
+    """Run the four pipeline stages for one simulated session"""
+    import app
+    from conversation import ConversationHistory, ConversationState
+
+    history = ConversationHistory()
+    history.append("user", user_message)
+    performance = await app.analyze_performance(ConversationState.from_history(history))
+    topic_analysis = await app.analyze_topic(user_message)
+    strategy = await app.determine_strategy(performance, topic_analysis, history)
+    return await app.generate_response(user_message, strategy)
+
+
+class TestAsyncClientPool:
+    """Test that LLM calls no longer block the event loop"""
+
+    async def test_stages_use_fake_endpoint(self, fake_openai):
+        """Test all four stages reach the endpoint and parse its responses"""
+        import app
+
+        response_text = await _run_session("How much for the Switch?")
+        await app.close_client()
+
+        assert "Switch 1" in response_text
+        assert len(fake_openai.requests) == 4
+
+    async def test_concurrent_sessions_overlap(self, fake_openai):
+        """Test N concurrent sessions finish in about the time of one"""
+        import app
+
+        started = time.perf_counter()
+        await _run_session("hi")
+        single = time.perf_counter() - started
+
+        sessions = 10
+        started = time.perf_counter()
+        results = await asyncio.gather(*[_run_session(f"hi {i}") for i in range(sessions)])
+        concurrent = time.perf_counter() - started
+        await app.close_client()
+
+        assert len(results) == sessions
+        # A blocking client would take roughly sessions * single
+        assert concurrent < single * 2
+
+
+def _start_chainlit_session(emitter=None):
+    """Create a headless Chainlit context so handlers can run outside the server"""
+    from chainlit.context import ChainlitContext, context_var, init_http_context
+
+    context = init_http_context()
+    if emitter is not None:
+        context = ChainlitContext(context.session, emitter(context.session))
+        context_var.set(context)
+    return context
+
+
+def _recording_emitter(session):
+    """Emitter that records the UI events a handler sends"""
+    from chainlit.emitter import BaseChainlitEmitter
+
+    class RecordingEmitter(BaseChainlitEmitter):
+        def __init__(self, session):
+            super().__init__(session)
+            self.events = []
+
+        async def send_step(self, step_dict):
+            self.events.append(("send_step", step_dict))
+
+        async def update_step(self, step_dict):
+            self.events.append(("update_step", step_dict))
+
+        async def stream_start(self, step_dict):
+            self.events.append(("stream_start", step_dict))
+
+        async def send_token(self, id, token, is_sequence=False, is_input=False):
+            self.events.append(("send_token", token))
+
+    return RecordingEmitter(session)
+
+
+class TestConcurrentAnalysis:
+    """Test that independent analysis stages overlap within a turn"""
+
+    async def test_turn_critical_path_is_three_round_trips(self, fake_openai):
+        """Test performance and topic analysis run concurrently in main"""
+        import chainlit as cl
+
+        import app
+
+        _start_chainlit_session()
+        await app.main(cl.Message(content="Is the Switch still available?"))
+        await app.close_client()
+
+        timings = cl.user_session.get("stage_timings")
+        assert set(timings) == {"performance", "topic", "strategy", "response", "turn"}
+        # Run back to back the stages would take their sum; overlapping saves most of one round trip,
+        # so the bound scales with the fake's latency and leaves the other half of it for jitter
+        stage_total = sum(timings[s] for s in ("performance", "topic", "strategy", "response"))
+        assert timings["turn"] < stage_total - FAKE_LATENCY * 1000 / 2
+        assert len((await app.current_session()).history) == 2
+
+    def test_format_timings_reports_savings(self):
+        """Test format_timings shows the time saved by overlapping stages"""
+        import app
+
+        text = app.format_timings({"performance": 200, "topic": 150, "strategy": 100, "response": 300, "turn": 610})
+        assert "Performance: 200ms" in text
+        assert "saved 140ms" in text
+
+    def test_format_timings_without_turn(self):
+        """Test format_timings with only stage timings"""
+        import app
+
+        assert app.format_timings({"topic": 12.4}) == "Topic: 12ms"
+
+
+class TestSpeculativeResponse:
+    """Test speculative response generation ahead of determine_strategy"""
+
+    async def test_hit_keeps_speculative_response(self, fake_openai, monkeypatch):
+        """Test a correctly predicted strategy reuses the speculative response"""
+        import chainlit as cl
+
+        import app
+
+        monkeypatch.setattr(app, "SPECULATIVE_RESPONSE", True)
+        _start_chainlit_session()
+        (await app.current_session()).last_strategy = {"strategy": "soft_sell", "approach": "Share a favourite game"}
+
+        await app.main(cl.Message(content="What games do you have?"))
+        await app.close_client()
+
+        stats = cl.user_session.get("speculation_stats")
+        assert stats["attempts"] == 1 and stats["hits"] == 1
+        assert stats["saved_ms"] > 0
+        # Generation overlapped the analyses, so there was almost nothing left to wait for
+        assert cl.user_session.get("stage_timings")["response"] < 100
+        assert len(fake_openai.requests) == 4
+
+    async def test_miss_regenerates_response(self, fake_openai, monkeypatch):
+        """Test a wrong prediction cancels the speculative response and regenerates"""
+        import chainlit as cl
+
+        import app
+        from fake_openai import RESPONSE_TEXT
+
+        monkeypatch.setattr(app, "SPECULATIVE_RESPONSE", True)
+        _start_chainlit_session()
+        (await app.current_session()).last_strategy = {"strategy": "direct_pitch", "approach": "Name the price"}
+
+        await app.main(cl.Message(content="Tell me about your weekend"))
+        await app.close_client()
+
+        stats = cl.user_session.get("speculation_stats")
+        assert stats["misses"] == 1 and stats.get("hits", 0) == 0
+        assert (await app.current_session()).last_strategy["strategy"] == "soft_sell"
+        assert (await app.current_session()).history[-1].content == RESPONSE_TEXT
+
+    async def test_first_turn_has_nothing_to_predict(self, fake_openai, monkeypatch):
+        """Test no speculation happens without a previous strategy"""
+        import chainlit as cl
+
+        import app
+
+        monkeypatch.setattr(app, "SPECULATIVE_RESPONSE", True)
+        _start_chainlit_session()
+
+        await app.main(cl.Message(content="hi"))
+        await app.close_client()
+
+        assert cl.user_session.get("speculation_stats") is None
+        assert len(fake_openai.requests) == 4
+
+    async def test_saving_stops_when_the_speculative_response_finished(self, monkeypatch):
+        """Test a response that was ready before the strategy only counts its own generation time"""
+        import app
+
+        async def fake_generate_response(user_message, strategy, on_token=None):
+            return "ready"
+
+        monkeypatch.setattr(app, "generate_response", fake_generate_response)
+        speculation = app.start_speculation("hi", {"strategy": "soft_sell"})
+        await asyncio.sleep(0.2)
+        stats = {}
+
+        assert await app.resolve_speculation(speculation, "hi", {"strategy": "soft_sell"}, stats) == ("ready", True)
+        assert stats["saved_ms"] < 100
+
+    def test_format_speculation(self):
+        """Test hit rate and savings summary"""
+        import app
+
+        text = app.format_speculation({"attempts": 4, "hits": 3, "misses": 1, "saved_ms": 1234.5})
+        assert text == "Hit rate: 75% (3/4) | Saved: 1234ms"
+
+
+class TestRollingSummaryPipeline:
+    """Test main keeps the performance prompt bounded with a rolling summary"""
+
+    async def test_performance_prompt_uses_summary(self, fake_openai):
+        """Test old messages are summarized instead of resent"""
+        import chainlit as cl
+
+        import app
+        from conversation import ConversationState
+        from fake_openai import RESPONSE_TEXT
+
+        _start_chainlit_session()
+        (await app.current_session()).state = ConversationState(window=2)
+        for i in range(3):
+            await app.main(cl.Message(content=f"message number {i}"))
+        await app.close_client()
+
+        state = (await app.current_session()).state
+        assert state.summary == RESPONSE_TEXT
+        assert len((await app.current_session()).history) == 6
+
+        performance_prompts = [
+            r["messages"][1]["content"] for r in fake_openai.requests if "rate how close" in r["messages"][1]["content"]
+        ]
+        assert "Summary of earlier conversation" in performance_prompts[-1]
+        assert "message number 0" not in performance_prompts[-1]
+
+
+class TestFusedPipeline:
+    """Test the single-call fused analysis mode"""
+
+    async def test_fused_mode_makes_one_analysis_call(self, fake_openai, monkeypatch):
+        """Test fused mode replaces three analysis calls with one"""
+        import chainlit as cl
+
+        import app
+
+        monkeypatch.setattr(app, "PIPELINE_MODE", "fused")
+        _start_chainlit_session()
+
+        await app.main(cl.Message(content="Does it come with games?"))
+        await app.close_client()
+
+        json_calls = [r for r in fake_openai.requests if r.get("response_format")]
+        assert len(json_calls) == 1
+        assert "Last user message:\nDoes it come with games?" in json_calls[0]["messages"][1]["content"]
+        assert set(cl.user_session.get("stage_timings")) == {"analysis", "response", "turn"}
+        assert (await app.current_session()).last_strategy["strategy"] == "soft_sell"
+
+    def test_split_fused_analysis(self):
+        """Test a fused result splits into the staged dicts, with fallbacks for missing keys"""
+        import app
+
+        performance, topic_analysis, strategy = app.split_fused_analysis(
+            {"progress_score": 70, "buyer_interest": "high", "current_topic": "price", "strategy": "direct_pitch"}
+        )
+
+        assert performance == {
+            "progress_score": 70,
+            "buyer_interest": "high",
+            "key_signals": [],
+            "assessment": "Unable to assess",
+        }
+        assert topic_analysis["current_topic"] == "price"
+        assert topic_analysis["relevance_to_goal"] == "low"
+        assert strategy["strategy"] == "direct_pitch"
+        assert strategy["approach"] == app.STRATEGY_FALLBACK["approach"]
+
+    async def test_fused_failure_returns_fallbacks(self, monkeypatch):
+        """Test a failed fused call returns the staged fallback dicts"""
+        import app
+        from conversation import ConversationState
+
+        monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+        app._client = None
+
+        performance, topic_analysis, strategy = await app.analyze_fused(ConversationState(), "hi")
+
+        assert performance == app.PERFORMANCE_FALLBACK
+        assert topic_analysis == app.TOPIC_FALLBACK
+        assert strategy == app.STRATEGY_FALLBACK
+
+
+class TestPipelinedMode:
+    """Test performance analysis runs after the reply and feeds the next turn's strategy"""
+
+    @pytest.fixture(autouse=True)
+    def pipelined(self, monkeypatch):
+        import app
+        from session_tasks import SessionTasks
+
+        monkeypatch.setattr(app, "PIPELINE_MODE", "pipelined")
+        monkeypatch.setattr(app, "session_tasks", SessionTasks())
+
+    async def test_reply_does_not_wait_for_performance(self, fake_openai):
+        """Test the turn ends before the evaluation, which then updates the panel and the session"""
+        import chainlit as cl
+
+        import app
+
+        context = _start_chainlit_session()
+        await app.main(cl.Message(content="How much for the Switch?"))
+
+        session = await app.current_session()
+        assert session.last_performance is None
+        assert session.metrics.total_messages == 0
+        assert app.session_tasks.get(context.session.id, "performance") is not None
+
+        await app.session_tasks.wait(context.session.id)
+        await app.close_client()
+        assert session.last_performance["progress_score"] == 50
+        assert session.metrics.total_messages == 1
+        assert "background_performance" in cl.user_session.get("stage_timings")
+
+    async def test_strategy_uses_previous_turns_evaluation(self, fake_openai):
+        """Test the first strategy sees the fallback score and the second the evaluation of turn one"""
+        import chainlit as cl
+
+        import app
+
+        context = _start_chainlit_session()
+        await app.main(cl.Message(content="How much for the Switch?"))
+        await app.session_tasks.wait(context.session.id)
+        await app.main(cl.Message(content="Can you do 140?"))
+        await app.session_tasks.wait(context.session.id)
+        await app.close_client()
+
+        strategy_prompts = [r["messages"][1]["content"] for r in fake_openai.requests if "next strategy" in str(r)]
+        assert "Progress score: 0\n" in strategy_prompts[0]
+        assert "Progress score: 50\n" in strategy_prompts[1]
+
+    async def test_session_end_cancels_background_work(self, fake_openai):
+        import chainlit as cl
+
+        import app
+
+        context = _start_chainlit_session()
+        await app.main(cl.Message(content="How much for the Switch?"))
+        task = app.session_tasks.get(context.session.id, "performance")
+        await app.end()
+        await asyncio.sleep(0)
+        await app.close_client()
+
+        assert task.cancelled()
+        assert app.session_tasks.running() == 0
+        assert app.session_tasks.cancelled == 1
+
+
+class TestLocalStrategyPolicy:
+    """Test main skips determine_strategy when the local policy is confident"""
+
+    async def test_confident_policy_skips_strategy_call(self, fake_openai, monkeypatch):
+        """Test a confident local decision avoids the strategy round trip"""
+        import chainlit as cl
+
+        import app
+        from strategy_policy import StrategyPolicy
+
+        monkeypatch.setattr(app, "strategy_policy", StrategyPolicy(mode="hybrid"))
+        _start_chainlit_session()
+
+        await app.main(cl.Message(content="What games come with it?"))
+        await app.close_client()
+
+        prompts = [r["messages"][1]["content"] for r in fake_openai.requests]
+        assert not any("determine the best next strategy" in p for p in prompts)
+        # Fake analysis reports medium interest and high relevance
+        assert (await app.current_session()).last_strategy["strategy"] == "soft_sell"
+        assert app.strategy_policy.counts["local"] == 1
+
+
+class TestTopicCachePipeline:
+    """Test analyze_topic reuses cached analyses for near-duplicate messages"""
+
+    async def test_near_duplicate_skips_llm(self, fake_openai):
+        """Test a near-identical message is answered from the cache"""
+        import app
+
+        first = await app.analyze_topic("Is it still available?")
+        second = await app.analyze_topic("is it still available??")
+        await app.close_client()
+
+        assert first == second
+        assert len(fake_openai.requests) == 1
+        assert app.topic_cache.stats()["hits"] == 1
+
+    async def test_fallback_is_not_cached(self, monkeypatch):
+        """Test a failed analysis is not stored"""
+        import app
+
+        monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+        app._client = None
+
+        assert await app.analyze_topic("how much?") == app.TOPIC_FALLBACK
+        assert len(app.topic_cache) == 0
+
+    async def test_partly_invalid_analysis_is_not_cached(self, fake_openai, monkeypatch):
+        """Test an analysis that needed defaults is not stored for near-duplicates"""
+        import app
+        import fake_openai as fake_openai_module
+
+        contents = ['{"current_topic": "price", "relevance_to_goal": "huge"}']
+        json_content = fake_openai_module.json_content
+        monkeypatch.setattr(
+            fake_openai_module, "json_content", lambda body: contents.pop() if contents else json_content(body)
+        )
+        first = await app.analyze_topic("how much?")
+        await app.analyze_topic("how much??")
+        await app.close_client()
+
+        assert "relevance_to_goal" in first.invalid
+        assert len(fake_openai.requests) == 2
+        assert len(app.topic_cache) == 1
+
+    async def test_cache_can_be_disabled(self, fake_openai, monkeypatch):
+        """Test every message reaches the LLM without a cache"""
+        import app
+
+        monkeypatch.setattr(app, "topic_cache", None)
+        await app.analyze_topic("lol")
+        await app.analyze_topic("lol")
+        await app.close_client()
+
+        assert len(fake_openai.requests) == 2
+
+
+class TestCompletionCachePipeline:
+    """Test the stage functions share the persistent completion cache"""
+
+    async def test_cached_stages_skip_llm(self, fake_openai, monkeypatch, tmp_path):
+        """Test repeated analysis is served from the cache while responses are not"""
+        import app
+        from completion_cache import CompletionCache
+        from conversation import ConversationState
+
+        monkeypatch.setattr(app, "topic_cache", None)
+        monkeypatch.setattr(app, "completion_cache", CompletionCache(str(tmp_path / "cache.sqlite3")))
+        state = ConversationState.from_history([{"role": "user", "content": "hi"}])
+
+        for _ in range(2):
+            performance = await app.analyze_performance(state)
+            await app.analyze_topic("hi")
+            await app.generate_response("hi", {"strategy": "soft_sell"})
+        await app.close_client()
+
+        assert performance["progress_score"] == 50
+        # Performance and topic hit the cache the second time; response generation always calls the LLM
+        assert len(fake_openai.requests) == 4
+        stages = app.completion_cache.stats()["stages"]
+        assert stages["performance"]["hits"] == 1 and stages["topic"]["hits"] == 1
+        assert "response" not in stages
+
+    async def test_cached_response_streams_as_one_token(self, fake_openai, monkeypatch, tmp_path):
+        """Test a cached streamed stage still reaches the token callback"""
+        import app
+        from completion_cache import CompletionCache
+        from fake_openai import RESPONSE_TEXT
+
+        cache = CompletionCache(str(tmp_path / "cache.sqlite3"), stages={"response"})
+        monkeypatch.setattr(app, "completion_cache", cache)
+        tokens = []
+
+        async def on_token(token):
+            tokens.append(token)
+
+        await app.generate_response("hi", {"strategy": "soft_sell"}, on_token)
+        tokens.clear()
+        text = await app.generate_response("hi", {"strategy": "soft_sell"}, on_token)
+        await app.close_client()
+
+        assert text == RESPONSE_TEXT
+        assert tokens == [RESPONSE_TEXT]
+        assert len(fake_openai.requests) == 1
+
+    def test_invalid_json_is_not_cacheable(self):
+        """Test JSON-mode output that won't parse is never cached"""
+        import app
+
+        assert not app._cacheable("not json", {"response_format": {"type": "json_object"}})
+        assert app._cacheable("{}", {"response_format": {"type": "json_object"}})
+        assert app._cacheable("plain text", {})
+
+    async def test_partly_invalid_analysis_is_not_cached(self, fake_openai, monkeypatch, tmp_path):
+        """Test an analysis that needed defaults is called again instead of served from the cache"""
+        import app
+        import fake_openai as fake_openai_module
+        from completion_cache import CompletionCache
+
+        monkeypatch.setattr(app, "topic_cache", None)
+        monkeypatch.setattr(app, "completion_cache", CompletionCache(str(tmp_path / "cache.sqlite3")))
+        contents = ['{"current_topic": "price", "relevance_to_goal": "huge"}']
+        json_content = fake_openai_module.json_content
+        monkeypatch.setattr(
+            fake_openai_module, "json_content", lambda body: contents.pop() if contents else json_content(body)
+        )
+        for _ in range(3):
+            await app.analyze_topic("hi")
+        await app.close_client()
+
+        # The invalid first answer isn't stored; the valid second one is served to the third call
+        assert len(fake_openai.requests) == 2
+        assert app.completion_cache.stats()["stages"]["topic"]["hits"] == 1
+        assert not app._cacheable('{"current_topic": "price"}', {}, app.valid_analysis(app.TopicResult()))
+
+
+@pytest.fixture
+def slow_stream_openai(monkeypatch):
+    """Fake endpoint that streams one word every 20ms"""
+    import app
+    from fake_openai import FakeOpenAIServer
+
+    with FakeOpenAIServer(latency=0.05, token_delay=0.02) as server:
+        monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+        monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+        app._client = None
+        yield server
+        app._client = None
+
+
+class TestTokenStreaming:
+    """Test streaming generate_response tokens into the chat message"""
+
+    async def test_tokens_stream_into_message(self, slow_stream_openai, monkeypatch):
+        """Test tokens reach the UI as they arrive and the full text lands in history"""
+        import chainlit as cl
+
+        import app
+        from fake_openai import RESPONSE_TEXT
+
+        monkeypatch.setattr(app, "STREAM_RESPONSES", True)
+        context = _start_chainlit_session(_recording_emitter)
+
+        await app.main(cl.Message(content="How much?"))
+        await app.close_client()
+
+        events = context.emitter.events
+        tokens = [data for name, data in events if name == "send_token"]
+        assert any(name == "stream_start" for name, _ in events)
+        assert "".join(tokens) in RESPONSE_TEXT and len(tokens) > 3
+        assert (await app.current_session()).history[-1].content == RESPONSE_TEXT
+
+        stats = cl.user_session.get("stream_stats")
+        assert stats["tokens"] == len(RESPONSE_TEXT.split(" "))
+        assert stats["tokens_per_sec"] > 0
+        # TTFT counts the analysis the user waited through (analysis, strategy and response requests
+        # in sequence, 50ms each before any token), but the first token still arrives long before the
+        # whole completion has streamed
+        assert stats["ttft_ms"] > 3 * 50
+        assert stats["ttft_ms"] < cl.user_session.get("stage_timings")["turn"] - 100
+
+    async def test_streaming_disabled_sends_whole_message(self, slow_stream_openai, monkeypatch):
+        """Test the non-streaming path sends the response in one message"""
+        import chainlit as cl
+
+        import app
+
+        monkeypatch.setattr(app, "STREAM_RESPONSES", False)
+        context = _start_chainlit_session(_recording_emitter)
+
+        await app.main(cl.Message(content="How much?"))
+        await app.close_client()
+
+        assert not any(name == "send_token" for name, _ in context.emitter.events)
+        assert cl.user_session.get("stream_stats") == {}
+        assert "stream" not in slow_stream_openai.requests[-1]
+
+    def test_format_stream_stats(self):
+        """Test streaming summary formatting"""
+        import app
+
+        text = app.format_stream_stats({"ttft_ms": 180.4, "tokens": 42, "tokens_per_sec": 55.25})
+        assert text == "TTFT: 180ms | 42 tokens @ 55.2 tok/s"
+
+
+class TestStreamedAnalysis:
+    """Test the strategy and response start once the analysis fields they read have streamed in"""
+
+    @staticmethod
+    def _streaming_complete(events):
+        """Fake complete() that streams each analysis in two halves with a pause between them"""
+        from fake_openai import ANALYSIS_RESULT, RESPONSE_TEXT
+
+        first_half = {
+            "performance": ("progress_score", "buyer_interest"),
+            "topic": ("current_topic", "relevance_to_goal"),
+            "strategy": ("strategy", "approach"),
+        }
+
+        async def fake_complete(stage, messages, on_token=None, **params):
+            if stage == "response":
+                events.append("response")
+                return RESPONSE_TEXT
+            content = json.dumps({key: ANALYSIS_RESULT[key] for key in ANALYSIS_RESULT if key in first_half[stage]})
+            rest = json.dumps({key: ANALYSIS_RESULT[key] for key in ANALYSIS_RESULT if key not in first_half[stage]})
+            full = content[:-1] + ", " + rest[1:]
+            if on_token is not None:
+                await on_token(content[:-1] + ", ")
+                await asyncio.sleep(0.05)
+                await on_token(rest[1:])
+            events.append(f"{stage} done")
+            return full
+
+        return fake_complete
+
+    async def test_response_starts_before_analysis_finishes(self, monkeypatch):
+        import chainlit as cl
+
+        import app
+
+        events = []
+        monkeypatch.setattr(app, "complete", self._streaming_complete(events))
+        _start_chainlit_session()
+        await app.main(cl.Message(content="How much for the Switch?"))
+
+        assert events.index("response") < events.index("performance done")
+        assert events.index("response") < events.index("strategy done")
+        # The turn still waits for the full analysis before the panel and session are updated
+        session = await app.current_session()
+        assert session.last_strategy["reasoning"] == "Interest is building"
+        assert session.metrics.total_messages == 1
+
+    async def test_disabled_waits_for_whole_analysis(self, monkeypatch):
+        import chainlit as cl
+
+        import app
+
+        events = []
+        monkeypatch.setattr(app, "STREAM_ANALYSIS", False)
+        monkeypatch.setattr(app, "complete", self._streaming_complete(events))
+        _start_chainlit_session()
+        await app.main(cl.Message(content="How much for the Switch?"))
+
+        assert events[-1] == "response"
+        assert (await app.current_session()).last_strategy["approach"] == "Share a favourite game"
+
+    async def test_invalid_fields_fall_back_individually(self, monkeypatch):
+        """Test an out-of-schema value only replaces that field, not the whole analysis"""
+        import app
+        from conversation import ConversationState
+
+        async def fake_complete(stage, messages, on_token=None, **params):
+            return json.dumps({"progress_score": "very high", "buyer_interest": "HIGH", "assessment": "Keen"})
+
+        monkeypatch.setattr(app, "complete", fake_complete)
+        performance = await app.analyze_performance(ConversationState())
+
+        assert performance.progress_score == 0
+        assert performance.buyer_interest == "high"
+        assert performance.assessment == "Keen"
+        assert performance.invalid == ["progress_score", "key_signals"]
+        assert app.telemetry.stage("performance").fallbacks == 0
+
+
+class TestModelRouting:
+    """Test stage calls follow their routes and escalate when validation fails"""
+
+    @staticmethod
+    def _escalating_complete(calls, content):
+        """Fake complete() that answers with content, and with a valid analysis when escalated"""
+        from fake_openai import ANALYSIS_RESULT
+
+        async def fake_complete(stage, messages, on_token=None, escalate=False, **params):
+            calls.append(escalate)
+            return json.dumps(ANALYSIS_RESULT) if escalate else content
+
+        return fake_complete
+
+    async def test_stage_uses_its_routed_model(self, fake_openai, monkeypatch):
+        import app
+        from conversation import ConversationState
+        from routing import Router, load_routes
+
+        routes = load_routes("")
+        routes["topic"].model = "topic-model"
+        monkeypatch.setattr(app, "router", Router(routes))
+
+        await _run_session("How much for the Switch?")
+        await app.close_client()
+
+        models = {r["messages"][0]["content"]: r["model"] for r in fake_openai.requests}
+        assert models[app.TOPIC_SYSTEM_PROMPT] == "topic-model"
+        assert models[app.SYSTEM_PROMPT] == "gpt-4o-mini"
+        assert app.performance_request(ConversationState())["model"] == "gpt-4o-mini"
+
+    async def test_invalid_output_escalates(self, monkeypatch):
+        import app
+        from conversation import ConversationState
+        from routing import Router, load_routes
+
+        routes = load_routes("")
+        routes["performance"].escalation_model = "gpt-4o"
+        monkeypatch.setattr(app, "router", Router(routes))
+        calls = []
+        monkeypatch.setattr(app, "complete", self._escalating_complete(calls, '{"progress_score": "lots"}'))
+
+        performance = await app.analyze_performance(ConversationState())
+
+        assert calls == [False, True]
+        assert performance.progress_score == 50
+        assert performance.invalid == []
+
+    async def test_unparseable_output_escalates(self, monkeypatch):
+        import app
+        from conversation import ConversationHistory
+        from routing import Router, load_routes
+
+        routes = load_routes("")
+        routes["strategy"].escalation_model = "gpt-4o"
+        monkeypatch.setattr(app, "router", Router(routes))
+        calls = []
+        monkeypatch.setattr(app, "complete", self._escalating_complete(calls, "Sure! Here's the JSON:"))
+
+        strategy = await app.determine_strategy({}, {}, ConversationHistory())
+
+        assert calls == [False, True]
+        assert strategy.strategy == "soft_sell"
+        assert app.telemetry.stage("strategy").fallbacks == 0
+
+    async def test_valid_output_or_no_escalation_model_makes_one_call(self, monkeypatch):
+        import app
+        from fake_openai import ANALYSIS_RESULT
+        from routing import Router, load_routes
+
+        routes = load_routes("")
+        routes["topic"].escalation_model = "gpt-4o"
+        monkeypatch.setattr(app, "router", Router(routes))
+        monkeypatch.setattr(app, "topic_cache", None)
+        calls = []
+        monkeypatch.setattr(app, "complete", self._escalating_complete(calls, json.dumps(ANALYSIS_RESULT)))
+        assert (await app.analyze_topic("hi")).invalid == []
+
+        monkeypatch.setattr(app, "router", Router(load_routes("")))
+        monkeypatch.setattr(app, "complete", self._escalating_complete(calls, '{"relevance_to_goal": "huge"}'))
+        topic_analysis = await app.analyze_topic("hi")
+
+        assert calls == [False, False]
+        assert topic_analysis == app.TOPIC_FALLBACK
+
+    async def test_slow_primary_moves_to_fast_model(self, fake_openai, monkeypatch):
+        import app
+        from routing import Route, Router
+
+        monkeypatch.setattr(
+            app, "router", Router({"summary": Route(model="primary", fast_model="fast", latency_slo_ms=100)}, min_samples=2)
+        )
+        for _ in range(3):
+            await app.summarize_conversation("", [])
+        await app.close_client()
+
+        # The fake answers in 200ms, so the primary's p95 is over the SLO after two calls
+        assert [r["model"] for r in fake_openai.requests] == ["primary", "primary", "fast"]
+
+
+class TestSessionMetricsPanel:
+    """Test the debug panel reads one bounded metrics object per session"""
+
+    async def test_panel_uses_running_metrics(self):
+        """Test totals, peak and the recent-strategy trail after many turns"""
+        import chainlit as cl
+
+        import app
+        from debug_panel import DebugPanel
+
+        context = _start_chainlit_session(_recording_emitter)
+        cl.user_session.set("debug_panel", DebugPanel(min_interval=0))
+        strategies = ["build_rapport", "soft_sell", "soft_sell", "direct_pitch", "create_urgency", "soft_sell", "direct_pitch"]
+        for i, name in enumerate(strategies):
+            performance = {"progress_score": 10 * (i + 1), "buyer_interest": "medium"}
+            await app.send_debug_panel(performance, {"current_topic": "switch"}, {"strategy": name})
+
+        metrics = (await app.current_session()).metrics
+        assert metrics.total_messages == 7
+        assert metrics.peak_progress == 70
+        assert list(metrics.recent_strategies) == strategies[-5:]
+        assert cl.user_session.get("strategy_history") is None
+
+        panel = [data["output"] for name, data in context.emitter.events if name in ("send_step", "update_step")][-1]
+        assert "**Messages:** 7" in panel
+        assert "**Peak Progress:** 70% | **Average:** 40%" in panel
+        assert "*Soft Sell, Direct Pitch, Create Urgency, Soft Sell, Direct Pitch*" in panel
+        assert "**Most Used:** Soft Sell (3 of 7)" in panel
+
+    async def test_process_wide_stats_are_labelled(self):
+        """Test the session's own numbers come before the stats shared by every session"""
+        import app
+        from token_budget import SessionBudget
+
+        _start_chainlit_session()
+        panel = app.render_debug_panel({}, {}, {}, _recorded_metrics(), budget=SessionBudget())
+        session_part, _, global_part = panel.partition("### 🌐 Server-wide (all sessions)")
+
+        assert "**Token Budget:**" in session_part
+        assert "**Session Store:**" in global_part and "**Session Store:**" not in session_part
+
+
+class TestUpstreamResilience:
+    """Test retries and circuit breaking against a failing endpoint"""
+
+    async def test_transient_errors_are_retried(self, fake_openai):
+        """Test a stage recovers from 503s without falling back"""
+        import app
+        from fake_openai import ANALYSIS_RESULT
+
+        fake_openai.fail_next = 2
+        topic_analysis = await app.analyze_topic("What games do you have?")
+        await app.close_client()
+
+        assert topic_analysis["current_topic"] == ANALYSIS_RESULT["current_topic"]
+        assert len(fake_openai.requests) == 3
+        assert app.resilience.stats()["topic"]["retries"] == 2
+
+    async def test_open_breaker_returns_fallback_without_calling(self, fake_openai, monkeypatch):
+        """Test an outage opens the stage's breaker and later calls go straight to the fallback"""
+        import app
+        from conversation import ConversationHistory
+        from resilience import Resilience
+
+        monkeypatch.setattr(app, "resilience", Resilience(max_attempts=1, failure_threshold=2, reset_timeout=60))
+        fake_openai.fail_next = 100
+        for _ in range(2):
+            assert await app.determine_strategy({}, {}, ConversationHistory()) == app.STRATEGY_FALLBACK
+
+        requests_before = len(fake_openai.requests)
+        assert await app.determine_strategy({}, {}, ConversationHistory()) == app.STRATEGY_FALLBACK
+        await app.close_client()
+
+        assert len(fake_openai.requests) == requests_before
+        assert app.resilience.stats()["strategy"]["short_circuits"] == 1
+        _start_chainlit_session()
+        assert "Upstream Health" in app.render_debug_panel({}, {}, {}, _recorded_metrics())
+
+    async def test_stage_deadline_falls_back(self, fake_openai, monkeypatch):
+        """Test a stage slower than its deadline returns its fallback"""
+        import app
+        from resilience import Resilience
+
+        monkeypatch.setattr(app, "resilience", Resilience(deadlines={"topic": 0.05}))
+        assert await app.analyze_topic("hello there") == app.TOPIC_FALLBACK
+        await app.close_client()
+        assert app.resilience.stats()["topic"]["timeouts"] == 1
+
+
+def _recorded_metrics():
+    from session_metrics import SessionMetrics
+
+    metrics = SessionMetrics()
+    metrics.record(0, "build_rapport")
+    return metrics
+
+
+class TestSessionStoreIntegration:
+    """Test main keeps durable session state in the session store"""
+
+    async def test_evicted_session_resumes(self, fake_openai):
+        """Test a turn after the session left the hot cache continues the same conversation"""
+        import chainlit as cl
+
+        import app
+
+        context = _start_chainlit_session()
+        await app.start()
+        await app.main(cl.Message(content="How much for the Switch?"))
+        app.session_store.release(context.session.id)
+        await app.main(cl.Message(content="Can you do 140?"))
+        await app.close_client()
+
+        session = await app.current_session()
+        assert [turn.content for turn in session.history][::2] == ["How much for the Switch?", "Can you do 140?"]
+        assert session.metrics.total_messages == 2
+        assert app.session_store.stats()["loads"] == 1
+
+    async def test_next_turn_on_another_worker(self, fake_openai, monkeypatch, tmp_path):
+        """Test a second worker sharing the SQLite store picks up the conversation"""
+        import chainlit as cl
+
+        import app
+        from session_store import SessionStore, SQLiteBackend
+
+        path = str(tmp_path / "sessions.sqlite3")
+        monkeypatch.setattr(app, "session_store", SessionStore(SQLiteBackend(path)))
+        _start_chainlit_session()
+        await app.main(cl.Message(content="hey"))
+
+        monkeypatch.setattr(app, "session_store", SessionStore(SQLiteBackend(path)))
+        await app.main(cl.Message(content="what games come with it"))
+        await app.close_client()
+
+        performance_prompt = [r for r in fake_openai.requests if "rate how close" in r["messages"][1]["content"]][-1]
+        assert "User: hey" in performance_prompt["messages"][1]["content"]
+        assert len((await app.current_session()).history) == 4
+
+
+class TestTopicBatching:
+    """Test analyze_topic calls from concurrent sessions share one request"""
+
+    async def test_concurrent_sessions_share_one_request(self, fake_openai, monkeypatch):
+        """Test each session gets its own analysis from one batched call"""
+        import app
+        from micro_batcher import MicroBatcher
+
+        monkeypatch.setattr(app, "topic_batcher", MicroBatcher(app.analyze_topic_batch, window=0.02, max_size=8))
+        messages = ["How much for the Switch?", "lol", "does it have zelda", "can you do 140"]
+        results = await asyncio.gather(*(app.analyze_topic(message) for message in messages))
+        await app.close_client()
+
+        assert len(fake_openai.requests) == 1
+        prompt = fake_openai.requests[0]["messages"][-1]["content"]
+        assert all(f'{i}. "{message}"' in prompt for i, message in enumerate(messages, 1))
+        assert all(result["current_topic"] == "gaming" and "id" not in result for result in results)
+        assert app.topic_cache.stats()["entries"] == 4
+
+    async def test_missing_result_falls_back(self, monkeypatch):
+        """Test a message the model left out of the batch gets the fallback and isn't cached"""
+        import app
+        from micro_batcher import MicroBatcher
+
+        async def fake_complete(stage, messages, on_token=None, **params):
+            return json.dumps({"results": [{"id": "2", "current_topic": "price"}]})
+
+        monkeypatch.setattr(app, "complete", fake_complete)
+        monkeypatch.setattr(app, "topic_batcher", MicroBatcher(app.analyze_topic_batch, window=0.01, max_size=8))
+        first, second = await asyncio.gather(app.analyze_topic("hi"), app.analyze_topic("how much"))
+
+        assert first == app.TOPIC_FALLBACK
+        # Fields the batch left out of a result get their defaults and are reported as invalid
+        assert second == {**app.TOPIC_FALLBACK, "current_topic": "price"}
+        assert second.invalid == ["relevance_to_goal", "pivot_opportunity"]
+        assert app.telemetry.stage("topic").fallbacks == 1
+        assert app.topic_cache.get("hi") is None
+
+    async def test_failed_batch_falls_back_for_everyone(self, fake_openai, monkeypatch):
+        import app
+        from micro_batcher import MicroBatcher
+        from resilience import Resilience
+
+        monkeypatch.setattr(app, "resilience", Resilience(max_attempts=1))
+        monkeypatch.setattr(app, "topic_batcher", MicroBatcher(app.analyze_topic_batch, window=0.01, max_size=8))
+        fake_openai.fail_next = 1
+        results = await asyncio.gather(app.analyze_topic("one"), app.analyze_topic("two"))
+        await app.close_client()
+
+        assert results == [app.TOPIC_FALLBACK, app.TOPIC_FALLBACK]
+        assert app.telemetry.stage("topic").fallbacks == 2
+
+
+class TestRateLimitedPipeline:
+    """Test complete() goes through the shared rate limiter"""
+
+    async def test_stages_reserve_by_priority(self, fake_openai, monkeypatch):
+        """Test each stage call is granted in its priority class and usage is settled"""
+        import app
+        from rate_limiter import RateLimiter
+
+        monkeypatch.setattr(app, "rate_limiter", RateLimiter(rpm=600, tpm=100_000))
+        await _run_session("How much for the Switch?")
+        await app.close_client()
+
+        classes = app.rate_limiter.stats()["classes"]
+        assert classes["interactive"]["granted"] == 1
+        assert classes["analysis"]["granted"] == 3
+        # Reservations were refunded down to the 20 tokens the fake endpoint reports per call
+        assert app.rate_limiter.stats()["tokens_available"] > 100_000 - 4 * 20 - 50
+
+    async def test_response_jumps_the_queue(self, fake_openai, monkeypatch):
+        """Test a queued response call is sent before queued analysis calls"""
+        import app
+        from rate_limiter import RateLimiter
+
+        monkeypatch.setattr(app, "rate_limiter", RateLimiter(rpm=1200))
+        app.rate_limiter._requests = 0
+        await asyncio.gather(
+            app.analyze_topic("first message"),
+            app.analyze_topic("second message"),
+            app.generate_response("hi", {"strategy": "soft_sell"}),
+        )
+        await app.close_client()
+
+        assert "response_format" not in fake_openai.requests[0]
+        assert app.telemetry.stage("response").queue_wait.sum < app.telemetry.stage("topic").queue_wait.sum
+
+
+class TestPromptCaching:
+    """Test every stage sends a static prefix first and reports its prompt cache hits"""
+
+    TEMPLATES = (
+        "PERFORMANCE_EVAL_PROMPT",
+        "TOPIC_ANALYSIS_PROMPT",
+        "TOPIC_BATCH_PROMPT",
+        "STRATEGY_PROMPT",
+        "FUSED_ANALYSIS_PROMPT",
+        "SUMMARY_PROMPT",
+        "RESPONSE_GENERATION_PROMPT",
+    )
+
+    def test_variable_fields_come_last(self):
+        """Test nothing but field labels follows a template's first placeholder"""
+        import app
+
+        for name in self.TEMPLATES:
+            template = getattr(app, name)
+            static = template.partition("{")[0]
+            for line in template[len(static.rpartition("\n")[0]) :].splitlines():
+                assert not line or "{" in line or line.endswith(":"), f"{name}: {line!r} follows a variable field"
+
+    async def test_calls_share_the_static_prefix(self, fake_openai):
+        """Test two sessions' calls to a stage are byte-identical up to the template's first field"""
+        import app
+
+        await _run_session("How much for the Switch?")
+        await _run_session("does it come with zelda")
+        await app.close_client()
+
+        by_system = {}
+        for request in fake_openai.requests:
+            by_system.setdefault(request["messages"][0]["content"], []).append(request["messages"][1]["content"])
+        for template in (app.PERFORMANCE_EVAL_PROMPT, app.TOPIC_ANALYSIS_PROMPT, app.RESPONSE_GENERATION_PROMPT):
+            static = template.partition("{")[0]
+            first, second = next(prompts for prompts in by_system.values() if prompts[0].startswith(static))
+            assert first != second
+            assert len(os.path.commonprefix([first, second])) >= len(static)
+
+    async def test_cached_ratio_is_reported(self, monkeypatch):
+        """Test cached_tokens from the endpoint show up as a per-stage cache ratio"""
+        import app
+        from fake_openai import FakeOpenAIServer
+
+        with FakeOpenAIServer(prefix_cache_tokens=64) as server:
+            monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+            monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+            app._client = None
+            await _run_session("How much for the Switch?")
+            await _run_session("does it come with zelda")
+            await app.close_client()
+
+        response = app.telemetry.stage("response")
+        assert response.cached_tokens > 0
+        assert 0 < response.cached_ratio < 1
+        assert "of prompt cached" in app.telemetry.format_stats()
+
+    async def test_prompt_cache_key(self, fake_openai, monkeypatch):
+        import app
+
+        monkeypatch.setattr(app, "PROMPT_CACHE_KEY", "chatbot")
+        await app.analyze_topic("How much for the Switch?")
+        await app.close_client()
+
+        assert fake_openai.requests[0]["prompt_cache_key"] == "chatbot-topic"
+
+
+class TestTokenBudgets:
+    """Test prompts stay within their stage budgets and sessions within their token budget"""
+
+    async def test_long_message_stays_within_stage_budgets(self, fake_openai):
+        """Test a huge message is cut to fit every stage's prompt budget and completions are capped"""
+        import app
+        from rate_limiter import estimate_prompt_tokens
+        from token_budget import STAGE_PROMPT_BUDGETS
+
+        await _run_session("How much for the Switch? " + "blah " * 5000)
+        await app.close_client()
+
+        assert len(fake_openai.requests) == 4
+        for request in fake_openai.requests:
+            # The budget covers message content; the chat format adds a few tokens per message
+            assert estimate_prompt_tokens(request["messages"]) <= max(STAGE_PROMPT_BUDGETS.values()) + 8
+            assert request["max_tokens"] <= 300
+        response_prompt = fake_openai.requests[-1]["messages"][1]["content"]
+        assert "How much for the Switch? blah" in response_prompt and "…" in response_prompt
+
+    async def test_turn_is_charged_to_the_session(self, fake_openai):
+        """Test the usage of every stage call in a turn is added to the session's totals"""
+        import chainlit as cl
+
+        import app
+
+        _start_chainlit_session()
+        await app.main(cl.Message(content="How much for the Switch?"))
+        await app.close_client()
+
+        session = await app.current_session()
+        assert session.budget.tokens > 0
+        assert session.budget.cost_usd > 0
+        assert session.budget.tokens == sum(
+            stats.prompt_tokens + stats.completion_tokens for stats in app.telemetry.stages.values()
+        )
+
+    async def test_exhausted_session_skips_the_pipeline(self, fake_openai):
+        """Test a session over its budget is answered without calling the API"""
+        import chainlit as cl
+
+        import app
+        from token_budget import SessionBudget
+
+        _start_chainlit_session()
+        session = await app.current_session()
+        session.budget = SessionBudget(tokens=100, max_tokens=100)
+        await app.main(cl.Message(content="How much for the Switch?"))
+
+        assert fake_openai.requests == []
+        assert len(session.history) == 0
+
+    async def test_budget_runs_out_through_real_turns(self, fake_openai):
+        """Test a session reaches its limit turn by turn, is told so, and then stops calling the API"""
+        import chainlit as cl
+
+        import app
+        from token_budget import SessionBudget
+
+        _start_chainlit_session()
+        session = await app.current_session()
+        session.budget = SessionBudget(max_tokens=1500)
+        replies = []
+        for _ in range(10):
+            await app.main(cl.Message(content="How much for the Switch?"))
+            replies.append(session.history[-1].content)
+            if session.budget.exhausted:
+                break
+        await app.close_client()
+
+        # Calls are refused before the totals reach the limit; the refused turn already says so
+        assert session.budget.tokens < 1500
+        assert replies[-1] == app.BUDGET_EXHAUSTED_MESSAGE
+        assert app.BUDGET_EXHAUSTED_MESSAGE not in replies[:-1]
+
+        requests, turns = len(fake_openai.requests), len(session.history)
+        await app.main(cl.Message(content="still there?"))
+        assert len(fake_openai.requests) == requests and len(session.history) == turns
+
+    async def test_call_over_budget_falls_back(self, fake_openai):
+        """Test a stage call that would cross the budget is refused and the stage falls back"""
+        import app
+        from token_budget import SessionBudget, session_budget
+
+        token = session_budget.set(SessionBudget(tokens=0, max_tokens=50))
+        try:
+            result = await app.analyze_topic("How much for the Switch?")
+        finally:
+            session_budget.reset(token)
+
+        assert result == app.TOPIC_FALLBACK
+        assert fake_openai.requests == []
+        assert app.telemetry.stage("topic").fallbacks == 1
+
+    async def test_concurrent_calls_cannot_overrun_the_budget(self, fake_openai):
+        """Test calls in flight reserve their estimate, so concurrent ones can't all pass on the same totals"""
+        import app
+        from token_budget import BudgetExceededError, SessionBudget, session_budget
+
+        budget = SessionBudget(max_tokens=1000)
+        messages = [{"role": "user", "content": "x" * 1200}]
+        token = session_budget.set(budget)
+        try:
+            results = await asyncio.gather(*(app.complete("summary", messages) for _ in range(3)), return_exceptions=True)
+        finally:
+            session_budget.reset(token)
+        await app.close_client()
+
+        assert sum(isinstance(result, BudgetExceededError) for result in results) == 2
+        assert len(fake_openai.requests) == 1
+        assert (budget.tokens, budget.reserved_tokens) == (20, 0)
+
+    async def test_failed_call_releases_its_reservation(self, fake_openai, monkeypatch):
+        import app
+        from resilience import Resilience
+        from token_budget import SessionBudget, session_budget
+
+        monkeypatch.setattr(app, "resilience", Resilience(max_attempts=1))
+        fake_openai.fail_next = 1
+        budget = SessionBudget(max_tokens=1000)
+        token = session_budget.set(budget)
+        try:
+            with pytest.raises(Exception):
+                await app.complete("summary", [{"role": "user", "content": "hi"}])
+        finally:
+            session_budget.reset(token)
+        await app.close_client()
+
+        assert (budget.tokens, budget.reserved_tokens, budget.reserved_cost) == (0, 0, 0)
+
+    async def test_batched_topic_call_is_split_between_sessions(self, fake_openai, monkeypatch):
+        """Test a batch is charged to the sessions it answers, and one that can't cover its share falls back alone"""
+        import app
+        from micro_batcher import MicroBatcher
+        from token_budget import SessionBudget, session_budget
+
+        monkeypatch.setattr(app, "topic_batcher", MicroBatcher(app.analyze_topic_batch, window=0.02, max_size=8))
+        budgets = [
+            SessionBudget(max_tokens=10_000),
+            SessionBudget(max_tokens=10_000),
+            SessionBudget(tokens=100, max_tokens=100),
+        ]
+
+        async def analyze(message, budget):
+            session_budget.set(budget)
+            return await app.analyze_topic(message)
+
+        messages = ["How much for the Switch?", "does it have zelda", "can you do 140"]
+        results = await asyncio.gather(*(analyze(message, budget) for message, budget in zip(messages, budgets)))
+        await app.close_client()
+
+        assert len(fake_openai.requests) == 1
+        assert [result["current_topic"] for result in results] == ["gaming", "gaming", app.TOPIC_FALLBACK["current_topic"]]
+        # The fake reports 20 tokens for the call, split between the two sessions it answered
+        assert [budget.tokens for budget in budgets] == [10, 10, 100]
+        assert budgets[2].exhausted
+
+
+class TestStageTelemetry:
+    """Test complete() and the stage functions feed the stage metrics"""
+
+    async def test_session_records_latency_and_usage(self, fake_openai):
+        """Test every stage records a call with its token usage"""
+        import app
+        from fake_openai import ANALYSIS_RESULT
+
+        await _run_session("How much for the Switch?")
+        await app.close_client()
+
+        # Analysis calls are streamed, so the fake counts their words as completion tokens
+        streamed_tokens = len(json.dumps(ANALYSIS_RESULT).split(" "))
+        for stage in ("performance", "topic", "strategy", "response"):
+            stats = app.telemetry.stage(stage)
+            assert stats.calls == 1
+            assert stats.prompt_tokens == 10
+            assert stats.completion_tokens == (10 if stage == "response" else streamed_tokens)
+            assert stats.latency.sum >= 0.2
+            assert stats.cost_usd > 0
+
+    async def test_streamed_response_records_usage(self, slow_stream_openai):
+        """Test usage from the final stream chunk is recorded"""
+        import app
+        from fake_openai import RESPONSE_TEXT
+
+        tokens = []
+
+        async def on_token(token):
+            tokens.append(token)
+
+        await app.generate_response("hi", {"strategy": "soft_sell"}, on_token)
+        await app.close_client()
+
+        stats = app.telemetry.stage("response")
+        assert stats.completion_tokens == len(RESPONSE_TEXT.split(" "))
+        assert slow_stream_openai.requests[-1]["stream_options"] == {"include_usage": True}
+
+    async def test_fallbacks_and_errors_are_counted(self, fake_openai, monkeypatch):
+        """Test a failing stage counts an error and a fallback"""
+        import app
+        from resilience import Resilience
+
+        monkeypatch.setattr(app, "resilience", Resilience(max_attempts=1))
+        fake_openai.fail_next = 1
+        await app.analyze_topic("anything new?")
+        await app.close_client()
+
+        stats = app.telemetry.stage("topic")
+        assert (stats.calls, stats.errors, stats.fallbacks, stats.parse_failures) == (1, 1, 1, 0)
+        assert 'chatbot_resilience_failures_total{stage="topic"} 1' in app.telemetry.render_prometheus()
+
+    async def test_parse_failure_is_counted(self, monkeypatch):
+        """Test unparseable JSON from a stage is recorded as a parse failure"""
+        import app
+        from conversation import ConversationState
+
+        async def fake_complete(stage, messages, on_token=None, **params):
+            return "not json"
+
+        monkeypatch.setattr(app, "complete", fake_complete)
+        assert await app.analyze_performance(ConversationState()) == app.PERFORMANCE_FALLBACK
+        assert app.telemetry.stage("performance").parse_failures == 1
+
+
+class TestPersistentDebugPanel:
+    """Test the debug panel is one message edited in place"""
+
+    PERFORMANCE = {"progress_score": 40, "buyer_interest": "medium"}
+    TOPIC = {"current_topic": "switch", "relevance_to_goal": "high"}
+
+    def _panel_events(self, context):
+        return [(name, data) for name, data in context.emitter.events if data.get("name") == "🤖 Debug Panel"]
+
+    async def test_panel_sent_once_then_updated(self):
+        """Test later turns update the first panel message instead of posting new ones"""
+        import chainlit as cl
+
+        import app
+        from debug_panel import DebugPanel
+
+        context = _start_chainlit_session(_recording_emitter)
+        cl.user_session.set("debug_panel", DebugPanel(min_interval=0))
+        for _ in range(3):
+            await app.send_debug_panel(self.PERFORMANCE, self.TOPIC, {"strategy": "soft_sell"})
+
+        events = self._panel_events(context)
+        assert [name for name, _ in events] == ["send_step", "update_step", "update_step"]
+        assert len({data["id"] for _, data in events}) == 1
+        assert "**Messages:** 3" in events[-1][1]["output"]
+
+    async def test_unchanged_content_is_skipped(self):
+        """Test publishing identical content sends nothing"""
+        from debug_panel import DebugPanel
+
+        context = _start_chainlit_session(_recording_emitter)
+        panel = DebugPanel(min_interval=0)
+        assert await panel.publish("same") is True
+        assert await panel.publish("same") is False
+
+        assert len(context.emitter.events) == 1
+        assert panel.stats()["unchanged"] == 1
+
+    async def test_updates_are_throttled_to_latest(self):
+        """Test rapid updates collapse into one trailing update with the newest content"""
+        import asyncio
+
+        from debug_panel import DebugPanel
+
+        context = _start_chainlit_session(_recording_emitter)
+        panel = DebugPanel(min_interval=0.2)
+        await panel.publish("v1")
+        await panel.publish("v2")
+        await panel.publish("v3")
+        assert len(context.emitter.events) == 1
+
+        await asyncio.sleep(0.3)
+        names = [name for name, _ in context.emitter.events]
+        assert names == ["send_step", "update_step"]
+        assert context.emitter.events[-1][1]["output"] == "v3"
+        assert panel.stats()["throttled"] == 2
+
+    async def test_alert_is_folded_into_panel(self):
+        """Test a closing alert updates the panel immediately instead of sending another message"""
+        import chainlit as cl
+
+        import app
+
+        context = _start_chainlit_session(_recording_emitter)
+        await app.send_debug_panel(self.PERFORMANCE, self.TOPIC, {"strategy": "soft_sell"})
+        # Inside the default throttle interval, but alerts are urgent
+        closing = {"progress_score": 95, "buyer_interest": "high"}
+        await app.send_debug_panel(closing, self.TOPIC, {"strategy": "create_urgency"})
+
+        events = context.emitter.events
+        assert [name for name, _ in events] == ["send_step", "update_step"]
+        assert "[SYSTEM ALERT]** Sale is imminent! Progress at 95%" in events[-1][1]["output"]
+        assert cl.user_session.get("debug_panel").stats()["throttled"] == 0
+
+    async def test_alert_sent_alone_when_debug_disabled(self):
+        """Test the alert still reaches the user with the panel turned off"""
+        import app
+
+        context = _start_chainlit_session(_recording_emitter)
+        (await app.current_session()).debug_mode = False
+        await app.send_debug_panel({"progress_score": 92}, self.TOPIC, {"strategy": "create_urgency"})
+        await app.send_debug_panel({"progress_score": 50}, self.TOPIC, {"strategy": "soft_sell"})
+
+        outputs = [data["output"] for _, data in context.emitter.events]
+        assert len(outputs) == 1 and "[SYSTEM ALERT]" in outputs[0]
+
 
 class TestDebugFunctions:
     """Test the new debug panel functions"""
@@ -0,0 +1,174 @@
+"""
+Unit tests for the shared completion cache
+"""
+
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from completion_cache import CompletionCache, cache_key, format_stats, main  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+def _write_entries(path, worker):
+    """Write from a separate process, as another Chainlit worker would"""
+    cache = CompletionCache(path)
+    for i in range(50):
+        cache.put_sync("topic", cache_key(MESSAGES, model=f"m{worker}-{i}"), f"content {worker}-{i}")
+
+
+class TestCacheKey:
+    """Test the content-addressed key"""
+
+    def test_key_is_stable(self):
+        """Test identical requests hash the same"""
+        assert cache_key(MESSAGES, model="gpt-4o-mini", temperature=0.3) == cache_key(
+            [{"content": "hi", "role": "user"}], temperature=0.3, model="gpt-4o-mini"
+        )
+
+    def test_key_covers_request_fields(self):
+        """Test model, temperature, response_format and messages change the key"""
+        base = cache_key(MESSAGES, model="gpt-4o-mini", temperature=0.3, response_format={"type": "json_object"})
+        assert base != cache_key(MESSAGES, model="gpt-4o", temperature=0.3, response_format={"type": "json_object"})
+        assert base != cache_key(MESSAGES, model="gpt-4o-mini", temperature=0.5, response_format={"type": "json_object"})
+        assert base != cache_key(MESSAGES, model="gpt-4o-mini", temperature=0.3)
+        assert base != cache_key(
+            [{"role": "user", "content": "hey"}], model="gpt-4o-mini", temperature=0.3, response_format={"type": "json_object"}
+        )
+
+
+class TestStorage:
+    """Test reads, writes and counters"""
+
+    def test_round_trip(self, tmp_path):
+        """Test a stored completion is returned and counted"""
+        cache = CompletionCache(str(tmp_path / "cache.sqlite3"))
+        key = cache_key(MESSAGES, model="gpt-4o-mini")
+
+        assert cache.get_sync("topic", key) is None
+        cache.put_sync("topic", key, '{"current_topic": "price"}')
+        assert cache.get_sync("topic", key) == '{"current_topic": "price"}'
+
+        stats = cache.stats()
+        assert stats["entries"] == 1
+        assert stats["stages"]["topic"] == {"hits": 1, "misses": 1, "writes": 1, "evictions": 0}
+
+    def test_miss_does_not_take_the_write_lock(self, tmp_path):
+        """Test a lookup that misses reads through another writer's lock and is counted on the next write"""
+        path = str(tmp_path / "cache.sqlite3")
+        cache = CompletionCache(path)
+        writer = sqlite3.connect(path, isolation_level=None)
+        writer.execute("BEGIN IMMEDIATE")
+        started = time.perf_counter()
+
+        assert cache.get_sync("topic", "k") is None
+        assert time.perf_counter() - started < 1
+        assert cache.stats()["stages"]["topic"]["misses"] == 1
+
+        writer.execute("ROLLBACK")
+        cache.put_sync("topic", "k", "text")
+        assert CompletionCache(path).stats()["stages"]["topic"] == {"hits": 0, "misses": 1, "writes": 1, "evictions": 0}
+
+    async def test_async_wrappers(self, tmp_path):
+        """Test the async API runs off the event loop"""
+        cache = CompletionCache(str(tmp_path / "cache.sqlite3"))
+        await cache.put("summary", "k", "text")
+        assert await cache.get("summary", "k") == "text"
+
+    def test_shared_between_instances(self, tmp_path):
+        """Test two workers pointing at one file share entries"""
+        path = str(tmp_path / "cache.sqlite3")
+        CompletionCache(path).put_sync("strategy", "k", "shared")
+        assert CompletionCache(path).get_sync("strategy", "k") == "shared"
+
+    def test_concurrent_processes(self, tmp_path):
+        """Test several processes can write at once without losing entries"""
+        path = str(tmp_path / "cache.sqlite3")
+        CompletionCache(path)
+        workers = [multiprocessing.Process(target=_write_entries, args=(path, w)) for w in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(30)
+
+        assert all(worker.exitcode == 0 for worker in workers)
+        assert CompletionCache(path).stats()["entries"] == 200
+
+    def test_stage_policy(self, tmp_path):
+        """Test only configured stages use the cache"""
+        cache = CompletionCache(str(tmp_path / "cache.sqlite3"), stages={"topic"})
+        assert cache.enabled_for("topic")
+        assert not cache.enabled_for("response")
+
+
+class TestEviction:
+    """Test size-based eviction"""
+
+    def test_least_recently_used_evicted(self, tmp_path):
+        """Test the cache shrinks below its limit by dropping the oldest entries"""
+        cache = CompletionCache(str(tmp_path / "cache.sqlite3"), max_bytes=1000)
+        for i in range(5):
+            cache.put_sync("topic", f"k{i}", "x" * 200)
+        cache.get_sync("topic", "k0")
+        cache.put_sync("topic", "k5", "x" * 200)
+
+        stats = cache.stats()
+        assert stats["bytes"] <= 1000
+        assert stats["stages"]["topic"]["evictions"] >= 1
+        assert cache.get_sync("topic", "k0") is not None
+        assert cache.get_sync("topic", "k1") is None
+
+    def test_oversized_entry_is_skipped(self, tmp_path):
+        """Test content larger than the whole cache is not stored"""
+        cache = CompletionCache(str(tmp_path / "cache.sqlite3"), max_bytes=10)
+        cache.put_sync("topic", "k", "x" * 100)
+        assert cache.stats()["entries"] == 0
+
+    def test_replacing_entry_keeps_size_accurate(self, tmp_path):
+        """Test overwriting a key doesn't double count its size"""
+        cache = CompletionCache(str(tmp_path / "cache.sqlite3"))
+        cache.put_sync("topic", "k", "x" * 100)
+        cache.put_sync("topic", "k", "x" * 50)
+        assert cache.stats()["bytes"] == 50
+
+
+class TestStatsCommand:
+    """Test the stats/clear command line"""
+
+    def test_stats_command(self, tmp_path, capsys):
+        """Test stats prints per-stage hit rates"""
+        path = str(tmp_path / "cache.sqlite3")
+        cache = CompletionCache(path)
+        cache.put_sync("topic", "k", "text")
+        cache.get_sync("topic", "k")
+
+        main(["stats", "--path", path])
+        output = capsys.readouterr().out
+        assert "Entries: 1" in output
+        assert "topic" in output and "100%" in output
+
+    def test_clear_command(self, tmp_path):
+        """Test clear empties the cache"""
+        path = str(tmp_path / "cache.sqlite3")
+        CompletionCache(path).put_sync("topic", "k", "text")
+
+        main(["clear", "--path", path])
+        assert CompletionCache(path).stats()["entries"] == 0
+
+    def test_format_stats_without_lookups(self):
+        """Test stages with no lookups show a dash for hit rate"""
+        text = format_stats(
+            {
+                "path": "c",
+                "entries": 0,
+                "bytes": 0,
+                "max_bytes": 1,
+                "stages": {"topic": {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}},
+            }
+        )
+        assert "-" in text.splitlines()[-1]
@@ -0,0 +1,236 @@
+"""
+Unit tests for the incremental conversation state
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conversation import (  # noqa: E402
+    ConversationHistory,
+    ConversationState,
+    Turn,
+    estimate_tokens,
+    fit_lines,
+    render_message,
+)
+
+
+def _fill(state, exchanges):
+    for i in range(exchanges):
+        state.append("user", f"question {i}")
+        state.append("assistant", f"answer {i}")
+
+
+class TestConversationHistory:
+    """Test the compact turn-record history"""
+
+    def test_turn_caches_line_and_size(self):
+        """Test a turn renders its transcript line once"""
+        turn = Turn("assistant", "YO!!!")
+        assert turn.line == "AI: YO!!!"
+        assert turn.chars == len("AI: YO!!!")
+        assert turn.tokens == estimate_tokens("AI: YO!!!")
+        assert not hasattr(turn, "__dict__")
+
+    def test_running_totals(self):
+        """Test history keeps running character and token totals"""
+        history = ConversationHistory()
+        _fill(history, 3)
+
+        assert len(history) == 6
+        assert history.chars == sum(turn.chars for turn in history)
+        assert history.tokens == sum(turn.tokens for turn in history)
+
+    def test_last_exchanges_view(self):
+        """Test the last-N view covers only the newest messages"""
+        history = ConversationHistory()
+        _fill(history, 5)
+
+        view = history.last_exchanges(2)
+        assert len(view) == 4
+        assert view.transcript() == "User: question 3\nAI: answer 3\nUser: question 4\nAI: answer 4"
+        assert view.chars == sum(turn.chars for turn in list(history)[-4:])
+        assert view.tokens == sum(turn.tokens for turn in list(history)[-4:])
+
+    def test_view_longer_than_history(self):
+        """Test asking for more messages than exist returns them all"""
+        history = ConversationHistory()
+        history.append("user", "hi")
+
+        assert history.last(6).transcript() == "User: hi"
+
+    def test_view_does_not_change_with_later_turns(self):
+        """Test a view keeps the window it was created with"""
+        history = ConversationHistory()
+        _fill(history, 1)
+        view = history.last(2)
+        history.append("user", "later")
+
+        assert [turn.content for turn in view] == ["question 0", "answer 0"]
+
+    def test_round_trip_dicts(self):
+        """Test conversion to and from role/content dicts"""
+        messages = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+        history = ConversationHistory.from_messages(messages)
+
+        assert history.to_dicts() == messages
+        assert history[-1].content == "hello"
+
+    def test_state_reuses_turns(self):
+        """Test the rolling state shares turn records with the history"""
+        history = ConversationHistory()
+        state = ConversationState(window=4)
+        turn = history.append("user", "hi")
+        state.add(turn)
+
+        assert state.recent[-1] is turn
+
+
+class TestConversationWindow:
+    """Test the raw message window"""
+
+    def test_render_short_conversation_is_plain_transcript(self):
+        """Test a conversation inside the window renders like the old transcript"""
+        state = ConversationState(window=4)
+        state.append("user", "hi")
+        state.append("assistant", "YO!!!")
+
+        assert state.render() == "User: hi\nAI: YO!!!"
+
+    def test_old_messages_leave_the_window(self):
+        """Test messages beyond the window move to pending"""
+        state = ConversationState(window=4)
+        _fill(state, 3)
+
+        assert len(state.recent) == 4
+        assert [turn.content for turn in state.pending] == ["question 0", "answer 0"]
+        assert state.total_messages == 6
+
+    def test_unbounded_window_keeps_everything(self):
+        """Test window=None keeps the full transcript"""
+        state = ConversationState(window=None)
+        _fill(state, 50)
+
+        assert len(state.recent) == 100
+        assert not state.pending
+
+    def test_from_history(self):
+        """Test building a state from history dicts"""
+        history = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+        state = ConversationState.from_history(history, window=1)
+
+        assert state.render().endswith("AI: hello")
+        assert [turn.to_dict() for turn in state.pending] == [history[0]]
+
+    def test_render_message(self):
+        """Test transcript line rendering"""
+        assert render_message("user", "hi") == "User: hi"
+        assert render_message("assistant", "hey") == "AI: hey"
+
+
+class TestRollingSummary:
+    """Test folding old messages into the summary"""
+
+    async def test_fold_updates_summary(self):
+        """Test pending messages are handed to the summarizer once"""
+        calls = []
+
+        async def summarize(summary, messages):
+            calls.append((summary, list(messages)))
+            return f"{summary}+{len(messages)}"
+
+        state = ConversationState(window=2)
+        _fill(state, 2)
+
+        assert await state.fold(summarize) is True
+        assert await state.fold(summarize) is False
+        assert state.summary == "+2"
+        assert len(calls) == 1
+        assert "Summary of earlier conversation:\n+2" in state.render()
+
+    async def test_failed_fold_keeps_previous_summary(self):
+        """Test a failed summary loses neither the old summary nor the messages it was given"""
+        results = [None, "buyer asked about price, then shipping"]
+        calls = []
+
+        async def summarize(summary, messages):
+            calls.append(len(messages))
+            return results.pop(0)
+
+        state = ConversationState(window=2)
+        state.summary = "buyer asked about price"
+        _fill(state, 2)
+        pending = list(state.pending)
+
+        assert await state.fold(summarize) is False
+        assert state.summary == "buyer asked about price"
+        assert state.pending == pending
+        assert pending[0].line in state.render()
+
+        # The next fold gets the kept messages plus any that left the window since
+        state.append("user", "more")
+        assert await state.fold(summarize) is True
+        assert calls == [len(pending), len(pending) + 1]
+        assert not state.pending
+
+    async def test_prompt_size_is_bounded(self):
+        """Test the rendered state stays the same size however long the session runs"""
+
+        async def summarize(summary, messages):
+            return "x" * 5000
+
+        sizes = []
+        state = ConversationState(window=4)
+        for i in range(200):
+            state.append("user", f"question {i:03d}")
+            state.append("assistant", f"answer {i:03d}")
+            await state.fold(summarize)
+            sizes.append(len(state.render()))
+
+        assert max(sizes[10:]) == min(sizes[10:])
+        assert len(state.summary) <= 1200
+
+
+class TestTokenBudgetedRendering:
+    """Test rendering within a token budget drops the oldest turns first"""
+
+    def test_everything_fits(self):
+        history = ConversationHistory.from_messages(
+            [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "yo"}]
+        )
+        assert history.last(2).transcript(max_tokens=100) == history.last(2).transcript()
+
+    def test_oldest_turns_dropped(self):
+        history = ConversationHistory()
+        for i in range(10):
+            history.append("user", f"question {i:02d} " + "x" * 40)
+        transcript = history.last(10).transcript(max_tokens=50)
+
+        assert transcript.splitlines()[-1].startswith("User: question 09")
+        assert "question 00" not in transcript
+        assert estimate_tokens(transcript) <= 50
+
+    def test_oldest_kept_turn_is_truncated_from_the_start(self):
+        turns = [Turn("user", "a" * 1000), Turn("assistant", "short reply")]
+        lines = fit_lines(turns, 100)
+
+        assert lines[0].startswith("User: …") and lines[0].endswith("a")
+        assert lines[1] == "AI: short reply"
+        assert estimate_tokens("\n".join(lines)) <= 100
+
+    def test_sliver_is_dropped(self):
+        turns = [Turn("user", "a" * 1000), Turn("assistant", "b" * 100)]
+        assert fit_lines(turns, estimate_tokens("AI: " + "b" * 100) + 10) == ["AI: " + "b" * 100]
+
+    def test_render_keeps_summary(self):
+        state = ConversationState(window=4)
+        _fill(state, 5)
+        state.summary = "Buyer wants Zelda"
+        rendered = state.render(max_tokens=40)
+
+        assert "Buyer wants Zelda" in rendered
+        assert rendered.endswith("AI: answer 4")
+        assert "question 0" not in rendered
+        assert state.render(max_tokens=10_000) == state.render()
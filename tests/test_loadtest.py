@@ -0,0 +1,108 @@
+"""
+Tests for the offline load-test harness and the fake OpenAI endpoint
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_openai import latency_distribution  # noqa: E402
+from loadtest import format_report, main, percentile, run_load_test, slo_violations  # noqa: E402
+
+
+class TestLatencyDistribution:
+    """Test latency specs for the fake endpoint"""
+
+    def test_constant(self):
+        assert latency_distribution(0.25)() == 0.25
+        assert latency_distribution("0.5")() == 0.5
+
+    def test_distributions_stay_in_range(self):
+        """Test samples are non-negative and uniform samples stay inside their bounds"""
+        uniform = latency_distribution("uniform:0.1:0.2")
+        assert all(0.1 <= uniform() <= 0.2 for _ in range(200))
+        assert all(latency_distribution("normal:0.01:1")() >= 0 for _ in range(200))
+        assert all(latency_distribution("lognormal:0.3:0.5")() > 0 for _ in range(200))
+
+    def test_invalid_spec(self):
+        with pytest.raises(ValueError):
+            latency_distribution("pareto:1:2")
+        with pytest.raises(ValueError):
+            latency_distribution("fast")
+
+
+class TestLoadTest:
+    """Test the harness drives real sessions through the handlers"""
+
+    def test_percentile(self):
+        samples = list(range(1, 101))
+        assert percentile(samples, 0.5) == 51
+        assert percentile(samples, 0.99) == 100
+        assert percentile([], 0.5) == 0.0
+
+    async def test_run_reports_throughput_and_latency(self, monkeypatch):
+        """Test a small offline run completes every turn and reports percentiles"""
+        monkeypatch.delenv("OPENAI_BASE_URL", raising=False)
+        report = await run_load_test(users=4, turns=2, latency="uniform:0.01:0.03", token_rate=500)
+
+        assert report["completed_turns"] == 8 and report["failed_turns"] == 0
+        assert report["turns_per_sec"] > 0
+        assert report["upstream_requests"] >= 8
+        assert report["latency_ms"]["turn"]["count"] == 8
+        assert report["latency_ms"]["turn"]["p50"] >= report["latency_ms"]["response"]["p50"]
+        assert report["loop_lag_ms"]["count"] > 0
+        assert "OPENAI_BASE_URL" not in os.environ
+        assert "turns/s" in format_report(report)
+
+    async def test_caches_are_off_for_the_run(self, monkeypatch):
+        """Test the run never consults the app's topic cache, which is put back afterwards"""
+        import app
+        from topic_cache import TopicCache
+
+        cache = TopicCache()
+        monkeypatch.setattr(app, "topic_cache", cache)
+        report = await run_load_test(users=4, turns=2, latency=0.005)
+
+        assert report["completed_turns"] == 8
+        assert cache.stats()["misses"] == 0 and len(cache) == 0
+        assert app.topic_cache is cache
+
+    def test_failed_turns_and_missed_slos_fail_the_run(self, monkeypatch):
+        report = {"turns": 6, "failed_turns": 0, "latency_ms": {"turn": {"p95": 900.0}}, "loop_lag_ms": {"p95": 4.0}}
+        assert slo_violations(report) == []
+        assert slo_violations(report, max_turn_p95_ms=1000, max_loop_lag_p95_ms=5) == []
+        assert slo_violations(report, max_turn_p95_ms=500) == ["turn p95 900ms is over 500ms"]
+        assert slo_violations({**report, "failed_turns": 2}) == ["2 of 6 turns failed"]
+
+        async def failing_run(*args):
+            return {**report, "users": 3, "completed_turns": 4, "failed_turns": 2, "elapsed_s": 1.0}
+
+        monkeypatch.setattr("loadtest.run_load_test", failing_run)
+        assert main(["--json"]) == 1
+
+    async def test_injected_errors_are_absorbed(self, monkeypatch):
+        """Test turns still complete when the endpoint fails some requests"""
+        import app
+        from resilience import Resilience
+
+        monkeypatch.setattr(app, "resilience", Resilience(base_delay=0.001, failure_threshold=1000))
+        report = await run_load_test(users=3, turns=2, latency=0.005, error_rate=0.5)
+
+        assert report["completed_turns"] == 6
+        assert report["upstream_errors"] > 0
+
+    async def test_topic_batching_report(self, monkeypatch):
+        """Test a batched run sends fewer topic requests and reports the added wait"""
+        import app
+
+        monkeypatch.setattr(app, "topic_cache", None)
+        report = await run_load_test(users=6, turns=1, latency=0.02, topic_batch_window=20)
+
+        assert report["completed_turns"] == 6
+        batching = report["topic_batching"]
+        assert batching["items"] == 6 and batching["mean_batch_size"] > 1
+        assert "Topic batching" in format_report(report)
+        assert app.topic_batcher is None
@@ -0,0 +1,97 @@
+"""
+Unit tests for micro-batching of concurrent requests
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from micro_batcher import MicroBatcher  # noqa: E402
+
+
+class Recorder:
+    """Batch handler that upper-cases items and remembers each batch"""
+
+    def __init__(self, delay=0.0, fail=False):
+        self.batches = []
+        self.delay = delay
+        self.fail = fail
+
+    async def __call__(self, items):
+        self.batches.append(list(items))
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("upstream down")
+        return [item.upper() for item in items]
+
+
+class TestMicroBatcher:
+    """Test windowing, batch size limits and result routing"""
+
+    async def test_concurrent_items_share_one_call(self):
+        """Test items submitted inside the window go out together and get their own results"""
+        handler = Recorder()
+        batcher = MicroBatcher(handler, window=0.02, max_size=10)
+        results = await asyncio.gather(*(batcher.submit(item) for item in ("a", "b", "c")))
+
+        assert results == ["A", "B", "C"]
+        assert handler.batches == [["a", "b", "c"]]
+        assert batcher.stats()["mean_batch_size"] == 3
+
+    async def test_full_batch_goes_out_early(self):
+        """Test reaching max_size sends the batch without waiting for the window"""
+        handler = Recorder()
+        batcher = MicroBatcher(handler, window=10, max_size=2)
+        results = await asyncio.wait_for(asyncio.gather(*(batcher.submit(item) for item in "abcd")), timeout=1)
+
+        assert results == ["A", "B", "C", "D"]
+        assert handler.batches == [["a", "b"], ["c", "d"]]
+
+    async def test_lone_item_waits_for_the_window(self):
+        handler = Recorder()
+        batcher = MicroBatcher(handler, window=0.03, max_size=10)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        assert await batcher.submit("x") == "X"
+        assert loop.time() - started >= 0.025
+        assert batcher.stats()["wait_p50"] > 0
+
+    async def test_handler_error_reaches_every_waiter(self):
+        batcher = MicroBatcher(Recorder(fail=True), window=0.01, max_size=10)
+        results = await asyncio.gather(batcher.submit("a"), batcher.submit("b"), return_exceptions=True)
+
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert batcher.failures == 1
+
+    async def test_wrong_result_count_fails_the_batch(self):
+        async def short(items):
+            return items[:1]
+
+        batcher = MicroBatcher(short, window=0.01, max_size=10)
+        with pytest.raises(ValueError):
+            await asyncio.gather(batcher.submit("a"), batcher.submit("b"))
+
+    async def test_cancelled_item_is_left_out(self):
+        """Test a caller cancelled during the window doesn't take a slot in the batch"""
+        handler = Recorder()
+        batcher = MicroBatcher(handler, window=0.02, max_size=10)
+        cancelled = asyncio.create_task(batcher.submit("gone"))
+        kept = asyncio.create_task(batcher.submit("kept"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+
+        assert await kept == "KEPT"
+        assert handler.batches == [["kept"]]
+
+    async def test_metrics(self):
+        batcher = MicroBatcher(Recorder(), window=0.01, max_size=10, name="topic")
+        await asyncio.gather(batcher.submit("a"), batcher.submit("b"))
+        text = "\n".join(batcher.prometheus_lines())
+
+        assert 'chatbot_batch_size_count{batcher="topic"} 1' in text
+        assert 'chatbot_batch_wait_seconds_count{batcher="topic"} 2' in text
+        assert "2 requests in 1 calls" in batcher.format_stats()
@@ -0,0 +1,107 @@
+"""
+Unit tests for the RPM/TPM rate limiter and its priority queue
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiter import RateLimiter, estimate_request_tokens  # noqa: E402
+
+
+async def _drain(limiter):
+    """Use up the token bucket (6000 TPM refills at 100 tokens/s)"""
+    await limiter.acquire("topic", limiter.tpm)
+
+
+class TestRateLimiter:
+    """Test bucket accounting, priorities and cancellation"""
+
+    async def test_disabled_is_free(self):
+        limiter = RateLimiter(rpm=0, tpm=0)
+        assert not limiter.enabled
+        assert await limiter.acquire("response", 10_000) == 0
+
+    async def test_tpm_limit_delays_calls(self):
+        """Test a call waits until the bucket has refilled enough tokens"""
+        limiter = RateLimiter(tpm=6000)
+        await _drain(limiter)
+        started = time.monotonic()
+        await limiter.acquire("topic", 10)
+        assert 0.05 <= time.monotonic() - started < 0.5
+
+    async def test_rpm_limit_delays_calls(self):
+        """Test the request bucket limits calls regardless of size"""
+        limiter = RateLimiter(rpm=600)
+        for _ in range(600):
+            await limiter.acquire("topic", 1)
+        started = time.monotonic()
+        await limiter.acquire("topic", 1)
+        assert 0.05 <= time.monotonic() - started < 0.5
+
+    async def test_priority_order(self):
+        """Test waiting calls are served interactive, then analysis, then background"""
+        limiter = RateLimiter(tpm=6000)
+        await _drain(limiter)
+        order = []
+
+        async def call(stage):
+            await limiter.acquire(stage, 5)
+            order.append(stage)
+
+        tasks = [asyncio.create_task(call(stage)) for stage in ("summary", "topic", "summary", "response", "strategy")]
+        await asyncio.sleep(0)
+        assert limiter.queue_depth() == {"interactive": 1, "analysis": 2, "background": 2}
+
+        await asyncio.gather(*tasks)
+        assert order == ["response", "topic", "strategy", "summary", "summary"]
+        assert limiter.stats()["classes"]["interactive"]["granted"] == 1
+
+    async def test_settle_refunds_unused_tokens(self):
+        """Test over-estimated reservations are handed back"""
+        limiter = RateLimiter(tpm=6000)
+        reserved = await limiter.acquire("topic", 6000)
+        limiter.settle(reserved, 100)
+        started = time.monotonic()
+        await limiter.acquire("topic", 5000)
+        assert time.monotonic() - started < 0.05
+
+    async def test_cancelled_waiter_does_not_block(self):
+        """Test a cancelled call leaves the queue and the next one is served"""
+        limiter = RateLimiter(tpm=6000)
+        await _drain(limiter)
+        blocked = asyncio.create_task(limiter.acquire("response", 50))
+        await asyncio.sleep(0)
+        blocked.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await blocked
+
+        await asyncio.wait_for(limiter.acquire("topic", 5), timeout=1)
+        assert limiter.queue_depth()["interactive"] == 0
+
+    async def test_oversized_request_is_clamped(self):
+        """Test a request larger than the whole TPM budget still goes through"""
+        limiter = RateLimiter(tpm=1000)
+        assert await limiter.acquire("response", 50_000) == 1000
+
+    async def test_metrics(self):
+        """Test wait times and queue depth are exported"""
+        limiter = RateLimiter(rpm=60, tpm=6000)
+        await limiter.acquire("response", 100)
+        text = "\n".join(limiter.prometheus_lines())
+        assert 'chatbot_rate_limit_queue_depth{priority="analysis"} 0' in text
+        assert 'chatbot_rate_limit_wait_seconds_count{priority="interactive"} 1' in text
+        assert 'chatbot_rate_limit_available{bucket="tokens"}' in text
+        assert "interactive: 0 queued" in limiter.format_stats()
+
+
+def test_estimate_request_tokens():
+    """Test prompt characters plus the completion allowance"""
+    messages = [{"role": "system", "content": "x" * 400}, {"role": "user", "content": "y" * 40}]
+    assert estimate_request_tokens(messages, max_tokens=300) == 100 + 4 + 10 + 4 + 300
+    assert estimate_request_tokens(messages) > estimate_request_tokens(messages, max_tokens=1)
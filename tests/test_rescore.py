@@ -0,0 +1,235 @@
+"""
+Tests for offline bulk re-scoring of archived transcripts
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rescore  # noqa: E402
+
+
+def _conversation(i, turns=2):
+    messages = []
+    for turn in range(turns):
+        messages.append({"role": "user", "content": f"buyer {i} message {turn}"})
+        messages.append({"role": "assistant", "content": f"SO grateful {i}-{turn}!!!"})
+    return {"id": f"c{i}", "messages": messages}
+
+
+@pytest.fixture
+def transcripts(tmp_path):
+    path = tmp_path / "transcripts.jsonl"
+    path.write_text("".join(json.dumps(_conversation(i)) + "\n" for i in range(6)))
+    return path
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    import app
+    from fake_openai import FakeOpenAIServer
+
+    with FakeOpenAIServer(latency=0.01) as server:
+        monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+        monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+        app._client = None
+        yield server
+        app._client = None
+
+
+class TestReadTranscripts:
+    """Test the JSONL transcript reader"""
+
+    def test_ids_default_to_line_numbers(self, tmp_path):
+        path = tmp_path / "t.jsonl"
+        path.write_text('{"id": 7, "messages": []}\n\n{"messages": [{"role": "user", "content": "hi"}]}\n')
+        assert [record_id for record_id, _ in rescore.read_transcripts(path)] == ["7", "line-3"]
+
+    def test_bad_line_names_its_location(self, tmp_path):
+        path = tmp_path / "t.jsonl"
+        path.write_text('{"id": 1, "messages": []}\nnot json\n')
+        with pytest.raises(ValueError, match="t.jsonl:2"):
+            list(rescore.read_transcripts(path))
+
+
+class TestRescore:
+    """Test scoring, checkpointing and resuming against the local fake endpoint"""
+
+    async def test_scores_every_conversation(self, fake_openai, transcripts, tmp_path):
+        rows, resumed = await rescore.rescore(transcripts, tmp_path / "ckpt.jsonl", concurrency=3)
+
+        assert resumed == 0
+        assert sorted(row["id"] for row in rows) == [f"c{i}" for i in range(6)]
+        assert all(row["progress_score"] == 50 and not row["fallback"] for row in rows)
+        assert len(fake_openai.requests) == 6
+        assert any("User: buyer 0 message 1" in request["messages"][-1]["content"] for request in fake_openai.requests)
+
+    async def test_resume_skips_checkpointed_conversations(self, fake_openai, transcripts, tmp_path):
+        """Test a second run only scores conversations missing from the checkpoint"""
+        checkpoint = tmp_path / "ckpt.jsonl"
+        lines = transcripts.read_text().splitlines(keepends=True)
+        partial = tmp_path / "partial.jsonl"
+        partial.write_text("".join(lines[:4]))
+        await rescore.rescore(partial, checkpoint)
+        # A killed run can leave half a line behind
+        with open(checkpoint, "a") as f:
+            f.write('{"id": "c4", "progr')
+
+        fake_openai.requests.clear()
+        rows, resumed = await rescore.rescore(transcripts, checkpoint)
+
+        assert resumed == 4
+        assert len(fake_openai.requests) == 2
+        assert sorted(row["id"] for row in rows) == [f"c{i}" for i in range(6)]
+
+    async def test_checkpoint_from_another_prompt_is_rejected(self, transcripts, tmp_path, monkeypatch):
+        import app
+
+        checkpoint = tmp_path / "ckpt.jsonl"
+        checkpoint.write_text(json.dumps({"id": "c0", "prompt_version": rescore.prompt_version()}) + "\n")
+        monkeypatch.setattr(app, "PERFORMANCE_EVAL_PROMPT", app.PERFORMANCE_EVAL_PROMPT + "\nBe strict.")
+        with pytest.raises(ValueError, match="different prompt"):
+            await rescore.rescore(transcripts, checkpoint)
+
+    async def test_long_conversations_are_summarized_first(self, fake_openai, tmp_path):
+        """Test messages outside the window go through the summarizer like a live session"""
+        path = tmp_path / "long.jsonl"
+        path.write_text(json.dumps(_conversation(0, turns=6)) + "\n")
+        await rescore.rescore(path, tmp_path / "ckpt.jsonl", window=4)
+
+        prompts = [request["messages"][-1]["content"] for request in fake_openai.requests]
+        # Folded after each reply once the window is full, like a live session: turns 3-6, then the evaluation
+        assert len(prompts) == 5
+        assert "buyer 0 message 0" in prompts[0] and "buyer 0 message 1" not in prompts[0]
+        assert "buyer 0 message 3" in prompts[3]
+        assert "Summary of earlier conversation" in prompts[4]
+
+    async def test_partly_defaulted_result_is_a_fallback_row(self, transcripts, tmp_path, monkeypatch):
+        """Test a result with any defaulted field is flagged, not only a complete fallback"""
+        import app
+        from analysis_results import PerformanceResult
+
+        async def analyze_performance(state):
+            return PerformanceResult.from_dict({"progress_score": 70, "buyer_interest": "high", "key_signals": []})
+
+        monkeypatch.setattr(app, "analyze_performance", analyze_performance)
+        rows, _ = await rescore.rescore(transcripts, tmp_path / "ckpt.jsonl", window=0)
+
+        assert all(row["fallback"] and row["progress_score"] == 70 for row in rows)
+
+    def test_prompt_version_covers_the_summary_settings(self, monkeypatch):
+        import app
+        import token_budget
+
+        version = rescore.prompt_version()
+        assert rescore.prompt_version(window=4) != version
+        monkeypatch.setitem(token_budget.STAGE_PROMPT_BUDGETS, "summary", 123)
+        assert rescore.prompt_version() != version
+        monkeypatch.undo()
+        monkeypatch.setattr(app, "SUMMARY_PROMPT", app.SUMMARY_PROMPT + "\nBe brief.")
+        assert rescore.prompt_version() != version
+
+    async def test_upstream_failure_is_a_fallback_row(self, fake_openai, transcripts, tmp_path, monkeypatch):
+        import app
+        from resilience import Resilience
+
+        monkeypatch.setattr(app, "resilience", Resilience(max_attempts=1))
+        fake_openai.fail_next = 100
+        rows, _ = await rescore.rescore(transcripts, tmp_path / "ckpt.jsonl")
+
+        assert all(row["fallback"] and row["progress_score"] == 0 for row in rows)
+
+
+class TestBatchApi:
+    """Test the Batch API request file and reading its results back"""
+
+    def test_batch_file_matches_live_requests(self, transcripts, tmp_path):
+        import app
+
+        batch = tmp_path / "batch.jsonl"
+        assert rescore.write_batch_file(transcripts, batch) == 6
+
+        request = json.loads(batch.read_text().splitlines()[0])
+        assert request["custom_id"] == "c0"
+        assert request["url"] == "/v1/chat/completions"
+        assert request["body"] == app.performance_request(rescore.build_state(_conversation(0)["messages"], window=0))
+
+    def test_batch_output_becomes_rows(self, transcripts, tmp_path):
+        output = tmp_path / "out.jsonl"
+        body = {"choices": [{"message": {"content": json.dumps({"progress_score": 80, "buyer_interest": "high"})}}]}
+        output.write_text(
+            json.dumps({"custom_id": "c1", "response": {"status_code": 200, "body": body}})
+            + "\n"
+            + json.dumps({"custom_id": "c2", "response": None, "error": {"message": "expired"}})
+            + "\n"
+        )
+        rows = {row["id"]: row for row in rescore.read_batch_output(transcripts, output)}
+
+        assert rows["c1"]["progress_score"] == 80 and rows["c1"]["buyer_interest"] == "high"
+        assert rows["c2"]["fallback"] and rows["c0"]["fallback"]
+
+    def test_infinite_score_is_defaulted(self, transcripts, tmp_path):
+        """Test a score that overflows a float is flagged instead of crashing the import"""
+        output = tmp_path / "out.jsonl"
+        body = {"choices": [{"message": {"content": '{"progress_score": 1e999, "buyer_interest": "high"}'}}]}
+        output.write_text(json.dumps({"custom_id": "c1", "response": {"status_code": 200, "body": body}}) + "\n")
+        rows = {row["id"]: row for row in rescore.read_batch_output(transcripts, output)}
+
+        assert rows["c1"]["progress_score"] == 0 and rows["c1"]["buyer_interest"] == "high"
+        assert rows["c1"]["fallback"]
+
+
+class TestColumnarOutput:
+    """Test writing and comparing output files"""
+
+    def _rows(self):
+        version = rescore.prompt_version()
+        complete = {"progress_score": 30, "buyer_interest": "low", "key_signals": ["hi"], "assessment": "Cool"}
+        return [
+            rescore.make_row("a", [], complete, version),
+            rescore.make_row("b", [], {"progress_score": "n/a"}, version),
+        ]
+
+    def test_npz_round_trip(self, tmp_path):
+        path = str(tmp_path / "scores.npz")
+        rescore.write_columns(self._rows(), path)
+
+        with np.load(path) as data:
+            assert list(data["id"]) == ["a", "b"]
+            assert json.loads(data["key_signals"][0]) == ["hi"]
+        scores = rescore.read_scores(path)
+        assert scores[0] == 30 and np.isnan(scores[1])
+        assert rescore.describe(scores)["count"] == 1
+
+    def test_unsupported_extension(self, tmp_path):
+        with pytest.raises(ValueError):
+            rescore.write_columns(self._rows(), str(tmp_path / "scores.csv"))
+
+    def test_parquet_round_trip(self, tmp_path):
+        pytest.importorskip("pyarrow")
+        path = str(tmp_path / "scores.parquet")
+        rescore.write_columns(self._rows(), path)
+        assert rescore.read_scores(path)[0] == 30
+
+    def test_summary_against_baseline(self):
+        rows = self._rows()
+        text = rescore.format_summary(rows, rescore.describe([10.0, 20.0]))
+        assert "baseline" in text and "+15.0" in text
+        # "b" has no valid score, so its row is flagged
+        assert "Fallbacks: 1 of 2" in text
+
+
+def test_main_end_to_end(fake_openai, transcripts, tmp_path, capsys):
+    """Test the CLI writes the output file and prints the distribution"""
+    output = str(tmp_path / "scores.npz")
+    rescore.main([str(transcripts), "-o", output, "--concurrency", "2"])
+
+    assert "Scored 6 conversations (0 from checkpoint)" in capsys.readouterr().out
+    assert len(rescore.read_scores(output)) == 6
+    rescore.main([str(transcripts), "-o", output, "--baseline", output])
+    assert "Scored 0 conversations (6 from checkpoint)" in capsys.readouterr().out
@@ -0,0 +1,212 @@
+"""
+Unit tests for stage deadlines, retries and circuit breakers
+"""
+
+import asyncio
+import os
+import sys
+
+import httpx
+import openai
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from resilience import (  # noqa: E402
+    CircuitBreaker,
+    CircuitOpenError,
+    Resilience,
+    StageTimeoutError,
+    parse_deadlines,
+)
+
+
+def _server_error():
+    request = httpx.Request("POST", "http://fake/v1/chat/completions")
+    return openai.InternalServerError("upstream unavailable", response=httpx.Response(503, request=request), body=None)
+
+
+def _bad_request():
+    request = httpx.Request("POST", "http://fake/v1/chat/completions")
+    return openai.BadRequestError("bad request", response=httpx.Response(400, request=request), body=None)
+
+
+def _flaky(failures, result="ok"):
+    """Coroutine function that raises a 503 for the first `failures` calls"""
+    calls = []
+
+    async def attempt():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise _server_error()
+        return result
+
+    attempt.calls = calls
+    return attempt
+
+
+class TestCircuitBreaker:
+    """Test breaker state transitions"""
+
+    def test_opens_after_threshold(self):
+        """Test consecutive failures open the breaker"""
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+        for _ in range(2):
+            breaker.record_failure()
+        assert breaker.allow() and breaker.state == "closed"
+        breaker.record_failure()
+        assert breaker.state == "open" and not breaker.allow()
+        assert breaker.opens == 1
+
+    def test_success_resets_failures(self):
+        """Test a success clears the consecutive failure count"""
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        assert breaker.state == "closed"
+
+    def test_half_open_allows_one_trial(self):
+        """Test after the reset timeout a single trial call goes through"""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        assert breaker.allow() and breaker.state == "half_open"
+        assert not breaker.allow()
+        breaker.record_success()
+        assert breaker.state == "closed" and breaker.allow()
+
+    def test_failed_trial_reopens(self):
+        """Test a failing trial call opens the breaker again"""
+        breaker = CircuitBreaker(failure_threshold=5, reset_timeout=0)
+        for _ in range(5):
+            breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open"
+
+
+class TestResilience:
+    """Test deadlines, retries and short-circuiting"""
+
+    async def test_retries_transient_errors(self):
+        """Test 5xx errors are retried until an attempt succeeds"""
+        resilience = Resilience(max_attempts=3, base_delay=0.001)
+        attempt = _flaky(2)
+        assert await resilience.call("topic", attempt) == "ok"
+        assert len(attempt.calls) == 3
+        assert resilience.stats()["topic"]["retries"] == 2
+        assert resilience.stats()["topic"]["state"] == "closed"
+
+    async def test_gives_up_after_max_attempts(self):
+        """Test the last error is raised once attempts run out"""
+        resilience = Resilience(max_attempts=2, base_delay=0.001)
+        attempt = _flaky(5)
+        with pytest.raises(openai.InternalServerError):
+            await resilience.call("topic", attempt)
+        assert len(attempt.calls) == 2
+        assert resilience.stats()["topic"]["failures"] == 1
+
+    async def test_client_errors_are_not_retried(self):
+        """Test a 400 fails straight away and does not count toward the breaker"""
+        resilience = Resilience(max_attempts=3, failure_threshold=1)
+        calls = []
+
+        async def attempt():
+            calls.append(1)
+            raise _bad_request()
+
+        with pytest.raises(openai.BadRequestError):
+            await resilience.call("topic", attempt)
+        assert len(calls) == 1
+        assert resilience.breaker("topic").state == "closed"
+
+    async def test_can_retry_stops_retries(self):
+        """Test retries stop once can_retry returns False (e.g. tokens already streamed)"""
+        resilience = Resilience(max_attempts=3, base_delay=0.001)
+        attempt = _flaky(1)
+        with pytest.raises(openai.InternalServerError):
+            await resilience.call("response", attempt, can_retry=lambda: False)
+        assert len(attempt.calls) == 1
+
+    async def test_deadline_covers_all_attempts(self):
+        """Test a slow stage raises StageTimeoutError at its deadline"""
+        resilience = Resilience(deadlines={"topic": 0.05})
+
+        async def attempt():
+            await asyncio.sleep(1)
+
+        with pytest.raises(StageTimeoutError):
+            await resilience.call("topic", attempt)
+        assert resilience.stats()["topic"]["timeouts"] == 1
+
+    async def test_queueing_is_outside_the_deadline(self):
+        """Test time waiting in acquire() is neither a timeout nor a breaker failure, and each attempt acquires"""
+        resilience = Resilience(deadlines={"topic": 0.05}, base_delay=0.001, failure_threshold=1)
+        acquired = []
+
+        async def acquire():
+            acquired.append(1)
+            await asyncio.sleep(0.1)
+
+        assert await resilience.call("topic", _flaky(1), acquire=acquire) == "ok"
+        assert len(acquired) == 2
+        stats = resilience.stats()["topic"]
+        assert stats["timeouts"] == 0 and stats["state"] == "closed"
+
+    async def test_open_breaker_short_circuits(self):
+        """Test calls fail fast without reaching the upstream while the breaker is open"""
+        resilience = Resilience(max_attempts=1, failure_threshold=2, reset_timeout=60)
+        attempt = _flaky(10)
+        for _ in range(2):
+            with pytest.raises(openai.InternalServerError):
+                await resilience.call("strategy", attempt)
+
+        with pytest.raises(CircuitOpenError):
+            await resilience.call("strategy", attempt)
+        assert len(attempt.calls) == 2
+        stats = resilience.stats()["strategy"]
+        assert stats["state"] == "open" and stats["short_circuits"] == 1 and stats["opens"] == 1
+        assert "strategy: open" in resilience.format_stats()
+
+    async def test_breakers_are_per_stage(self):
+        """Test one failing stage does not open another stage's breaker"""
+        resilience = Resilience(max_attempts=1, failure_threshold=1)
+        with pytest.raises(openai.InternalServerError):
+            await resilience.call("topic", _flaky(1))
+        assert await resilience.call("performance", _flaky(0)) == "ok"
+
+    async def test_cancelled_trial_is_released(self):
+        """Test cancelling a half-open trial call lets the next call try again"""
+        resilience = Resilience(max_attempts=1, failure_threshold=1, reset_timeout=0)
+        with pytest.raises(openai.InternalServerError):
+            await resilience.call("response", _flaky(1))
+
+        async def slow():
+            await asyncio.sleep(1)
+
+        task = asyncio.create_task(resilience.call("response", slow))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert await resilience.call("response", _flaky(0)) == "ok"
+
+    def test_backoff_is_bounded(self):
+        """Test full-jitter backoff stays under the exponential ceiling and max_delay"""
+        resilience = Resilience(base_delay=0.1, max_delay=0.5)
+        assert all(0 <= resilience.backoff(1) <= 0.1 for _ in range(100))
+        assert all(0 <= resilience.backoff(6) <= 0.5 for _ in range(100))
+
+
+class TestParseDeadlines:
+    """Test STAGE_DEADLINES parsing"""
+
+    def test_overrides_defaults(self):
+        deadlines = parse_deadlines("topic=2.5, response=30")
+        assert deadlines["topic"] == 2.5
+        assert deadlines["response"] == 30.0
+        assert deadlines["performance"] == 10.0
+
+    def test_rejects_malformed_entries(self):
+        with pytest.raises(ValueError):
+            parse_deadlines("topic:2")
@@ -0,0 +1,162 @@
+"""
+Unit tests for per-stage model routing
+"""
+
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import routing  # noqa: E402
+from routing import Route, Router, load_routes, parse_models  # noqa: E402
+from token_budget import STAGE_MAX_TOKENS  # noqa: E402
+
+
+def _slow_router(**kwargs):
+    routes = {"topic": Route(model="primary", fast_model="fast", latency_slo_ms=100)}
+    return Router(routes, min_samples=3, **kwargs)
+
+
+class TestRoutes:
+    """Test the per-stage route settings"""
+
+    def test_defaults_match_the_stages(self):
+        routes = load_routes("")
+        assert routes["topic"].params() == {
+            "model": "gpt-4o-mini",
+            "temperature": 0.3,
+            "max_tokens": STAGE_MAX_TOKENS["topic"],
+            "response_format": {"type": "json_object"},
+        }
+        assert "response_format" not in routes["response"].params()
+        assert not Router(routes).adaptive
+
+    def test_routes_file_overrides(self, tmp_path):
+        path = tmp_path / "routes.json"
+        path.write_text(json.dumps({"response": {"model": "gpt-4o", "max_tokens": 200}, "custom": {"temperature": 0}}))
+        routes = load_routes(str(path))
+        assert routes["response"].params() == {"model": "gpt-4o", "temperature": 0.8, "max_tokens": 200}
+        assert routes["custom"].params() == {"model": "gpt-4o-mini", "temperature": 0}
+
+    def test_routes_file_rejects_unknown_settings(self, tmp_path):
+        path = tmp_path / "routes.json"
+        path.write_text(json.dumps({"topic": {"modle": "gpt-4o"}}))
+        with pytest.raises(ValueError, match="modle"):
+            load_routes(str(path))
+
+    def test_model_shortcuts(self, monkeypatch):
+        monkeypatch.setattr(routing, "STAGE_MODELS", "response=gpt-4o")
+        monkeypatch.setattr(routing, "STAGE_ESCALATION_MODELS", "strategy=gpt-4o")
+        routes = load_routes("")
+        assert routes["response"].model == "gpt-4o"
+        assert routes["strategy"].escalation_model == "gpt-4o"
+        assert Router(routes).adaptive
+
+    def test_parse_models_rejects_bad_entries(self):
+        assert parse_models(" topic = gpt-4o-mini ,", "STAGE_MODELS") == {"topic": "gpt-4o-mini"}
+        with pytest.raises(ValueError, match="STAGE_FAST_MODELS"):
+            parse_models("topic", "STAGE_FAST_MODELS")
+
+
+class TestLatencyRouting:
+    """Test calls move to the fast model while the primary's p95 is over its SLO"""
+
+    def test_primary_until_enough_slow_samples(self):
+        router = _slow_router()
+        for _ in range(2):
+            decision, params = router.choose("topic")
+            router.record(decision, 0.5)
+        assert params["model"] == "primary"
+
+        decision, _ = router.choose("topic")
+        router.record(decision, 0.5)
+        decision, params = router.choose("topic")
+        assert (decision.reason, params["model"]) == ("latency", "fast")
+        assert decision.p95_ms == pytest.approx(500)
+
+    def test_fast_primary_stays(self):
+        router = _slow_router()
+        for _ in range(10):
+            decision, _ = router.choose("topic")
+            router.record(decision, 0.05)
+        assert router.choose("topic")[0].reason == "primary"
+
+    def test_returns_to_primary_once_slow_samples_age_out(self):
+        router = _slow_router(window=0.05)
+        for _ in range(3):
+            router.record(router.choose("topic")[0], 0.5)
+        assert router.choose("topic")[0].reason == "latency"
+        time.sleep(0.06)
+        assert router.choose("topic")[0].reason == "primary"
+
+    def test_no_fast_model_means_no_diversion(self):
+        router = Router({"topic": Route(model="primary", latency_slo_ms=1)}, min_samples=1)
+        router.record(router.choose("topic")[0], 5.0)
+        assert router.choose("topic")[1]["model"] == "primary"
+
+
+class TestEscalation:
+    def test_escalation_uses_the_stronger_model(self):
+        router = Router({"strategy": Route(model="cheap", escalation_model="strong", temperature=0.5)})
+        decision, params = router.choose("strategy", escalate=True)
+        assert decision.reason == "escalation"
+        assert params == {"model": "strong", "temperature": 0.5}
+        assert router.can_escalate("strategy") and not router.can_escalate("topic")
+
+    def test_escalate_without_a_model_stays_on_primary(self):
+        router = Router({"topic": Route(model="cheap")})
+        assert router.choose("topic", escalate=True)[1]["model"] == "cheap"
+
+
+class TestDecisionReporting:
+    """Test decisions are counted and logged with their latency"""
+
+    def test_log_has_one_line_per_call(self, tmp_path):
+        path = tmp_path / "routing.jsonl"
+        router = _slow_router(log_path=str(path))
+        for latency in (0.2, 0.3, 0.4):
+            router.record(router.choose("topic")[0], latency)
+        router.record(router.choose("topic")[0], 0.01, error=True)
+
+        entries = [json.loads(line) for line in path.read_text().splitlines()]
+        assert [entry["latency_ms"] for entry in entries] == [200.0, 300.0, 400.0, 10.0]
+        assert entries[-1]["model"] == "fast" and entries[-1]["reason"] == "latency" and entries[-1]["error"]
+        assert entries[-1]["p95_ms"] == 400.0
+
+    async def test_log_is_written_off_the_event_loop(self, tmp_path, monkeypatch):
+        """Test record() only buffers on the loop; the file is written from a worker thread"""
+        import threading
+
+        path = tmp_path / "routing.jsonl"
+        router = _slow_router(log_path=str(path))
+        writers = []
+        append_log = router._append_log
+
+        def recording_append(lines):
+            writers.append(threading.current_thread())
+            append_log(lines)
+
+        monkeypatch.setattr(router, "_append_log", recording_append)
+        for latency in (0.2, 0.3, 0.4):
+            router.record(router.choose("topic")[0], latency)
+        assert not path.exists()
+
+        await router.flush()
+        assert [json.loads(line)["latency_ms"] for line in path.read_text().splitlines()] == [200.0, 300.0, 400.0]
+        assert writers and threading.main_thread() not in writers
+
+    def test_stats_and_metrics(self):
+        router = _slow_router()
+        assert router.format_stats() == "all calls on their primary model"
+        for _ in range(3):
+            router.record(router.choose("topic")[0], 0.5)
+        router.choose("topic")
+
+        assert router.format_stats() == "topic → fast (latency) ×1"
+        lines = router.prometheus_lines()
+        assert 'chatbot_route_calls_total{stage="topic",model="primary",reason="primary"} 3' in lines
+        assert 'chatbot_route_calls_total{stage="topic",model="fast",reason="latency"} 1' in lines
@@ -0,0 +1,47 @@
+"""
+Tests for session_metrics.py - per-session debug panel counters
+"""
+
+from session_metrics import SessionMetrics
+
+
+class TestSessionMetrics:
+    """Test running counters and the recent-strategy ring buffer"""
+
+    def test_empty(self):
+        """Test a new session has no turns"""
+        metrics = SessionMetrics()
+        assert metrics.total_messages == 0
+        assert metrics.average_progress == 0.0
+        assert metrics.top_strategy() is None
+
+    def test_record_updates_totals(self):
+        """Test peak, average and per-strategy counts"""
+        metrics = SessionMetrics()
+        metrics.record(20, "soft_sell")
+        metrics.record(60, "direct_pitch")
+        metrics.record(40, "soft_sell")
+
+        assert metrics.total_messages == 3
+        assert metrics.peak_progress == 60
+        assert metrics.average_progress == 40.0
+        assert metrics.strategy_counts == {"soft_sell": 2, "direct_pitch": 1}
+        assert metrics.top_strategy() == "soft_sell"
+
+    def test_recent_strategies_are_bounded(self):
+        """Test the ring buffer keeps only the newest entries"""
+        metrics = SessionMetrics(history_size=3)
+        for i in range(10_000):
+            metrics.record(50, f"s{i % 7}")
+
+        assert len(metrics.recent_strategies) == 3
+        assert list(metrics.recent_strategies) == ["s1", "s2", "s3"]
+        assert metrics.total_messages == 10_000
+        assert sum(metrics.strategy_counts.values()) == 10_000
+
+    def test_non_numeric_progress_counts_as_zero(self):
+        """Test a malformed progress_score does not break the totals"""
+        metrics = SessionMetrics()
+        metrics.record("high", "soft_sell")
+        assert metrics.peak_progress == 0
+        assert metrics.total_messages == 1
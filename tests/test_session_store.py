@@ -0,0 +1,180 @@
+"""
+Unit tests for the session store, its backends and the compact session format
+"""
+
+import json
+import os
+import sys
+import time
+import zlib
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conversation import ConversationState  # noqa: E402
+from session_store import (  # noqa: E402
+    MemoryBackend,
+    SessionData,
+    SessionStore,
+    SQLiteBackend,
+    decode_session,
+    encode_session,
+)
+
+
+def _session(turns=6, window=4):
+    session = SessionData(state=ConversationState(window))
+    for i in range(turns):
+        role = "user" if i % 2 == 0 else "assistant"
+        session.state.add(session.history.append(role, f"message {i} ✨"))
+        if role == "assistant":
+            session.metrics.record(10 * i, "soft_sell" if i % 4 == 1 else "direct_pitch")
+    session.state.summary = "Buyer asked about price"
+    session.last_strategy = {"strategy": "soft_sell", "approach": "Mention Zelda"}
+    session.last_performance = {"progress_score": 40, "buyer_interest": "medium"}
+    return session
+
+
+class TestSessionFormat:
+    """Test encode_session/decode_session"""
+
+    def test_round_trip(self):
+        """Test history, rolling state, metrics and flags survive a save and load"""
+        session = _session(turns=7)
+        session.debug_mode = False
+        restored = decode_session(encode_session(session))
+
+        assert [t.to_dict() for t in restored.history] == [t.to_dict() for t in session.history]
+        assert restored.state.render() == session.state.render()
+        assert (restored.state.window, restored.state.total_messages) == (4, 7)
+        assert len(restored.state.pending) == 3
+        # The state shares Turn records with the history instead of storing them twice
+        assert restored.state.recent[-1] is restored.history[-1]
+
+        assert restored.metrics.total_messages == session.metrics.total_messages
+        assert restored.metrics.top_strategy() == session.metrics.top_strategy()
+        assert list(restored.metrics.recent_strategies) == list(session.metrics.recent_strategies)
+        assert restored.debug_mode is False
+        assert restored.last_strategy == session.last_strategy
+        assert restored.last_performance == session.last_performance
+
+    def test_budget_totals_round_trip(self):
+        """Test token and cost totals are saved but the limits come from the current settings"""
+        session = _session()
+        session.budget.record(1234, 0.0021)
+        session.budget.max_tokens = 5
+        restored = decode_session(encode_session(session))
+
+        assert (restored.budget.tokens, restored.budget.cost_usd) == (1234, 0.0021)
+        assert restored.budget.max_tokens == SessionData().budget.max_tokens
+        assert not restored.budget.exhausted
+
+        session.budget.refused = True
+        payload = json.loads(zlib.decompress(encode_session(session)))
+        assert decode_session(encode_session(session)).budget.exhausted
+        payload["b"] = payload["b"][:2]
+        assert not decode_session(zlib.compress(json.dumps(payload).encode())).budget.refused
+
+    def test_session_saved_without_budget(self):
+        """Test a session saved before budgets were tracked loads with empty totals"""
+        payload = json.loads(zlib.decompress(encode_session(_session())))
+        del payload["b"]
+        restored = decode_session(zlib.compress(json.dumps(payload).encode()))
+        assert restored.budget.tokens == 0
+
+    def test_format_is_compact(self):
+        """Test repeated content compresses well below the raw transcript size"""
+        session = _session(turns=200)
+        assert len(encode_session(session)) < session.history.chars / 3
+
+    def test_bad_data(self):
+        with pytest.raises(ValueError):
+            decode_session(b"not a session")
+        with pytest.raises(ValueError, match="version"):
+            decode_session(zlib.compress(json.dumps({"v": 99}).encode()))
+
+
+class TestSessionStore:
+    """Test the hot cache, eviction and reloading"""
+
+    async def test_new_session_then_hot_hits(self):
+        store = SessionStore(MemoryBackend())
+        session = await store.get("s1")
+        assert len(session.history) == 0
+
+        session.history.append("user", "hi")
+        await store.save("s1", session)
+        assert await store.get("s1") is session
+        assert store.stats()["misses"] == 1 and store.stats()["hits"] == 1
+
+    async def test_idle_session_is_evicted_and_reloaded(self):
+        """Test a session past the TTL leaves the hot cache and comes back from the backend"""
+        store = SessionStore(MemoryBackend(), ttl=0.05)
+        await store.save("idle", _session())
+        await store.save("busy", _session(turns=2))
+        time.sleep(0.06)
+        store.evict()
+
+        assert store.stats()["hot_sessions"] == 1
+        reloaded = await store.get("idle")
+        assert len(reloaded.history) == 6 and reloaded.state.summary == "Buyer asked about price"
+        assert store.stats()["loads"] == 1
+        # "busy" has been idle as long by now, so it was dropped in turn
+        assert list(store._hot) == ["idle"] and store.evictions == 2
+
+    async def test_memory_cap_evicts_least_recently_used(self):
+        size = _session().approximate_size()
+        store = SessionStore(MemoryBackend(), max_bytes=int(size * 2.5))
+        for name in ("a", "b", "c"):
+            await store.save(name, _session())
+        await store.get("a")
+        await store.save("d", _session())
+
+        assert store.stats()["hot_sessions"] == 2
+        assert store.stats()["hot_bytes"] <= size * 2.5
+        assert set(store._hot) == {"a", "d"}
+
+    async def test_release_keeps_the_saved_copy(self):
+        store = SessionStore(MemoryBackend())
+        await store.save("s1", _session())
+        store.release("s1")
+        assert store.stats()["hot_sessions"] == 0
+        assert len((await store.get("s1")).history) == 6
+
+    async def test_retention_purges_old_sessions(self):
+        backend = MemoryBackend()
+        store = SessionStore(backend, ttl=0, retention=0.01)
+        await store.save("old", _session())
+        time.sleep(0.02)
+        await store.save("new", _session())
+        assert backend.count() == 1
+
+
+class TestSQLiteBackend:
+    """Test sessions shared between workers through SQLite"""
+
+    async def test_two_workers_share_sessions(self, tmp_path):
+        """Test a session saved by one worker is served by another, and stale hot copies are refreshed"""
+        path = str(tmp_path / "sessions.sqlite3")
+        worker_a, worker_b = SessionStore(SQLiteBackend(path)), SessionStore(SQLiteBackend(path))
+
+        session = await worker_a.get("s1")
+        session.history.append("user", "hello from a")
+        await worker_a.save("s1", session)
+
+        on_b = await worker_b.get("s1")
+        assert [t.content for t in on_b.history] == ["hello from a"]
+        on_b.history.append("assistant", "reply from b")
+        await worker_b.save("s1", on_b)
+
+        back_on_a = await worker_a.get("s1")
+        assert back_on_a is not session
+        assert [t.content for t in back_on_a.history] == ["hello from a", "reply from b"]
+        assert worker_a.backend.count() == 1
+
+    async def test_corrupt_row_starts_fresh(self, tmp_path):
+        backend = SQLiteBackend(str(tmp_path / "sessions.sqlite3"))
+        backend.save_sync("s1", b"garbage")
+        session = await SessionStore(backend).get("s1")
+        assert len(session.history) == 0
@@ -0,0 +1,64 @@
+"""
+Unit tests for per-session background tasks
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_tasks import SessionTasks  # noqa: E402
+
+
+class TestSessionTasks:
+    """Test tasks are tracked per session and name"""
+
+    async def test_finished_tasks_are_forgotten(self):
+        tasks = SessionTasks()
+        task = tasks.spawn("a", "performance", asyncio.sleep(0, result=42))
+        assert tasks.get("a", "performance") is task
+        assert await task == 42
+        await asyncio.sleep(0)
+        assert tasks.get("a", "performance") is None
+        assert tasks.running() == 0
+
+    async def test_same_name_supersedes(self):
+        """Test a newer task of the same name cancels the stale one"""
+        tasks = SessionTasks()
+        old = tasks.spawn("a", "performance", asyncio.sleep(10))
+        new = tasks.spawn("a", "performance", asyncio.sleep(10))
+        other = tasks.spawn("b", "performance", asyncio.sleep(10))
+        await asyncio.sleep(0)
+
+        assert old.cancelled()
+        assert tasks.get("a", "performance") is new
+        assert tasks.superseded == 1
+        assert tasks.running() == 2
+        tasks.cancel("a")
+        tasks.cancel("b")
+        await asyncio.sleep(0)
+        assert other.cancelled()
+
+    async def test_cancel_only_touches_one_session(self):
+        tasks = SessionTasks()
+        ended = [tasks.spawn("a", name, asyncio.sleep(10)) for name in ("performance", "summary")]
+        kept = tasks.spawn("b", "performance", asyncio.sleep(0.01))
+
+        assert tasks.cancel("a") == 2
+        await tasks.wait("b")
+        assert all(task.cancelled() for task in ended)
+        assert kept.done() and not kept.cancelled()
+        assert tasks.cancelled == 2
+        assert tasks.cancel("missing") == 0
+
+    async def test_failures_are_counted(self):
+        async def fail():
+            raise RuntimeError("boom")
+
+        tasks = SessionTasks()
+        tasks.spawn("a", "performance", fail())
+        await tasks.wait("a")
+        await asyncio.sleep(0)
+        assert tasks.failed == 1
+        assert "1 failed" in tasks.format_stats()
@@ -0,0 +1,26 @@
+"""
+Unit tests for the shared "stage=value,..." settings parser
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stage_settings import parse_stage_values  # noqa: E402
+
+
+class TestParseStageValues:
+    """Test parsing, conversion and error messages"""
+
+    def test_parses_and_converts(self):
+        assert parse_stage_values(" topic = 2.5 ,, response=30", "STAGE_DEADLINES", float) == {"topic": 2.5, "response": 30.0}
+        assert parse_stage_values("topic=gpt-4o", "STAGE_MODELS") == {"topic": "gpt-4o"}
+        assert parse_stage_values("", "STAGE_MODELS") == {}
+
+    @pytest.mark.parametrize("value", ["topic", "topic=", "=5", "topic=lots"])
+    def test_rejects_bad_entries(self, value):
+        with pytest.raises(ValueError, match=f"STAGE_MAX_TOKENS entries must be stage=tokens, not '{value}'"):
+            parse_stage_values(value, "STAGE_MAX_TOKENS", int, "tokens")
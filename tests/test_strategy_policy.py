@@ -0,0 +1,115 @@
+"""
+Unit tests for the local strategy policy
+"""
+
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from strategy_policy import StrategyPolicy, load_rules  # noqa: E402
+
+
+def _decide(policy, progress_score, buyer_interest, relevance):
+    return policy.decide(
+        {"progress_score": progress_score, "buyer_interest": buyer_interest},
+        {"relevance_to_goal": relevance},
+    )
+
+
+class TestDecisionTable:
+    """Test the default decision table"""
+
+    def test_near_sale_creates_urgency(self):
+        """Test a high-interest buyer near the sale gets create_urgency"""
+        policy = StrategyPolicy(mode="hybrid")
+        assert _decide(policy, 85, "high", "high")["strategy"] == "create_urgency"
+
+    def test_high_interest_direct_pitch(self):
+        """Test high interest on topic gets direct_pitch"""
+        policy = StrategyPolicy(mode="hybrid")
+        decision = _decide(policy, 40, "High", "high")
+        assert decision["strategy"] == "direct_pitch"
+        assert decision["source"] == "local"
+        assert decision["reasoning"].startswith("Local policy:")
+
+    def test_medium_interest_soft_sell(self):
+        """Test medium interest on a related topic gets soft_sell"""
+        policy = StrategyPolicy(mode="hybrid")
+        assert _decide(policy, 30, "medium", "medium")["strategy"] == "soft_sell"
+
+    def test_off_topic_build_rapport(self):
+        """Test an early off-topic chat gets build_rapport"""
+        policy = StrategyPolicy(mode="hybrid")
+        assert _decide(policy, 10, "low", "low")["strategy"] == "build_rapport"
+
+    def test_decision_is_fast(self):
+        """Test a local decision takes microseconds"""
+        policy = StrategyPolicy(mode="hybrid")
+        started = time.perf_counter()
+        for _ in range(10000):
+            _decide(policy, 30, "medium", "high")
+        assert (time.perf_counter() - started) / 10000 < 0.0001
+
+
+class TestFallback:
+    """Test when the policy defers to the LLM"""
+
+    def test_ambiguous_case_falls_back(self):
+        """Test a low-confidence rule defers to the LLM in hybrid mode"""
+        policy = StrategyPolicy(mode="hybrid", threshold=0.7)
+        assert _decide(policy, 60, "low", "high") is None
+        assert policy.counts == {"local": 0, "llm_fallback": 1, "llm": 0}
+
+    def test_local_mode_accepts_low_confidence(self):
+        """Test local mode uses any matching rule"""
+        policy = StrategyPolicy(mode="local")
+        assert _decide(policy, 60, "low", "high")["confidence"] == 0.6
+
+    def test_no_matching_rule_falls_back(self):
+        """Test unknown interest with a related topic has no rule"""
+        policy = StrategyPolicy(mode="local")
+        assert _decide(policy, 50, "unknown", "high") is None
+        assert policy.counts["llm_fallback"] == 1
+
+    def test_non_numeric_score_falls_back(self):
+        """Test malformed analysis output defers to the LLM"""
+        policy = StrategyPolicy(mode="hybrid")
+        assert _decide(policy, "high", "high", "high") is None
+
+    def test_llm_mode_never_decides(self):
+        """Test llm mode always defers and counts the LLM path"""
+        policy = StrategyPolicy(mode="llm")
+        assert _decide(policy, 85, "high", "high") is None
+        assert policy.counts["llm"] == 1
+        assert policy.format_counts() == "Local: 0 | LLM fallback: 0 | LLM: 1"
+
+    def test_invalid_mode(self):
+        """Test an unknown mode is rejected"""
+        with pytest.raises(ValueError, match="STRATEGY_POLICY"):
+            StrategyPolicy(mode="magic")
+
+
+class TestRulesFile:
+    """Test loading a custom decision table"""
+
+    def test_load_rules(self, tmp_path):
+        """Test a rules file replaces the default table"""
+        path = tmp_path / "rules.json"
+        path.write_text(json.dumps([{"strategy": "handle_objection", "confidence": 0.95, "buyer_interest": ["low"]}]))
+
+        policy = StrategyPolicy(rules=load_rules(str(path)), mode="hybrid")
+        assert _decide(policy, 20, "low", "low")["strategy"] == "handle_objection"
+        assert _decide(policy, 20, "high", "low") is None
+
+    def test_load_rules_rejects_unknown_strategy(self, tmp_path):
+        """Test a typo in a strategy name is caught at load time"""
+        path = tmp_path / "rules.json"
+        path.write_text(json.dumps([{"strategy": "hard_sell", "confidence": 0.9}]))
+
+        with pytest.raises(ValueError, match="hard_sell"):
+            load_rules(str(path))
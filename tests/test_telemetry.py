@@ -0,0 +1,115 @@
+"""
+Unit tests for stage telemetry and the Prometheus export
+"""
+
+import json
+import os
+import sys
+import urllib.request
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telemetry import Histogram, Telemetry, usage_cost  # noqa: E402
+
+
+def _usage(prompt, completion, cached=0):
+    return SimpleNamespace(
+        prompt_tokens=prompt, completion_tokens=completion, prompt_tokens_details=SimpleNamespace(cached_tokens=cached)
+    )
+
+
+class TestHistogram:
+    """Test bucket counting and quantile estimates"""
+
+    def test_observe_buckets(self):
+        """Test values land in the first bucket whose bound is >= the value"""
+        histogram = Histogram(bounds=(0.1, 0.5, 1.0))
+        for value in (0.05, 0.1, 0.3, 2.0):
+            histogram.observe(value)
+        assert histogram.counts == [2, 1, 0, 1]
+        assert histogram.count == 4
+        assert histogram.sum == pytest.approx(2.45)
+
+    def test_quantiles_interpolate(self):
+        """Test p50/p95 fall inside the right buckets"""
+        histogram = Histogram(bounds=(0.1, 0.2, 0.5, 1.0))
+        for _ in range(90):
+            histogram.observe(0.15)
+        for _ in range(10):
+            histogram.observe(0.8)
+        assert 0.1 < histogram.quantile(0.5) <= 0.2
+        assert 0.5 < histogram.quantile(0.95) <= 1.0
+        assert histogram.quantile(0.5) < histogram.quantile(0.95) <= histogram.quantile(0.99)
+
+    def test_empty_quantile(self):
+        assert Histogram().quantile(0.99) == 0.0
+
+
+class TestTelemetry:
+    """Test per-stage recording and export"""
+
+    def test_usage_cost(self):
+        """Test cached prompt tokens are billed at the cached rate"""
+        assert usage_cost("gpt-4o-mini", 1_000_000, 0) == pytest.approx(0.15)
+        assert usage_cost("gpt-4o-mini", 1_000_000, 0, cached_tokens=1_000_000) == pytest.approx(0.075)
+        assert usage_cost("gpt-4o-mini", 0, 1_000_000) == pytest.approx(0.60)
+        assert usage_cost("unknown-model", 1000, 1000) == 0.0
+
+    def test_record_call_accumulates_usage(self):
+        """Test tokens, cost, cache hits and errors are counted per stage"""
+        telemetry = Telemetry()
+        telemetry.record_call("topic", "gpt-4o-mini", 0.2, 0.01, usage=_usage(100, 20, cached=64))
+        telemetry.record_call("topic", "gpt-4o-mini", 0.001, cached=True)
+        telemetry.record_call("topic", "gpt-4o-mini", 5.0, error=True)
+
+        stats = telemetry.stage("topic")
+        assert (stats.calls, stats.cache_hits, stats.errors) == (3, 1, 1)
+        assert (stats.prompt_tokens, stats.completion_tokens, stats.cached_tokens) == (100, 20, 64)
+        assert stats.cost_usd == pytest.approx(usage_cost("gpt-4o-mini", 100, 20, 64))
+        assert stats.latency.count == 3
+        assert stats.cached_ratio == pytest.approx(0.64)
+        assert "64% of prompt cached" in telemetry.format_stats()
+
+    def test_record_fallback_counts_parse_failures(self):
+        """Test JSON decode errors are counted separately from other fallbacks"""
+        telemetry = Telemetry()
+        telemetry.record_fallback("strategy", json.JSONDecodeError("bad", "{", 0))
+        telemetry.record_fallback("strategy", TimeoutError())
+        stats = telemetry.stage("strategy")
+        assert stats.fallbacks == 2
+        assert stats.parse_failures == 1
+
+    def test_prometheus_format(self):
+        """Test histogram, counter and collector lines in the export"""
+        telemetry = Telemetry()
+        telemetry.record_call("performance", "gpt-4o-mini", 0.3, usage=_usage(50, 10))
+        telemetry.add_collector(lambda: ['chatbot_breaker_open{stage="performance"} 0'])
+        text = telemetry.render_prometheus()
+
+        assert "# TYPE chatbot_stage_latency_seconds histogram" in text
+        assert 'chatbot_stage_latency_seconds_bucket{stage="performance",le="0.25"} 0' in text
+        assert 'chatbot_stage_latency_seconds_bucket{stage="performance",le="0.5"} 1' in text
+        assert 'chatbot_stage_latency_seconds_bucket{stage="performance",le="+Inf"} 1' in text
+        assert 'chatbot_stage_latency_quantile_seconds{stage="performance",quantile="0.95"}' in text
+        assert 'chatbot_stage_tokens_total{stage="performance",kind="prompt"} 50' in text
+        assert 'chatbot_stage_calls_total{stage="performance"} 1' in text
+        assert 'chatbot_stage_prompt_cache_ratio{stage="performance"} 0.0000' in text
+        assert 'chatbot_breaker_open{stage="performance"} 0' in text
+        assert text.endswith("\n")
+
+    def test_metrics_endpoint(self):
+        """Test /metrics serves the export and other paths 404"""
+        telemetry = Telemetry()
+        telemetry.record_call("response", "gpt-4o-mini", 1.2)
+        host, port = telemetry.serve("127.0.0.1", 0)
+        try:
+            with urllib.request.urlopen(f"http://{host}:{port}/metrics") as response:
+                assert response.headers["Content-Type"].startswith("text/plain")
+                assert 'chatbot_stage_calls_total{stage="response"} 1' in response.read().decode()
+            with pytest.raises(urllib.error.HTTPError):
+                urllib.request.urlopen(f"http://{host}:{port}/")
+        finally:
+            telemetry.shutdown()
@@ -0,0 +1,145 @@
+"""
+Unit tests for the per-stage prompt budgets and per-session token and cost limits
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from token_budget import (  # noqa: E402
+    DEFAULT_PROMPT_BUDGETS,
+    STAGE_MAX_TOKENS,
+    STAGE_PROMPT_BUDGETS,
+    BatchBudget,
+    BudgetExceededError,
+    SessionBudget,
+    parse_budgets,
+    prompt_budget,
+    truncate_text,
+    turn_ceiling,
+)
+
+
+class TestStageBudgets:
+    """Test the per-stage budget settings and helpers"""
+
+    def test_parse_overrides(self):
+        budgets = parse_budgets("performance=900, custom=50", DEFAULT_PROMPT_BUDGETS, "STAGE_PROMPT_BUDGETS")
+        assert budgets["performance"] == 900
+        assert budgets["custom"] == 50
+        assert budgets["topic"] == DEFAULT_PROMPT_BUDGETS["topic"]
+
+    def test_parse_rejects_bad_entries(self):
+        with pytest.raises(ValueError, match="STAGE_MAX_TOKENS"):
+            parse_budgets("performance", {}, "STAGE_MAX_TOKENS")
+
+    def test_prompt_budget_subtracts_fixed_text(self):
+        assert prompt_budget("topic") == STAGE_PROMPT_BUDGETS["topic"]
+        assert prompt_budget("topic", "x" * 400) == STAGE_PROMPT_BUDGETS["topic"] - 100
+        assert prompt_budget("topic", "x" * 100_000) == 0
+
+    def test_unbudgeted_stage(self, monkeypatch):
+        monkeypatch.setitem(STAGE_PROMPT_BUDGETS, "topic", 0)
+        assert prompt_budget("topic", "anything") is None
+        assert prompt_budget("unknown") is None
+
+    def test_truncate_text(self):
+        assert truncate_text("short", 10) == "short"
+        assert truncate_text("x" * 1000, None) == "x" * 1000
+        truncated = truncate_text("x" * 1000, 10)
+        assert truncated == "x" * 39 + "…"
+
+    def test_turn_ceiling(self):
+        assert turn_ceiling(["response"]) == STAGE_PROMPT_BUDGETS["response"] + STAGE_MAX_TOKENS["response"]
+        assert turn_ceiling(["response", "unknown"]) == turn_ceiling(["response"])
+
+
+class TestSessionBudget:
+    """Test the running totals and hard limits"""
+
+    def test_unlimited_by_default(self):
+        budget = SessionBudget(max_tokens=0, max_cost=0)
+        budget.record(10**9, 1000.0)
+        budget.check("response", "gpt-4o-mini", 10**6, 10**6)
+        assert not budget.exhausted
+
+    def test_token_limit(self):
+        budget = SessionBudget(max_tokens=1000)
+        budget.check("topic", "gpt-4o-mini", 500, 200)
+        budget.record(700, 0.0)
+        assert not budget.exhausted
+        budget.record(300, 0.0)
+        assert budget.exhausted
+
+    def test_refused_call_exhausts_the_session(self):
+        """Test the session is exhausted once a call is refused, though the totals stop short of the limit"""
+        budget = SessionBudget(max_tokens=1000)
+        budget.record(700, 0.0)
+        with pytest.raises(BudgetExceededError, match="700/1000"):
+            budget.check("topic", "gpt-4o-mini", 200, 200)
+        assert budget.tokens < budget.max_tokens
+        assert budget.exhausted
+
+    def test_calls_in_flight_count_against_the_limit(self):
+        """Test concurrent calls can't all pass on totals that haven't been recorded yet"""
+        budget = SessionBudget(max_tokens=1000)
+        reservation = budget.check("summary", "gpt-4o-mini", 304, 200)
+        with pytest.raises(BudgetExceededError, match="504/1000 used or reserved"):
+            budget.check("summary", "gpt-4o-mini", 304, 200)
+
+        budget.settle(reservation, 350, 0.0001)
+        assert (budget.tokens, budget.cost_usd, budget.reserved_tokens, budget.reserved_cost) == (350, 0.0001, 0, 0)
+
+    def test_failed_call_releases_its_reservation(self):
+        budget = SessionBudget(max_tokens=1000, max_cost=1)
+        budget.settle(budget.check("topic", "gpt-4o", 500, 200))
+        assert (budget.tokens, budget.cost_usd, budget.reserved_tokens, budget.reserved_cost) == (0, 0, 0, 0)
+        budget.check("topic", "gpt-4o", 500, 200)
+
+    def test_cost_limit_uses_estimated_cost(self):
+        budget = SessionBudget(max_cost=0.001)
+        # 1000 prompt + 1000 completion tokens of gpt-4o is $0.0125
+        with pytest.raises(BudgetExceededError, match="cost"):
+            budget.check("response", "gpt-4o", 1000, 1000)
+        budget.check("response", "gpt-4o-mini", 1000, 1000)
+        budget.record(2000, 0.001)
+        assert budget.exhausted
+
+    def test_format_stats(self):
+        assert SessionBudget(1234, 0.5, max_tokens=0, max_cost=0).format_stats() == "1,234 tokens, $0.5000"
+        limited = SessionBudget(1234, 0.5, max_tokens=5000, max_cost=2).format_stats()
+        assert limited == "1,234 / 5,000 tokens, $0.5000 / $2.00"
+
+
+class TestBatchBudget:
+    """Test one call's budget split between the sessions it answers"""
+
+    def test_sessions_share_the_call(self):
+        first, second = SessionBudget(max_tokens=1000), SessionBudget(max_tokens=1000)
+        batch = BatchBudget([first, second, None])
+        reservations = batch.check("topic", "gpt-4o-mini", 300, 600)
+        assert first.reserved_tokens == second.reserved_tokens == 300
+
+        batch.settle(reservations, 600, 0.003)
+        assert first.tokens == second.tokens == 200
+        assert first.cost_usd == second.cost_usd == pytest.approx(0.001)
+        assert first.reserved_tokens == second.reserved_tokens == 0
+
+    def test_session_that_cannot_cover_its_share_is_left_out(self):
+        """Test one session over its budget is refused without failing the rest of the batch"""
+        poor, rich = SessionBudget(tokens=950, max_tokens=1000), SessionBudget(max_tokens=1000)
+        batch = BatchBudget([poor, rich])
+        reservations = batch.check("topic", "gpt-4o-mini", 100, 400)
+
+        assert batch.refused == [0]
+        assert poor.exhausted
+        batch.settle(reservations, 400, 0.0)
+        assert (poor.tokens, rich.tokens) == (950, 400)
+
+    def test_batch_refused_when_every_session_is(self):
+        batch = BatchBudget([SessionBudget(tokens=1000, max_tokens=1000)])
+        with pytest.raises(BudgetExceededError, match="every session"):
+            batch.check("topic", "gpt-4o-mini", 10, 10)
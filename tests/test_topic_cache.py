@@ -0,0 +1,126 @@
+"""
+Unit tests for the near-duplicate topic cache
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from topic_cache import TopicCache, embed, normalize  # noqa: E402
+
+RESULT = {"current_topic": "price", "relevance_to_goal": "high", "pivot_opportunity": "Name the price"}
+
+
+class TestEmbedding:
+    """Test message normalization and hashed n-gram vectors"""
+
+    def test_normalize(self):
+        """Test case, punctuation and whitespace are normalized"""
+        assert normalize("  How MUCH??  is it!!! ") == "how much is it"
+
+    def test_embed_is_unit_length(self):
+        """Test vectors are L2-normalized"""
+        assert np.isclose(np.linalg.norm(embed("how much")), 1.0)
+
+    def test_embed_is_stable(self):
+        """Test the same text always embeds to the same vector"""
+        assert np.array_equal(embed("lol"), embed("lol"))
+
+    def test_similar_messages_are_close(self):
+        """Test near-duplicates score higher than unrelated messages"""
+        base = embed("is it still available")
+        assert base @ embed("is it still availabel") > 0.8
+        assert base @ embed("what games do you play") < 0.5
+
+
+class TestLookup:
+    """Test cache hits and misses"""
+
+    def test_exact_hit_after_normalization(self):
+        """Test a normalized duplicate is a hit"""
+        cache = TopicCache()
+        cache.put("How much?", RESULT)
+
+        assert cache.get("how much") == RESULT
+        assert cache.stats()["hits"] == 1
+
+    def test_similar_hit(self):
+        """Test a near-duplicate above the threshold is a hit"""
+        cache = TopicCache(threshold=0.8)
+        cache.put("is it still available", RESULT)
+
+        assert cache.get("is it still availabel") == RESULT
+
+    def test_dissimilar_miss(self):
+        """Test an unrelated message is a miss"""
+        cache = TopicCache()
+        cache.put("how much", RESULT)
+
+        assert cache.get("tell me about your weekend") is None
+        assert cache.stats() == {
+            "hits": 0,
+            "misses": 1,
+            "hit_rate": 0.0,
+            "evictions": 0,
+            "expirations": 0,
+            "entries": 1,
+            "memory_bytes": cache.memory_bytes,
+        }
+
+    def test_result_is_a_copy(self):
+        """Test callers can't mutate cached results"""
+        cache = TopicCache()
+        cache.put("lol", RESULT)
+        cache.get("lol")["current_topic"] = "changed"
+
+        assert cache.get("lol")["current_topic"] == "price"
+
+    def test_messages_without_text_are_not_cached(self):
+        """Test emoji and punctuation-only messages don't share one empty-string entry"""
+        cache = TopicCache()
+        cache.put("👍", RESULT)
+        cache.put("?!", RESULT)
+
+        assert len(cache) == 0
+        assert cache.get("🔥🔥") is None
+        assert cache.get("k") is None
+        assert cache.stats()["misses"] == 0
+
+
+class TestEviction:
+    """Test TTL and memory-bound eviction"""
+
+    def test_ttl_expiry(self):
+        """Test expired entries are misses"""
+        cache = TopicCache(ttl=-1)
+        cache.put("lol", RESULT)
+
+        assert cache.get("lol") is None
+        assert cache.stats()["expirations"] == 1
+        assert len(cache) == 0
+
+    def test_memory_bound_evicts_least_recently_used(self):
+        """Test the oldest unused entry is evicted when memory runs out"""
+        cache = TopicCache(max_bytes=3 * 2300)
+        cache.put("first message", RESULT)
+        cache.put("second message", RESULT)
+        cache.get("first message")
+        cache.put("third message", RESULT)
+        cache.put("fourth message", RESULT)
+
+        assert cache.memory_bytes <= cache.max_bytes
+        assert cache.stats()["evictions"] >= 1
+        assert cache.get("first message") == RESULT
+        assert cache.get("second message") is None
+
+    def test_slots_are_reused(self):
+        """Test evicted slots are reused instead of growing the matrix"""
+        cache = TopicCache(max_bytes=2 * 2300)
+        for i in range(50):
+            cache.put(f"message {i}", RESULT)
+
+        assert len(cache) <= 2
+        assert cache._vectors.shape[0] <= 2
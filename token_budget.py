@@ -0,0 +1,222 @@
+"""
+Per-stage prompt budgets and per-session token and cost limits
+
+Every stage assembles its prompt within a token budget: the system prompt, template and
+fixed fields are counted first, and the conversation gets whatever is left, keeping the
+newest turns and dropping (then truncating) the oldest ones. Every stage also caps its
+completion with max_tokens, so the tokens - and with them the latency and cost - of one
+turn have a known ceiling however long the conversation or the user's message gets.
+
+A SessionBudget keeps a session's running token and cost totals from response.usage.
+complete() reserves each request's estimated size against what the session has left -
+including what its other calls in flight have reserved - and refuses it with
+BudgetExceededError, which the stages turn into their fallback; the reservation is
+settled to the real usage once the call returns. So SESSION_TOKEN_BUDGET and
+SESSION_COST_BUDGET are hard limits even for a turn's concurrent stages. Both default to
+0, no limit. A call that answers several sessions at once is split between their budgets
+by a BatchBudget.
+"""
+
+import contextvars
+import os
+
+from conversation import estimate_tokens
+from stage_settings import parse_stage_values
+from telemetry import usage_cost
+
+# Prompt tokens per stage call, system prompt included
+DEFAULT_PROMPT_BUDGETS = {
+    "performance": 1500,
+    "topic": 400,
+    "strategy": 800,
+    "analysis": 2000,
+    "summary": 1000,
+    "response": 800,
+}
+
+# Completion tokens per stage call (max_tokens); a topic batch gets this much per message
+DEFAULT_COMPLETION_LIMITS = {
+    "performance": 300,
+    "topic": 200,
+    "strategy": 300,
+    "analysis": 600,
+    "summary": 200,
+    "response": 300,
+}
+
+# Per-session hard limits; 0 disables a limit
+SESSION_TOKEN_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", "0"))
+SESSION_COST_BUDGET = float(os.getenv("SESSION_COST_BUDGET", "0"))
+
+
+def parse_budgets(value: str, defaults: dict, setting: str) -> dict:
+    """Parse "stage=tokens,..." overrides on top of defaults
+
+    Raises:
+        ValueError: If an entry is not stage=tokens
+    """
+    return {**defaults, **parse_stage_values(value, setting, int, "tokens")}
+
+
+STAGE_PROMPT_BUDGETS = parse_budgets(os.getenv("STAGE_PROMPT_BUDGETS", ""), DEFAULT_PROMPT_BUDGETS, "STAGE_PROMPT_BUDGETS")
+STAGE_MAX_TOKENS = parse_budgets(os.getenv("STAGE_MAX_TOKENS", ""), DEFAULT_COMPLETION_LIMITS, "STAGE_MAX_TOKENS")
+
+# The budget of the session whose turn is running; stage calls outside a chat turn aren't limited
+session_budget = contextvars.ContextVar("session_budget", default=None)
+
+
+def prompt_budget(stage: str, *fixed: str):
+    """Tokens left in a stage's prompt budget for its variable text
+
+    Args:
+        stage: Pipeline stage name
+        fixed: Prompt text that is sent whatever the budget (system prompt, template, short fields)
+
+    Returns:
+        Tokens for the conversation or message, or None if the stage has no budget
+    """
+    budget = STAGE_PROMPT_BUDGETS.get(stage)
+    if not budget:
+        return None
+    return max(budget - sum(estimate_tokens(text) for text in fixed), 0)
+
+
+def truncate_text(text: str, max_tokens) -> str:
+    """Keep about the first max_tokens of text, marking the cut; None leaves it whole"""
+    if max_tokens is None or estimate_tokens(text) <= max_tokens:
+        return text
+    return text[: max(max_tokens * 4 - 1, 0)] + "…"
+
+
+def turn_ceiling(stages) -> int:
+    """Most tokens one turn can send and receive through the given stages"""
+    return sum(STAGE_PROMPT_BUDGETS.get(stage, 0) + STAGE_MAX_TOKENS.get(stage, 0) for stage in stages)
+
+
+class BudgetExceededError(Exception):
+    """A call would take a session past its token or cost budget"""
+
+
+class SessionBudget:
+    """Running token and cost totals for one session, checked against hard limits
+
+    Calls are refused before they could cross a limit, so the totals usually stop short of
+    it; the first refused call is what marks the session exhausted. A call admitted by
+    check() holds its estimate in reserved_tokens/reserved_cost until settle().
+
+    Args:
+        tokens: Tokens already used
+        cost_usd: Spend already recorded
+        max_tokens: Token limit, 0 for none
+        max_cost: USD limit, 0 for none
+        refused: True once a call has been refused
+    """
+
+    __slots__ = ("tokens", "cost_usd", "max_tokens", "max_cost", "refused", "reserved_tokens", "reserved_cost")
+
+    def __init__(self, tokens=0, cost_usd=0.0, max_tokens=SESSION_TOKEN_BUDGET, max_cost=SESSION_COST_BUDGET, refused=False):
+        self.tokens = tokens
+        self.cost_usd = cost_usd
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.refused = refused
+        self.reserved_tokens = 0
+        self.reserved_cost = 0.0
+
+    @property
+    def exhausted(self) -> bool:
+        return bool(
+            self.refused
+            or (self.max_tokens and self.tokens >= self.max_tokens)
+            or (self.max_cost and self.cost_usd >= self.max_cost)
+        )
+
+    def check(self, stage: str, model: str, prompt_tokens: int, completion_tokens: int):
+        """Reserve a call's estimated worst case, or refuse it if it would cross either limit, exhausting the session
+
+        Returns:
+            The reservation, to pass to settle() once the call has finished
+
+        Raises:
+            BudgetExceededError: If the call doesn't fit in what the session has left
+        """
+        tokens = prompt_tokens + completion_tokens
+        cost = usage_cost(model, prompt_tokens, completion_tokens)
+        used_tokens = self.tokens + self.reserved_tokens
+        if self.max_tokens and used_tokens + tokens > self.max_tokens:
+            self.refused = True
+            raise BudgetExceededError(
+                f"{stage} call of ~{tokens} tokens exceeds the session budget "
+                f"({used_tokens}/{self.max_tokens} used or reserved)"
+            )
+        used_cost = self.cost_usd + self.reserved_cost
+        if self.max_cost and used_cost + cost > self.max_cost:
+            self.refused = True
+            raise BudgetExceededError(
+                f"{stage} call exceeds the session cost budget (${used_cost:.4f}/${self.max_cost:.2f} used or reserved)"
+            )
+        self.reserved_tokens += tokens
+        self.reserved_cost += cost
+        return tokens, cost
+
+    def settle(self, reservation, tokens: int = 0, cost_usd: float = 0.0):
+        """Release a reservation from check() and add what the call actually used (nothing if it failed)"""
+        reserved_tokens, reserved_cost = reservation
+        self.reserved_tokens -= reserved_tokens
+        self.reserved_cost -= reserved_cost
+        self.record(tokens, cost_usd)
+
+    def record(self, tokens: int, cost_usd: float):
+        self.tokens += tokens
+        self.cost_usd += cost_usd
+
+    def format_stats(self) -> str:
+        """One line for the debug panel"""
+        tokens = f"{self.tokens:,}" + (f" / {self.max_tokens:,}" if self.max_tokens else "")
+        cost = f"${self.cost_usd:.4f}" + (f" / ${self.max_cost:.2f}" if self.max_cost else "")
+        return f"{tokens} tokens, {cost}"
+
+
+class BatchBudget:
+    """The budgets of the sessions one batched call answers, each charged an even share
+
+    A session that can't cover its share is refused on its own - exhausting it like any
+    refused call - and listed in `refused` so its answer can be dropped, while the rest
+    of the batch still goes out. Sessions without a budget (None) are never charged.
+    Has the check()/settle() interface of SessionBudget, so complete() can use either.
+
+    Args:
+        budgets: One SessionBudget or None per item in the batch, in order
+    """
+
+    def __init__(self, budgets):
+        self.budgets = list(budgets)
+        self.refused = []
+
+    def check(self, stage: str, model: str, prompt_tokens: int, completion_tokens: int):
+        """Reserve every session's share of the call
+
+        Returns:
+            {position: reservation} for the sessions that were charged
+
+        Raises:
+            BudgetExceededError: If every session in the batch was refused
+        """
+        n = len(self.budgets)
+        reservations = {}
+        for i, budget in enumerate(self.budgets):
+            if budget is None:
+                continue
+            try:
+                reservations[i] = budget.check(stage, model, -(-prompt_tokens // n), -(-completion_tokens // n))
+            except BudgetExceededError:
+                self.refused.append(i)
+        if len(self.refused) == n:
+            raise BudgetExceededError(f"{stage} batch of {n} exceeds the budget of every session in it")
+        return reservations
+
+    def settle(self, reservations, tokens: int = 0, cost_usd: float = 0.0):
+        """Release the reservations and split the call's usage between the sessions that were answered"""
+        answered = len(self.budgets) - len(self.refused)
+        for i, reservation in reservations.items():
+            self.budgets[i].settle(reservation, round(tokens / answered), cost_usd / answered)
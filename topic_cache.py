@@ -0,0 +1,170 @@
+"""
+Near-duplicate cache for topic analysis
+
+Short user messages ("how much?", "lol", "is it still available") come up constantly and
+get the same topic analysis. Messages are normalized and embedded as hashed character
+n-gram vectors; a new message whose cosine similarity to a cached one clears the
+threshold reuses that entry's result instead of calling the LLM. Messages that normalize
+to less than an n-gram ("👍", "?!", "k") carry no topic to match on and are never cached.
+"""
+
+import json
+import os
+import re
+import time
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+TOPIC_CACHE_ENABLED = os.getenv("TOPIC_CACHE", "true").lower() in ("1", "true", "yes")
+TOPIC_CACHE_THRESHOLD = float(os.getenv("TOPIC_CACHE_THRESHOLD", "0.9"))
+TOPIC_CACHE_TTL = float(os.getenv("TOPIC_CACHE_TTL", "3600"))
+TOPIC_CACHE_MAX_BYTES = int(os.getenv("TOPIC_CACHE_MAX_BYTES", str(4 * 1024 * 1024)))
+
+VECTOR_DIM = 512
+NGRAM_SIZES = (2, 3, 4)
+# Normalized messages shorter than the smallest n-gram are neither looked up nor stored
+MIN_CACHEABLE_LENGTH = min(NGRAM_SIZES)
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(message: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return _SPACES.sub(" ", _NON_WORD.sub("", message.lower())).strip()
+
+
+def embed(text: str, dim: int = VECTOR_DIM) -> np.ndarray:
+    """Hashed character n-gram vector, L2-normalized
+
+    crc32 is used instead of hash() so vectors are identical across processes.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    padded = f" {text} "
+    for n in NGRAM_SIZES:
+        for i in range(len(padded) - n + 1):
+            vector[zlib.crc32(padded[i : i + n].encode()) % dim] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class TopicCache:
+    """LRU + TTL cache of topic analyses keyed by message similarity
+
+    Args:
+        threshold: Minimum cosine similarity for a hit
+        ttl: Seconds an entry stays valid
+        max_bytes: Memory bound for vectors plus cached results
+        dim: Embedding dimension
+    """
+
+    def __init__(self, threshold=TOPIC_CACHE_THRESHOLD, ttl=TOPIC_CACHE_TTL, max_bytes=TOPIC_CACHE_MAX_BYTES, dim=VECTOR_DIM):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.dim = dim
+        self.vector_bytes = dim * 4
+        self.capacity = max(max_bytes // self.vector_bytes, 1)
+
+        # Slot-indexed vectors so a lookup is a single matrix-vector product
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._active = np.zeros(0, dtype=bool)
+        self._free = []
+        self._entries = OrderedDict()  # slot -> (normalized, result, expires_at, size), oldest first
+        self._exact = {}  # normalized message -> slot
+
+        self.memory_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, message: str):
+        """Return the cached result for a near-duplicate message, or None"""
+        normalized = normalize(message)
+        if len(normalized) < MIN_CACHEABLE_LENGTH:
+            return None
+        slot = self._exact.get(normalized)
+        if slot is None and self._entries:
+            sims = self._vectors @ embed(normalized, self.dim)
+            sims[~self._active] = -1.0
+            best = int(np.argmax(sims))
+            if sims[best] >= self.threshold:
+                slot = best
+
+        if slot is not None:
+            _, result, expires_at, _ = self._entries[slot]
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(slot)
+                self.hits += 1
+                return dict(result)
+            self._remove(slot)
+            self.expirations += 1
+
+        self.misses += 1
+        return None
+
+    def put(self, message: str, result: dict):
+        """Cache a topic analysis for this message"""
+        normalized = normalize(message)
+        if len(normalized) < MIN_CACHEABLE_LENGTH:
+            return
+        if normalized in self._exact:
+            self._remove(self._exact[normalized])
+
+        size = self.vector_bytes + len(normalized) + len(json.dumps(result))
+        if size > self.max_bytes:
+            return
+        self._evict(size)
+
+        slot = self._allocate()
+        self._vectors[slot] = embed(normalized, self.dim)
+        self._active[slot] = True
+        self._entries[slot] = (normalized, dict(result), time.monotonic() + self.ttl, size)
+        self._exact[normalized] = slot
+        self.memory_bytes += size
+
+    def stats(self) -> dict:
+        """Hit/miss and eviction counters plus current size"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "entries": len(self._entries),
+            "memory_bytes": self.memory_bytes,
+        }
+
+    def _allocate(self) -> int:
+        if self._free:
+            return self._free.pop()
+        slot = len(self._active)
+        grow = max(min(max(slot, 16), self.capacity - slot), 1)
+        self._vectors = np.vstack([self._vectors, np.zeros((grow, self.dim), dtype=np.float32)])
+        self._active = np.concatenate([self._active, np.zeros(grow, dtype=bool)])
+        self._free = list(range(slot + grow - 1, slot, -1))
+        return slot
+
+    def _evict(self, incoming: int):
+        """Drop expired entries, then least recently used ones, until `incoming` bytes fit"""
+        now = time.monotonic()
+        for slot in [s for s, entry in self._entries.items() if entry[2] <= now]:
+            self._remove(slot)
+            self.expirations += 1
+        while self._entries and (self.memory_bytes + incoming > self.max_bytes or len(self._entries) >= self.capacity):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, slot: int):
+        normalized, _, _, size = self._entries.pop(slot)
+        self._exact.pop(normalized, None)
+        self._active[slot] = False
+        self._free.append(slot)
+        self.memory_bytes -= size